@@ -25,6 +25,60 @@ SECRET_KEY = config('SECRET_KEY')
 # مقادیر زیر را از متغیرهای محیطی می‌خوانیم
 METIS_API_KEY = config('METIS_API_KEY', default='your_default_metis_api_key_if_any')
 METIS_BOT_ID = config('METIS_BOT_ID', default='your_default_metis_bot_id_if_any')
+# آدرس پایه API متیس؛ برای توسعه/بنچمارک می‌توان آن را به سرور شبیه‌ساز محلی (manage.py run_metis_stub) اشاره داد
+METIS_API_BASE_URL = config('METIS_API_BASE_URL', default='https://api.metisai.ir/api/v1')
+# Pooled HTTP client for Metis (per worker process). Timeouts are in seconds.
+METIS_HTTP_POOL_CONNECTIONS = config('METIS_HTTP_POOL_CONNECTIONS', default=4, cast=int)  # تعداد هاست‌هایی که pool نگه می‌دارند
+METIS_HTTP_POOL_MAXSIZE = config('METIS_HTTP_POOL_MAXSIZE', default=20, cast=int)  # حداکثر اتصال باز برای هر هاست
+METIS_CONNECT_TIMEOUT = config('METIS_CONNECT_TIMEOUT', default=5.0, cast=float)
+METIS_READ_TIMEOUT = config('METIS_READ_TIMEOUT', default=60.0, cast=float)
+METIS_ASYNC_MAX_CONNECTIONS = config('METIS_ASYNC_MAX_CONNECTIONS', default=200, cast=int)  # برای کلاینت async در ASGI
+# Retries (only GET/DELETE calls) and per-endpoint-family circuit breaker for Metis
+METIS_RETRY_MAX_ATTEMPTS = config('METIS_RETRY_MAX_ATTEMPTS', default=3, cast=int)
+METIS_RETRY_BACKOFF_BASE = config('METIS_RETRY_BACKOFF_BASE', default=0.5, cast=float)
+METIS_RETRY_BACKOFF_MAX = config('METIS_RETRY_BACKOFF_MAX', default=4.0, cast=float)
+METIS_BREAKER_FAILURE_THRESHOLD = config('METIS_BREAKER_FAILURE_THRESHOLD', default=5, cast=int)
+METIS_BREAKER_RESET_TIMEOUT = config('METIS_BREAKER_RESET_TIMEOUT', default=30.0, cast=float)
+# Outbound gate for chat calls to Metis (per process): concurrent calls, waiting callers, max wait in seconds
+METIS_GATE_MAX_CONCURRENT = config('METIS_GATE_MAX_CONCURRENT', default=8, cast=int)
+METIS_GATE_MAX_QUEUE = config('METIS_GATE_MAX_QUEUE', default=16, cast=int)
+METIS_GATE_QUEUE_TIMEOUT = config('METIS_GATE_QUEUE_TIMEOUT', default=10.0, cast=float)
+# اولویت صف بر اساس نام نقش کاربر (عدد بزرگ‌تر = اولویت بالاتر)؛ نقش‌های دیگر METIS_GATE_DEFAULT_PRIORITY می‌گیرند
+METIS_GATE_ROLE_PRIORITY = {'Free': 0}
+METIS_GATE_DEFAULT_PRIORITY = config('METIS_GATE_DEFAULT_PRIORITY', default=10, cast=int)
+# Close the request's DB connection before each long Metis call (turn off when using CONN_MAX_AGE > 0)
+METIS_RELEASE_DB_CONNECTION = config('METIS_RELEASE_DB_CONNECTION', default=True, cast=bool)
+# Chat job mode: worker threads per process, max long-poll wait, DB re-check interval for jobs finishing in
+# another process, age after which a still-queued job is submitted again, once (its process may have died), and
+# age after which a still-running (or requeued but still queued) job is reported as failed (its worker died)
+CHAT_JOB_WORKERS = config('CHAT_JOB_WORKERS', default=4, cast=int)
+CHAT_JOB_MAX_WAIT = config('CHAT_JOB_MAX_WAIT', default=30.0, cast=float)
+CHAT_JOB_POLL_INTERVAL = config('CHAT_JOB_POLL_INTERVAL', default=1.0, cast=float)
+CHAT_JOB_REQUEUE_AFTER = config('CHAT_JOB_REQUEUE_AFTER', default=60, cast=int)
+CHAT_JOB_RUNNING_TIMEOUT = config('CHAT_JOB_RUNNING_TIMEOUT', default=600, cast=int)
+# A chat message without session_id continues the user's latest live session ({"new_session": true} opens a
+# new one, evicting the least recently used beyond UserRole.max_active_sessions)
+CHAT_REUSE_LATEST_SESSION = config('CHAT_REUSE_LATEST_SESSION', default=True, cast=bool)
+# Per-user request rate limit (token bucket in the default cache); the limits come from UserRole, these
+# defaults apply to users without a role
+RATE_LIMIT_ENABLED = config('RATE_LIMIT_ENABLED', default=True, cast=bool)
+RATE_LIMIT_DEFAULT_PER_MINUTE = config('RATE_LIMIT_DEFAULT_PER_MINUTE', default=30, cast=int)
+RATE_LIMIT_DEFAULT_BURST = config('RATE_LIMIT_DEFAULT_BURST', default=5, cast=int)
+# Idempotency-Key: stored responses are replayed for this long; a duplicate waits at most IDEMPOTENCY_LOCK_TIMEOUT
+# for the first request (which is also how long a crashed first request blocks its key)
+IDEMPOTENCY_TTL = config('IDEMPOTENCY_TTL', default=86400, cast=int)  # ثانیه
+IDEMPOTENCY_LOCK_TIMEOUT = config('IDEMPOTENCY_LOCK_TIMEOUT', default=120, cast=int)  # ثانیه
+# Upper bound (estimated tokens) of the user context sent when a normal chat session is created
+AI_CONTEXT_TOKEN_BUDGET = config('AI_CONTEXT_TOKEN_BUDGET', default=1500, cast=int)
+AI_CONTEXT_CACHE_TIMEOUT = config('AI_CONTEXT_CACHE_TIMEOUT', default=3600, cast=int)  # ثانیه
+# /metrics: with several worker processes point METRICS_MULTIPROC_DIR at a directory shared by all of them
+# (emptied on deploy); each process dumps its totals there at most every METRICS_FLUSH_INTERVAL seconds.
+METRICS_MULTIPROC_DIR = config('METRICS_MULTIPROC_DIR', default=None)
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=5.0, cast=float)
+# اگر مقدار داشته باشد، /metrics فقط با هدر Authorization: Bearer <token> پاسخ می‌دهد
+METRICS_AUTH_TOKEN = config('METRICS_AUTH_TOKEN', default=None)
+# بدون توکن، /metrics فقط وقتی پاسخ می‌دهد که این مقدار True باشد (مثلاً پشت شبکه داخلی)
+METRICS_PUBLIC = config('METRICS_PUBLIC', default=False, cast=bool)
 
 AUTH_USER_MODEL = 'users_ai.CustomUser' # این صحیح است
 
@@ -88,6 +142,8 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    'users_ai.middleware.MetricsMiddleware',
+    'users_ai.middleware.RateLimitMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     # 'corsheaders.middleware.CorsMiddleware', # اگر از django-cors-headers استفاده می‌کنید
@@ -127,18 +183,34 @@ WSGI_APPLICATION = 'aiagent.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+DB_ENGINE = config('DB_ENGINE', default='django.db.backends.mysql')
 DATABASES = {
     'default': {
-        'ENGINE': config('DB_ENGINE', default='django.db.backends.mysql'),
+        'ENGINE': DB_ENGINE,
         'NAME': config('DB_NAME'),
-        'USER': config('DB_USER'),
-        'PASSWORD': config('DB_PASSWORD'),
+        'USER': config('DB_USER', default=''),
+        'PASSWORD': config('DB_PASSWORD', default=''),
         'HOST': config('DB_HOST', default='localhost'),
         'PORT': config('DB_PORT', default=''), # خالی برای پورت پیش‌فرض
+        # این گزینه‌ها فقط برای MySQL معتبرند (مثلاً برای بنچمارک روی SQLite حذف می‌شوند)
         'OPTIONS': {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
             'charset': 'utf8mb4',
-        },
+        } if 'mysql' in DB_ENGINE else {},
+    }
+}
+
+# Cache
+# با چند پروسه (gunicorn workers) باید یک کش مشترک تنظیم شود، وگرنه هر پروسه کش جداگانه‌ای دارد: invalidation
+# در بقیه پروسه‌ها دیده نمی‌شود، محدودیت نرخ درخواست در تعداد پروسه‌ها ضرب می‌شود و Idempotency-Key فقط داخل
+# همان پروسه کار می‌کند (هشدارهای users_ai.W001 و users_ai.W002).
+#   Redis:         CACHE_BACKEND=django.core.cache.backends.redis.RedisCache  CACHE_LOCATION=redis://127.0.0.1:6379/1
+#   DatabaseCache: CACHE_BACKEND=django.core.cache.backends.db.DatabaseCache  CACHE_LOCATION=aiagent_cache
+#                  و سپس یک بار: python manage.py createcachetable
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='aiagent'),
     }
 }
 
@@ -181,12 +253,37 @@ STATIC_ROOT = config('DJANGO_STATIC_ROOT', default=os.path.join(BASE_DIR, 'stati
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
+# لاگ‌ها از طریق صف و یک thread جداگانه نوشته می‌شوند تا درخواست‌ها منتظر I/O کنسول نمانند
+LOG_QUEUE_SIZE = config('LOG_QUEUE_SIZE', default=10000, cast=int)
+# Per logger: records below WARNING per second (and burst) before the rest are dropped; 0 disables the limit
+LOG_RATE_LIMIT_PER_SECOND = config('LOG_RATE_LIMIT_PER_SECOND', default=20.0, cast=float)
+LOG_RATE_LIMIT_BURST = config('LOG_RATE_LIMIT_BURST', default=50, cast=int)
+# Fraction of DEBUG/INFO records kept per logger prefix
+LOG_SAMPLE_RATES = {
+    'django.db.backends': config('LOG_SAMPLE_RATE_DB', default=0.01, cast=float),
+    'users_ai.views': config('LOG_SAMPLE_RATE_VIEWS', default=1.0, cast=float),
+    'users_ai.metis_ai_service': config('LOG_SAMPLE_RATE_METIS', default=1.0, cast=float),
+}
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'filters': {
+        'rate_limit': {
+            '()': 'users_ai.logging_utils.RateLimitFilter',
+            'rate': LOG_RATE_LIMIT_PER_SECOND,
+            'burst': LOG_RATE_LIMIT_BURST,
+        },
+        'sampling': {
+            '()': 'users_ai.logging_utils.SamplingFilter',
+            'rates': LOG_SAMPLE_RATES,
+        },
+    },
     'handlers': {
         'console': {
-            'class': 'logging.StreamHandler',
+            '()': 'users_ai.logging_utils.QueueLogHandler',
+            'max_queue': LOG_QUEUE_SIZE,
+            'filters': ['sampling', 'rate_limit'],
         },
     },
     'loggers': {
@@ -2,8 +2,10 @@
 
 from django.contrib import admin
 from django.urls import path, include # 'include' را اضافه کنید
+from users_ai.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/', include('users_ai.urls')), # تمام مسیرهای users_ai را زیر پیشوند /api/ قرار می‌دهیم
 ]
\ No newline at end of file
@@ -60,7 +60,8 @@ class UserProfileAdmin(admin.ModelAdmin):
     list_filter = ('role', 'gender', 'marital_status', 'is_in_profile_setup')
     raw_id_fields = ('user',)
     readonly_fields = (
-    'created_at', 'updated_at', 'last_form_submission_time')  # last_form_submission_time معمولا توسط سیستم پر می‌شود
+    'created_at', 'updated_at', 'last_form_submission_time',  # last_form_submission_time معمولا توسط سیستم پر می‌شود
+    'messages_sent_today', 'last_message_date')  # از DailyMessageCounter خوانده می‌شوند
 
     fieldsets = (
         (None, {'fields': ('user', 'role')}),
@@ -102,6 +103,7 @@ class UserRoleAdmin(admin.ModelAdmin):
         (None, {'fields': ('name', 'description')}),
         ('محدودیت‌های جلسه و پیام',
          {'fields': ('max_active_sessions', 'session_duration_hours', 'daily_message_limit')}),
+        ('محدودیت نرخ درخواست', {'fields': ('rate_limit_per_minute', 'rate_limit_burst')}),
         ('محدودیت‌های تست و فرم',
          {'fields': ('form_submission_interval_hours', 'psych_test_message_limit', 'psych_test_duration_hours')}),
     )
@@ -124,9 +126,9 @@ class AiResponseAdmin(admin.ModelAdmin):
 
     def chat_history_display(self, obj):
         # نمایش بخشی از تاریخچه برای خوانایی بهتر در ادمین
-        history = obj.get_chat_history()
+        history = obj.get_chat_history(limit=3)  # نمایش ۳ پیام آخر
         if history:
-            return json.dumps(history[-3:], indent=2, ensure_ascii=False)  # نمایش ۳ پیام آخر
+            return json.dumps(history, indent=2, ensure_ascii=False)
         return "تاریخچه خالی است."
 
     chat_history_display.short_description = 'بخشی از تاریخچه چت'
@@ -0,0 +1,245 @@
+# users_ai/ai_context.py
+"""
+System context for normal chat sessions, assembled from the user's profile tables.
+
+Every table becomes a section. Sections are ranked by relevance (a weight per section: what the user is
+working on ranks above background facts) and added in that order until AI_CONTEXT_TOKEN_BUDGET estimated
+tokens are used. A section that no longer fits whole is cut line by line, so the session-creation payload has
+a predictable size.
+
+The rendered context is cached per user (get_user_context); signals.py invalidates it whenever one of the
+source rows changes.
+"""
+import logging
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .models import (
+    HealthRecord, PsychologicalProfile, CareerEducation, FinancialInfo, SocialRelationship,
+    PreferenceInterest, EnvironmentalContext, RealTimeData, FeedbackLearning, Goal, Habit
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = 1500
+# a cut line keeps at least this many tokens, otherwise it is left out
+MIN_CLIPPED_LINE_TOKENS = 16
+MAX_LIST_ITEMS = 10  # goals / habits
+MAX_FEEDBACK_ITEMS = 5
+
+PROFILE_INCOMPLETE_HINT = (
+    "اطلاعات پروفایل کاربر هنوز تکمیل نشده است. می‌توانید از کاربر بخواهید با ارسال 'تکمیل پروفایل' اطلاعات خود را وارد کند."
+)
+
+
+def estimate_tokens(text):
+    """
+    Cheap local estimate of the tokens `text` costs: ~4 characters per token for ASCII, ~2 for other scripts
+    (Persian). Uses only len() calls so it is fast enough to run on every section line.
+    """
+    if not text:
+        return 0
+    non_ascii = len(text.encode('utf-8')) - len(text)  # extra bytes ~ non-ASCII characters (2-byte in Persian)
+    non_ascii = min(non_ascii, len(text))
+    return math.ceil((len(text) - non_ascii) / 4 + non_ascii / 2)
+
+
+def _clip_to_tokens(text, max_tokens):
+    """Longest prefix of text (plus an ellipsis) that stays within max_tokens."""
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) + 1 <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low].rstrip() + '…' if low else ''
+
+
+class ContextSection:
+    def __init__(self, key, title, weight, lines):
+        self.key = key
+        self.title = title
+        self.weight = weight
+        self.lines = [line for line in lines if line]
+
+    def __bool__(self):
+        return bool(self.lines)
+
+
+def _model_lines(instance, exclude=('id', 'user', 'timestamp')):
+    """'label: value' for every filled-in field of a profile row, labelled with the field's verbose_name."""
+    if instance is None:
+        return []
+    lines = []
+    for field in instance._meta.concrete_fields:
+        if field.name in exclude:
+            continue
+        value = getattr(instance, field.attname)
+        if value is None or value == '':
+            continue
+        lines.append(f"{field.verbose_name}: {value}")
+    return lines
+
+
+def _one_to_one(model, user):
+    return model.objects.filter(user=user).first()
+
+
+def collect_sections(user_profile):
+    """All non-empty context sections of the user, unranked. Costs one query per profile table."""
+    user = user_profile.user
+    sections = []
+
+    if user_profile.user_information_summary:
+        sections.append(ContextSection('summary', 'خلاصه اطلاعات کاربر (برای استفاده در پاسخ‌ها)', 100,
+                                       [user_profile.user_information_summary]))
+
+    basics = [f"شماره موبایل کاربر فعلی: {user.phone_number}"]
+    if user.first_name: basics.append(f"نام: {user.first_name}")
+    if user.last_name: basics.append(f"نام خانوادگی: {user.last_name}")
+    basics += _model_lines(user_profile, exclude=(
+        'id', 'user', 'role', 'created_at', 'updated_at', 'user_information_summary', 'ai_psychological_test',
+        'last_form_submission_time', 'is_in_profile_setup'))
+    sections.append(ContextSection('basics', 'اطلاعات پایه و هویتی کاربر', 90, basics))
+
+    goals = Goal.objects.filter(user=user).order_by(
+        F('priority').asc(nulls_last=True), F('deadline').asc(nulls_last=True), 'id')[:MAX_LIST_ITEMS]
+    sections.append(ContextSection('goals', 'اهداف کاربر', 80, [
+        " | ".join(str(part) for part in (
+            goal.description, goal.goal_type,
+            f"اولویت {goal.priority}" if goal.priority is not None else None,
+            f"مهلت {goal.deadline}" if goal.deadline else None,
+            f"پیشرفت {goal.progress}%" if goal.progress is not None else None,
+        ) if part)
+        for goal in goals
+    ]))
+
+    psych_lines = _model_lines(_one_to_one(PsychologicalProfile, user))
+    if user_profile.ai_psychological_test:
+        psych_lines.append(f"نتیجه تست روانشناسی AI: {user_profile.ai_psychological_test}")
+    sections.append(ContextSection('psychological', 'پروفایل روانشناختی', 70, psych_lines))
+
+    habits = Habit.objects.filter(user=user).order_by(
+        F('success_rate').desc(nulls_last=True), 'id')[:MAX_LIST_ITEMS]
+    sections.append(ContextSection('habits', 'عادات کاربر', 65, [
+        " | ".join(str(part) for part in (
+            habit.habit_name, habit.frequency,
+            f"{habit.duration} دقیقه" if habit.duration else None,
+            f"موفقیت {habit.success_rate}%" if habit.success_rate is not None else None,
+        ) if part)
+        for habit in habits
+    ]))
+
+    sections.append(ContextSection('health', 'سوابق سلامت', 60, _model_lines(_one_to_one(HealthRecord, user))))
+    sections.append(ContextSection('real_time', 'وضعیت فعلی کاربر', 55,
+                                   _model_lines(_one_to_one(RealTimeData, user))))
+    sections.append(ContextSection('career', 'شغل و تحصیلات', 50, _model_lines(_one_to_one(CareerEducation, user))))
+    sections.append(ContextSection('social', 'روابط اجتماعی', 45,
+                                   _model_lines(_one_to_one(SocialRelationship, user))))
+    sections.append(ContextSection('preferences', 'ترجیحات و علایق', 40,
+                                   _model_lines(_one_to_one(PreferenceInterest, user))))
+    sections.append(ContextSection('financial', 'اطلاعات مالی', 35, _model_lines(_one_to_one(FinancialInfo, user))))
+    sections.append(ContextSection('environment', 'زمینه محیطی', 30,
+                                   _model_lines(_one_to_one(EnvironmentalContext, user))))
+
+    feedback = FeedbackLearning.objects.filter(user=user).order_by('-timestamp')[:MAX_FEEDBACK_ITEMS]
+    sections.append(ContextSection('feedback', 'بازخوردهای اخیر کاربر', 20, [
+        " | ".join(str(part) for part in (
+            item.feedback_text, item.interaction_type,
+            f"امتیاز {item.interaction_rating}" if item.interaction_rating is not None else None,
+        ) if part)
+        for item in feedback
+    ]))
+
+    return [section for section in sections if section]
+
+
+def render_context(sections, token_budget):
+    """Renders the sections, most relevant first, within token_budget estimated tokens."""
+    sections = sorted(sections, key=lambda section: section.weight, reverse=True)  # stable for equal weights
+    remaining = token_budget
+    blocks = []
+    for section in sections:
+        header = f"{section.title}:"
+        separator_cost = 1 if blocks else 0  # the blank line between blocks
+        header_cost = estimate_tokens(header) + separator_cost
+        if remaining <= header_cost:
+            continue  # a smaller section further down may still fit
+        lines = []
+        budget = remaining - header_cost
+        for line in section.lines:
+            line = f"- {line}"
+            cost = estimate_tokens(line) + 1  # + newline
+            if cost <= budget:
+                lines.append(line)
+                budget -= cost
+                continue
+            if budget >= MIN_CLIPPED_LINE_TOKENS:
+                clipped = _clip_to_tokens(line, budget - 1)
+                if clipped:
+                    lines.append(clipped)
+                    budget -= estimate_tokens(clipped) + 1
+            break
+        if not lines:
+            continue
+        blocks.append("\n".join([header] + lines))
+        remaining = budget
+    return "\n\n".join(blocks)
+
+
+def build_user_context(user_profile, token_budget=None):
+    """The system context for a normal chat session of this user, at most `token_budget` estimated tokens."""
+    if token_budget is None:
+        token_budget = getattr(settings, 'AI_CONTEXT_TOKEN_BUDGET', DEFAULT_TOKEN_BUDGET)
+    sections = collect_sections(user_profile)
+    if all(section.key == 'basics' for section in sections):
+        # nothing but phone/name yet: point the model at the profile setup flow
+        sections.append(ContextSection('setup_hint', 'وضعیت پروفایل', 85, [PROFILE_INCOMPLETE_HINT]))
+    context = render_context(sections, token_budget)
+    logger.debug("Built AI context for user %s: %s sections, ~%s tokens (budget %s).",
+                 user_profile.user.phone_number, len(sections), estimate_tokens(context), token_budget)
+    return context
+
+
+def _cache_keys(user_id):
+    return f"ai_context:{user_id}:generation", f"ai_context:{user_id}"
+
+
+def get_user_context(user_profile):
+    """
+    build_user_context() through the cache. An entry is only used while the user's generation counter (bumped
+    by invalidate_user_context) is unchanged, so a rebuild racing with a profile write cannot be served after it.
+    """
+    token_budget = getattr(settings, 'AI_CONTEXT_TOKEN_BUDGET', DEFAULT_TOKEN_BUDGET)
+    generation_key, context_key = _cache_keys(user_profile.user_id)
+    cached = cache.get_many([generation_key, context_key])
+    generation = cached.get(generation_key, 0)
+    entry = cached.get(context_key)
+    if entry is not None and entry[0] == generation and entry[1] == token_budget:
+        return entry[2]
+    context = build_user_context(user_profile, token_budget)
+    cache.set(context_key, (generation, token_budget, context), getattr(settings, 'AI_CONTEXT_CACHE_TIMEOUT', 3600))
+    return context
+
+
+def invalidate_user_context(user_id):
+    """Drops the cached context of a user; call it after any write that bypasses the model signals."""
+    generation_key, context_key = _cache_keys(user_id)
+    cache.add(generation_key, 0, None)
+    try:
+        cache.incr(generation_key)
+    except ValueError:  # evicted between add() and incr()
+        cache.set(generation_key, 1, None)
+    cache.delete(context_key)
+
+
+def invalidate_user_context_after_write(user_id):
+    """invalidate_user_context() now and once more after commit, for a write inside a transaction."""
+    invalidate_user_context(user_id)
+    # a rebuild that ran between the write and the commit read the old rows
+    transaction.on_commit(lambda: invalidate_user_context(user_id))
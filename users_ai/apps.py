@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class UsersAiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users_ai'
+
+    def ready(self):
+        from .checks import check_shared_cache
+        from .signals import connect_signals
+        connect_signals()
+        checks.register(check_shared_cache)
@@ -0,0 +1,74 @@
+# users_ai/chat_jobs.py
+"""
+Worker pool for chat job mode (POST /ai-agent/chat/ with "job": true).
+
+Jobs are rows in ChatJob; this module only runs them on a per-process thread pool and lets long-poll requests
+in the same process wake up as soon as a job finishes. Waiters in other processes fall back to re-reading
+the row every CHAT_JOB_POLL_INTERVAL seconds.
+"""
+import logging
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_finished_events = weakref.WeakValueDictionary()  # job id -> Event, alive while someone waits on it
+_finished_events_lock = threading.Lock()
+
+
+def get_executor():
+    """The process-wide pool, re-created after a fork like the Metis HTTP session."""
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is not None and _executor_pid == pid:
+        return _executor
+    with _executor_lock:
+        if _executor is None or _executor_pid != pid:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'CHAT_JOB_WORKERS', 4),
+                                           thread_name_prefix='chat-job')
+            _executor_pid = pid
+    return _executor
+
+
+def submit(run_job, job_id):
+    """Schedules run_job(job_id) on the pool. run_job must itself make sure a job is only executed once."""
+    get_executor().submit(_run, run_job, job_id)
+
+
+def _run(run_job, job_id):
+    try:
+        run_job(job_id)
+    except Exception:
+        logger.exception("Chat job %s crashed.", job_id)
+    finally:
+        # pool threads outlive requests, so nothing else would close their connection
+        connection.close()
+        notify_finished(job_id)
+
+
+def finished_event(job_id):
+    """
+    Event that is set when the job finishes on this process' pool. Hold a reference while waiting on it:
+    the registry only keeps events that someone is waiting for.
+    """
+    with _finished_events_lock:
+        event = _finished_events.get(str(job_id))
+        if event is None:
+            event = threading.Event()
+            _finished_events[str(job_id)] = event
+        return event
+
+
+def notify_finished(job_id):
+    with _finished_events_lock:
+        event = _finished_events.get(str(job_id))
+    if event is not None:
+        event.set()
@@ -0,0 +1,37 @@
+# users_ai/checks.py
+"""System checks for settings the app cannot work correctly without."""
+from django.conf import settings
+from django.core.checks import Warning
+
+# backends whose data lives in (or never leaves) the current process
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+SHARED_CACHE_HINT = (
+    "With more than one worker process set CACHE_BACKEND to a shared cache: "
+    "django.core.cache.backends.redis.RedisCache (CACHE_LOCATION=redis://...) or "
+    "django.core.cache.backends.db.DatabaseCache (CACHE_LOCATION=<table>, then run "
+    "`python manage.py createcachetable`)."
+)
+
+
+def check_shared_cache(app_configs, **kwargs):
+    """
+    The rate limiter's buckets and the Idempotency-Key locks and stored responses live in the default cache.
+    With a process-local backend every worker process has its own: the rate limit is multiplied by the number
+    of workers, and a retry that reaches another worker runs again (DummyCache turns both off).
+    Skipped with DEBUG, where a single runserver process is the norm.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if settings.DEBUG or backend not in PROCESS_LOCAL_CACHE_BACKENDS:
+        return []
+    warnings = []
+    if getattr(settings, 'RATE_LIMIT_ENABLED', True):
+        warnings.append(Warning(
+            f"RATE_LIMIT_ENABLED uses the default cache, which is process-local ({backend}).",
+            hint=SHARED_CACHE_HINT, id='users_ai.W001'))
+    warnings.append(Warning(
+        f"Idempotency-Key responses and locks are kept in the default cache, which is process-local ({backend}).",
+        hint=SHARED_CACHE_HINT, id='users_ai.W002'))
+    return warnings
@@ -0,0 +1,164 @@
+# users_ai/idempotency.py
+"""
+Idempotency keys for retried requests (tool callbacks, chat messages). The client sends an `Idempotency-Key`
+header (or an `idempotency_key` body field, for Metis tool arguments). The first request with a key runs, and
+its response is kept in the default cache for IDEMPOTENCY_TTL seconds under (scope, user, key); every retry
+gets that response back (with `Idempotent-Replayed: true`) without running anything.
+
+A duplicate that arrives while the first request is still running waits for its response instead of racing
+it: the first request holds a cache lock (cache.add) and the duplicates poll for the stored response.
+
+The locks and stored responses live in the default cache; it must be shared by all worker processes (Redis,
+DatabaseCache), else a retry or a concurrent duplicate that reaches another worker runs again (checks.py warns
+about a process-local backend).
+
+Only final outcomes are stored: 2xx and 4xx that a retry would get again. 5xx, 408/409/425/429 and anything
+carrying Retry-After mean "try again later", so a retry with the same key runs again. Each stored response keeps
+a fingerprint of the request (method, path, body); reusing a key for a different request is rejected with 422.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_FIELD = 'idempotency_key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_POLL_INTERVAL = 0.5
+# client errors that ask the client to come back later rather than being the request's final outcome
+RETRYABLE_CLIENT_ERRORS = frozenset({
+    status.HTTP_408_REQUEST_TIMEOUT, status.HTTP_409_CONFLICT, status.HTTP_425_TOO_EARLY,
+    status.HTTP_429_TOO_MANY_REQUESTS,
+})
+
+
+def get_idempotency_key(request, data=None):
+    """The request's idempotency key, or None. `data` is the parsed body when `request` is no DRF request."""
+    data = request.data if data is None else data
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key and hasattr(data, 'get'):
+        key = data.get(IDEMPOTENCY_FIELD)
+    return str(key) if key else None
+
+
+def request_fingerprint(request, data=None):
+    """Hash of the method, path and body of the request (the idempotency key itself left out)."""
+    data = request.data if data is None else data
+    if hasattr(data, 'lists'):  # QueryDict (form / multipart bodies)
+        data = dict(data.lists())
+    if isinstance(data, dict):
+        data = {name: value for name, value in data.items() if name != IDEMPOTENCY_FIELD}
+    body = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{request.method} {request.path}\n{body}".encode('utf-8')).hexdigest()
+
+
+def _is_final(response):
+    if response.has_header('Retry-After'):
+        return False
+    code = response.status_code
+    return 200 <= code < 300 or (400 <= code < 500 and code not in RETRYABLE_CLIENT_ERRORS)
+
+
+def _cache_keys(scope, user_id, key):
+    # hashed: keys are client-chosen and may be long or contain characters memcached rejects
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+    base = f"idempotency:{scope}:{user_id}:{digest}"
+    return base, f"{base}:lock"
+
+
+def _replay(stored, fingerprint):
+    stored_fingerprint, status_code, data = stored
+    if fingerprint is not None and stored_fingerprint is not None and stored_fingerprint != fingerprint:
+        return Response({'detail': 'این Idempotency-Key قبلاً برای درخواست دیگری استفاده شده است.'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    response = Response(data, status=status_code)
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def _still_running_response():
+    return Response({'detail': 'درخواست دیگری با همین Idempotency-Key هنوز در حال انجام است.'},
+                    status=status.HTTP_409_CONFLICT)
+
+
+def run_idempotent(scope, user_id, key, handler, fingerprint=None):
+    """
+    Returns handler()'s Response, running handler at most once per (scope, user_id, key) while its final
+    response is stored. `fingerprint` (request_fingerprint) ties the key to one request. Without a key it
+    simply calls handler.
+    """
+    if not key:
+        return handler()
+    ttl = getattr(settings, 'IDEMPOTENCY_TTL', 86400)
+    lock_timeout = getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 120)
+    result_key, lock_key = _cache_keys(scope, user_id, key)
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + lock_timeout
+    poll_interval = 0.05
+    while True:
+        stored = cache.get(result_key)
+        if stored is not None:
+            logger.info("Replaying stored %s response for user %s (idempotency key).", scope, user_id)
+            return _replay(stored, fingerprint)
+        if cache.add(lock_key, token, lock_timeout):
+            break
+        if time.monotonic() >= deadline:
+            return _still_running_response()
+        time.sleep(poll_interval)
+        poll_interval = min(poll_interval * 2, MAX_POLL_INTERVAL)
+
+    try:
+        stored = cache.get(result_key)  # the previous holder may have stored it between our get() and add()
+        if stored is not None:
+            return _replay(stored, fingerprint)
+        response = handler()
+        if _is_final(response):
+            cache.set(result_key, (fingerprint, response.status_code, response.data), ttl)
+        return response
+    finally:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+async def arun_idempotent(scope, user_id, key, handler, fingerprint=None):
+    """run_idempotent for async views: `handler` is a coroutine function, the cache is used through its async API."""
+    if not key:
+        return await handler()
+    ttl = getattr(settings, 'IDEMPOTENCY_TTL', 86400)
+    lock_timeout = getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 120)
+    result_key, lock_key = _cache_keys(scope, user_id, key)
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + lock_timeout
+    poll_interval = 0.05
+    while True:
+        stored = await cache.aget(result_key)
+        if stored is not None:
+            logger.info("Replaying stored %s response for user %s (idempotency key).", scope, user_id)
+            return _replay(stored, fingerprint)
+        if await cache.aadd(lock_key, token, lock_timeout):
+            break
+        if time.monotonic() >= deadline:
+            return _still_running_response()
+        await asyncio.sleep(poll_interval)
+        poll_interval = min(poll_interval * 2, MAX_POLL_INTERVAL)
+
+    try:
+        stored = await cache.aget(result_key)
+        if stored is not None:
+            return _replay(stored, fingerprint)
+        response = await handler()
+        if _is_final(response):
+            await cache.aset(result_key, (fingerprint, response.status_code, response.data), ttl)
+        return response
+    finally:
+        if await cache.aget(lock_key) == token:
+            await cache.adelete(lock_key)
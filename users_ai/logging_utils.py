@@ -0,0 +1,130 @@
+# users_ai/logging_utils.py
+"""
+Logging plumbing used by settings.LOGGING.
+
+QueueLogHandler hands records to a background thread that does the formatting and the stream I/O, so a request
+thread only pays for a queue put. RateLimitFilter and SamplingFilter thin out chatty loggers before that.
+"""
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+
+class QueueLogHandler(QueueHandler):
+    """
+    Non-blocking handler: records are put on a bounded in-memory queue and written to `stream` by a
+    QueueListener thread. When the queue is full the record is dropped (and counted) instead of blocking.
+    """
+
+    def __init__(self, stream=None, max_queue=10000):
+        super().__init__(queue.Queue(maxsize=max_queue))
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.dropped = 0
+        self._listener = None
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        # formatting happens on the listener thread
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def _ensure_listener(self):
+        # started lazily so that forked workers (gunicorn --preload) each get their own thread
+        if self._listener_pid == os.getpid():
+            return
+        with self._listener_lock:
+            if self._listener_pid != os.getpid():
+                self.queue = queue.Queue(maxsize=self.queue.maxsize)
+                self._listener = QueueListener(self.queue, self.target, respect_handler_level=False)
+                self._listener.start()
+                self._listener_pid = os.getpid()
+
+    def prepare(self, record):
+        # Merge msg % args here (args may be mutated by the caller afterwards) but leave the Formatter work
+        # (timestamps, tracebacks' layout, stream I/O) to the listener thread.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def emit(self, record):
+        self._ensure_listener()
+        super().emit(record)
+
+    def close(self):
+        # called by logging.shutdown() at exit: drains the queue before the stream is closed
+        if self._listener is not None and self._listener_pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+            self._listener_pid = None
+        self.target.close()
+        super().close()
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per logger name: at most `rate` records per second (bursts up to `burst`) below `max_level`.
+    Records at `max_level` and above always pass. The next record that does pass notes how many were dropped.
+    """
+
+    def __init__(self, rate=20.0, burst=50, max_level='WARNING'):
+        super().__init__()
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_level = logging.getLevelName(max_level) if isinstance(max_level, str) else max_level
+        self._buckets = {}  # logger name -> [tokens, last refill, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= self.max_level or self.rate <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(record.name)
+            if bucket is None:
+                bucket = self._buckets[record.name] = [self.burst, now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.msg = f"{record.msg} [{suppressed} earlier messages from this logger were rate-limited]"
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of the records below `max_level` for the configured loggers (and their children).
+    `rates` maps a logger name prefix to the kept fraction, e.g. {'users_ai.views': 0.1}.
+    """
+
+    def __init__(self, rates=None, max_level='WARNING'):
+        super().__init__()
+        # longest prefix first so 'users_ai.views' wins over 'users_ai'
+        self.rates = sorted((rates or {}).items(), key=lambda item: len(item[0]), reverse=True)
+        self.max_level = logging.getLevelName(max_level) if isinstance(max_level, str) else max_level
+
+    def filter(self, record):
+        if record.levelno >= self.max_level:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + '.'):
+                return rate >= 1 or random.random() < rate
+        return True
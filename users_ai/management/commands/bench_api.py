@@ -0,0 +1,247 @@
+# users_ai/management/commands/bench_api.py
+import json
+import logging
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, \
+    teardown_test_environment
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users_ai.metis_stub import MetisStubConfig, MetisStubServer
+
+TOOL_UPDATE_CALLS = (
+    ('/api/tools/profile/update/', {'age': 31, 'location': 'تهران'}),
+    ('/api/tools/health/update/', {'sleep_hours': 7.5, 'physical_activity_level': 'متوسط'}),
+    ('/api/tools/psych/update/', {'personality_type': 'INTJ'}),
+    ('/api/tools/career/update/', {'job_title': 'برنامه‌نویس', 'industry': 'فناوری'}),
+    ('/api/tools/finance/update/', {'risk_tolerance': 'متوسط'}),
+    ('/api/tools/social/update/', {'relationship_status': 'مجرد'}),
+    ('/api/tools/preferences/update/', {'hobbies': 'کتاب، کوهنوردی'}),
+    ('/api/tools/environment/update/', {'current_city': 'اصفهان'}),
+    ('/api/tools/realtime/update/', {'current_mood': 'خوب'}),
+)
+
+DEFAULT_MIX = 'chat_new=1,chat_existing=4,tool_update=3,profile_get=2,profile_patch=1'
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def peak_rss_mb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(usage / (1024 * 1024) if sys.platform == 'darwin' else usage / 1024, 1)
+
+
+class BenchUser:
+    def __init__(self, user, token):
+        self.user = user
+        self.auth_header = f'Bearer {token}'
+        self.session_id = None
+
+
+class Command(BaseCommand):
+    help = ("End-to-end benchmark of the chat, tool-callback and profile endpoints against a throwaway test "
+            "database and a local Metis stub. Prints throughput, p50/p95/p99 latency, queries per request and "
+            "peak RSS as JSON so runs on different commits can be compared.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help="Measured requests (after warmup).")
+        parser.add_argument('--warmup', type=int, default=50)
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help="Client threads. Keep 1 on SQLite (single writer); use MySQL for >1.")
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--mix', default=DEFAULT_MIX,
+                            help=f"Weighted scenario mix (default: {DEFAULT_MIX}).")
+        parser.add_argument('--metis-url', default=None,
+                            help="Use an already running Metis stub (e.g. http://127.0.0.1:8765/api/v1) "
+                                 "instead of starting one in-process.")
+        parser.add_argument('--stub-latency', default='fixed:0.05')
+        parser.add_argument('--stub-reply-chars', default='uniform:200,800')
+        parser.add_argument('--stub-error-rate', type=float, default=0.0)
+        parser.add_argument('--keepdb', action='store_true', help="Reuse the test database between runs.")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', default=None, help="Write the JSON report to this file as well.")
+
+    def handle(self, *args, **options):
+        mix = self._parse_mix(options['mix'])
+        logging.disable(logging.INFO)  # per-request INFO logs would dominate the measurement
+
+        stub = None
+        metis_url = options['metis_url']
+        if not metis_url:
+            stub = MetisStubServer(MetisStubConfig(latency=options['stub_latency'],
+                                                   reply_chars=options['stub_reply_chars'],
+                                                   error_rate=options['stub_error_rate'],
+                                                   seed=options['seed'])).start()
+            metis_url = stub.base_url
+
+        setup_test_environment(debug=False)
+        old_db_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        callback_token = uuid.uuid4().hex
+        try:
+            with override_settings(METIS_API_BASE_URL=metis_url, METIS_CALLBACK_SECRET_TOKEN=callback_token,
+                                   METIS_API_KEY=settings.METIS_API_KEY or 'bench',
+                                   METIS_BOT_ID=settings.METIS_BOT_ID or 'bench',
+                                   RATE_LIMIT_ENABLED=False):  # measure the endpoints, not the limiter
+                users = self._create_users(options['users'])
+                rng = random.Random(options['seed'])
+                plan = [rng.choices(list(mix), weights=list(mix.values()))[0]
+                        for _ in range(options['warmup'] + options['requests'])]
+                self._run(plan[:options['warmup']], users, callback_token, options['concurrency'], rng)
+                samples, wall_time = self._run(plan[options['warmup']:], users, callback_token,
+                                               options['concurrency'], rng)
+        finally:
+            connection.creation.destroy_test_db(old_db_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+            if stub:
+                stub.stop()
+            logging.disable(logging.NOTSET)
+
+        report = self._report(samples, wall_time, options, metis_url if not stub else 'in-process stub')
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
+
+    @staticmethod
+    def _parse_mix(spec):
+        known = ('chat_new', 'chat_existing', 'tool_update', 'profile_get', 'profile_patch')
+        mix = {}
+        for part in spec.split(','):
+            name, _, weight = part.partition('=')
+            name = name.strip()
+            if name not in known:
+                raise CommandError(f"Unknown scenario '{name}' (expected one of {', '.join(known)}).")
+            mix[name] = float(weight or 1)
+        if not any(mix.values()):
+            raise CommandError("The scenario mix needs at least one positive weight.")
+        return mix
+
+    def _create_users(self, count):
+        from users_ai.serializers import UserSerializer
+        from users_ai.models import UserRole
+
+        users = []
+        for i in range(count):
+            user = UserSerializer().create({'phone_number': f'0900{i:07d}', 'password': 'bench-pass',
+                                            'first_name': f'Bench{i}'})
+            users.append(BenchUser(user, str(RefreshToken.for_user(user).access_token)))
+        # the daily cap would turn most chat requests into 429s
+        UserRole.objects.filter(name='Free').update(daily_message_limit=10 ** 9, max_active_sessions=10 ** 6)
+        client = Client()
+        for bench_user in users:
+            response = client.post('/api/ai-agent/chat/', {'message': 'سلام'}, content_type='application/json',
+                                   HTTP_AUTHORIZATION=bench_user.auth_header)
+            if response.status_code != 200:
+                raise CommandError(f"Could not open a chat session for the benchmark ({response.status_code}): "
+                                   f"{response.content[:300]!r}")
+            bench_user.session_id = response.json()['session_id']
+        return users
+
+    def _request(self, client, scenario, bench_user, callback_token, rng):
+        auth = {'HTTP_AUTHORIZATION': bench_user.auth_header}
+        if scenario == 'chat_new':
+            # without new_session the message would continue the latest session (CHAT_REUSE_LATEST_SESSION)
+            return client.post('/api/ai-agent/chat/', {'message': 'یک سوال جدید دارم', 'new_session': True},
+                               content_type='application/json', **auth)
+        if scenario == 'chat_existing':
+            return client.post('/api/ai-agent/chat/', {'message': 'ادامه بده', 'session_id': bench_user.session_id},
+                               content_type='application/json', **auth)
+        if scenario == 'tool_update':
+            path, data = rng.choice(TOOL_UPDATE_CALLS)
+            return client.patch(f'{path}?metis_secret_token={callback_token}',
+                                dict(data, user_id=str(bench_user.user.id)), content_type='application/json')
+        if scenario == 'profile_get':
+            return client.get('/api/profile/', **auth)
+        return client.patch('/api/profile/', {'age': rng.randint(18, 70)}, content_type='application/json', **auth)
+
+    def _run(self, plan, users, callback_token, concurrency, rng):
+        samples = []
+        samples_lock = threading.Lock()
+        cursor = iter(enumerate(plan))
+        cursor_lock = threading.Lock()
+
+        def worker(worker_rng):
+            client = Client()
+            local = []
+            while True:
+                with cursor_lock:
+                    item = next(cursor, None)
+                if item is None:
+                    break
+                index, scenario = item
+                bench_user = users[index % len(users)]
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = self._request(client, scenario, bench_user, callback_token, worker_rng)
+                    if getattr(response, 'streaming', False):
+                        b''.join(response.streaming_content)
+                    elapsed = time.perf_counter() - started
+                local.append((scenario, elapsed, len(queries.captured_queries), response.status_code))
+            connections.close_all()
+            with samples_lock:
+                samples.extend(local)
+
+        threads = [threading.Thread(target=worker, args=(random.Random(rng.random()),))
+                   for _ in range(max(1, concurrency))]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples, time.perf_counter() - started
+
+    def _report(self, samples, wall_time, options, metis_target):
+        def summarize(rows):
+            latencies = sorted(row[1] * 1000 for row in rows)
+            errors = sum(1 for row in rows if row[3] >= 400)
+            return {
+                'requests': len(rows),
+                'errors': errors,
+                'throughput_rps': round(len(rows) / wall_time, 2) if wall_time else None,
+                'latency_ms': {
+                    'p50': round(percentile(latencies, 50), 2) if latencies else None,
+                    'p95': round(percentile(latencies, 95), 2) if latencies else None,
+                    'p99': round(percentile(latencies, 99), 2) if latencies else None,
+                    'max': round(latencies[-1], 2) if latencies else None,
+                },
+                'queries_per_request': round(sum(row[2] for row in rows) / len(rows), 2) if rows else None,
+            }
+
+        scenarios = {}
+        for row in samples:
+            scenarios.setdefault(row[0], []).append(row)
+        try:
+            commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                    cwd=settings.BASE_DIR, timeout=5).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            commit = None
+        return {
+            'commit': commit,
+            'database': connection.vendor,
+            'metis': metis_target,
+            'concurrency': options['concurrency'],
+            'users': options['users'],
+            'wall_time_s': round(wall_time, 3),
+            'peak_rss_mb': peak_rss_mb(),
+            'overall': summarize(samples),
+            'scenarios': {name: summarize(rows) for name, rows in sorted(scenarios.items())},
+        }
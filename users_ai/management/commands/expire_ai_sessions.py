@@ -0,0 +1,82 @@
+# users_ai/management/commands/expire_ai_sessions.py
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from users_ai.metis_ai_service import MetisAIService
+from users_ai.models import AiResponse
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ("Flags expired chat sessions inactive in batches (index on is_active, expires_at), optionally "
+            "deleting their Metis sessions in parallel. Run it from cron, or keep it running with --interval.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Sessions updated per UPDATE statement.")
+        parser.add_argument('--delete-metis', action='store_true',
+                            help="Also delete the Metis session of every expired session.")
+        parser.add_argument('--workers', type=int, default=8, help="Parallel Metis delete calls (--delete-metis).")
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Seconds between sweeps; 0 (default) sweeps once and exits.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError("--batch-size and --workers must be at least 1.")
+        metis_service = MetisAIService() if options['delete_metis'] else None
+        executor = ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='expire-metis') \
+            if metis_service else None
+        try:
+            while True:
+                expired, deleted, failed = self.sweep(options['batch_size'], metis_service, executor)
+                message = f"{expired} sessions expired"
+                if metis_service:
+                    message += f", {deleted} Metis sessions deleted, {failed} deletions failed"
+                self.stdout.write(f"{timezone.now().isoformat()} {message}.")
+                if options['interval'] <= 0:
+                    break
+                close_old_connections()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if executor:
+                executor.shutdown(wait=True)
+
+    def sweep(self, batch_size, metis_service=None, executor=None):
+        """Deactivates everything that expired before now; returns (expired, metis deleted, metis failed)."""
+        now = timezone.now()
+        expired = deleted = failed = 0
+        while True:
+            batch = list(AiResponse.objects.expired(now).order_by('expires_at')
+                         .values_list('id', 'metis_session_id')[:batch_size])
+            if not batch:
+                break
+            # is_active=True again: a session closed by a chat request in the meantime is not counted twice
+            expired += AiResponse.objects.filter(id__in=[pk for pk, _ in batch], is_active=True) \
+                .update(is_active=False)
+            metis_ids = [metis_id for _, metis_id in batch if metis_id]
+            if metis_service and metis_ids:
+                for ok in executor.map(lambda metis_id: self._delete_metis_session(metis_service, metis_id),
+                                       metis_ids):
+                    if ok:
+                        deleted += 1
+                    else:
+                        failed += 1
+            if len(batch) < batch_size:
+                break
+        return expired, deleted, failed
+
+    @staticmethod
+    def _delete_metis_session(metis_service, metis_session_id):
+        try:
+            metis_service.delete_chat_session(metis_session_id)
+            return True
+        except Exception as e:
+            logger.warning("Could not delete expired Metis session %s: %s", metis_session_id, e)
+            return False
@@ -0,0 +1,50 @@
+# users_ai/management/commands/run_metis_stub.py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from users_ai.metis_stub import MetisStubConfig, MetisStubServer
+
+
+class Command(BaseCommand):
+    help = ("Runs a local stand-in for the Metis AI API (sessions, messages, streaming, bots) with configurable "
+            "latency, error rate and reply size. Point METIS_API_BASE_URL at the printed URL.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', default='lognormal:-1.2,0.5',
+                            help="Reply latency distribution in seconds, e.g. 'fixed:0.3', 'uniform:0.2,1.5', "
+                                 "'normal:0.8,0.2', 'lognormal:-1.2,0.5', 'exp:0.5'.")
+        parser.add_argument('--session-latency', default=None,
+                            help="Latency distribution for session creation (defaults to --latency).")
+        parser.add_argument('--reply-chars', default='uniform:200,800', help="Reply size distribution in characters.")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with an error.")
+        parser.add_argument('--error-status', type=int, default=503)
+        parser.add_argument('--stream-chunks', type=int, default=8, help="Number of SSE chunks per streamed reply.")
+        parser.add_argument('--callback-base-url', default=None,
+                            help="Base URL of this Django API (e.g. http://127.0.0.1:8000/api) to replay tool "
+                                 "callbacks into /tools/... endpoints.")
+        parser.add_argument('--tool-callback-rate', type=float, default=0.0,
+                            help="Fraction of replies preceded by a tool callback.")
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        try:
+            config = MetisStubConfig(
+                latency=options['latency'], session_latency=options['session_latency'],
+                reply_chars=options['reply_chars'], error_rate=options['error_rate'],
+                error_status=options['error_status'], stream_chunks=options['stream_chunks'],
+                callback_base_url=options['callback_base_url'],
+                callback_token=getattr(settings, 'METIS_CALLBACK_SECRET_TOKEN', None),
+                tool_callback_rate=options['tool_callback_rate'], seed=options['seed'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        server = MetisStubServer(config, host=options['host'], port=options['port'])
+        self.stdout.write(self.style.SUCCESS(f"Metis stub listening; set METIS_API_BASE_URL={server.base_url}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
@@ -1,16 +1,372 @@
 # users_ai/metis_ai_service.py
 import requests
+from requests.adapters import HTTPAdapter
+import httpx
 from django.conf import settings
+import asyncio
+import heapq
+import itertools
 import logging
 import json
+import math
+import os
+import random
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from . import metrics
 
 logger = logging.getLogger(__name__)
 
+# One pooled requests.Session per worker process, shared by every MetisAIService instance.
+# Keep-alive connections to api.metisai.ir are reused instead of paying a TCP/TLS handshake per call.
+_http_session = None
+_http_session_pid = None
+_http_session_lock = threading.Lock()
+
+
+def _build_http_session():
+    pool_connections = getattr(settings, 'METIS_HTTP_POOL_CONNECTIONS', 4)
+    pool_maxsize = getattr(settings, 'METIS_HTTP_POOL_MAXSIZE', 20)
+    session = requests.Session()
+    # pool_block=False: if every pooled connection is busy an extra one is opened and discarded afterwards
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=False)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    logger.debug("Metis HTTP session created (pool_connections=%s, pool_maxsize=%s, pid=%s).",
+                 pool_connections, pool_maxsize, os.getpid())
+    return session
+
+
+def get_http_session():
+    """Returns the process-wide pooled session, re-creating it after a fork (e.g. gunicorn preload)."""
+    global _http_session, _http_session_pid
+    pid = os.getpid()
+    if _http_session is not None and _http_session_pid == pid:
+        return _http_session
+    with _http_session_lock:
+        if _http_session is None or _http_session_pid != pid:
+            _http_session = _build_http_session()
+            _http_session_pid = pid
+    return _http_session
+
+
+def get_http_timeout():
+    return (getattr(settings, 'METIS_CONNECT_TIMEOUT', 5.0), getattr(settings, 'METIS_READ_TIMEOUT', 60.0))
+
+
+def get_pool_stats():
+    """Snapshot of the per-host connection pools of this process (for diagnostics/metrics)."""
+    if _http_session is None or _http_session_pid != os.getpid():
+        return {"pid": os.getpid(), "pools": []}
+    pools = []
+    for adapter in set(_http_session.adapters.values()):
+        pool_manager = adapter.poolmanager
+        for key in list(pool_manager.pools.keys()):
+            pool = pool_manager.pools.get(key)
+            if pool is None:
+                continue
+            pools.append({
+                "scheme": pool.scheme,
+                "host": pool.host,
+                "port": pool.port,
+                "maxsize": pool.pool.maxsize if pool.pool is not None else 0,
+                # the pool queue is pre-filled with None placeholders; only real entries are idle connections
+                "idle_connections": sum(1 for conn in list(pool.pool.queue) if conn is not None)
+                if pool.pool is not None else 0,
+                "connections_opened": pool.num_connections,
+                "requests_sent": pool.num_requests,
+            })
+    return {"pid": os.getpid(), "pools": pools}
+
+
+class MetisAPIError(ConnectionError):
+    """
+    Raised for failed Metis calls. `status_code` is None for network errors/timeouts.
+    Subclasses ConnectionError so existing `except ConnectionError` handlers keep working.
+    """
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def is_upstream_failure(self):
+        # Network errors, 5xx and 429 mean Metis is struggling; other 4xx are caller errors.
+        return self.status_code is None or self.status_code == 429 or self.status_code >= 500
+
+
+class MetisUnavailableError(MetisAPIError):
+    """Raised without calling Metis while the circuit breaker of the endpoint family is open."""
+
+
+def _parse_retry_after(value):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _metis_http_error(status_code_val, response_text, content_type, retry_after=None):
+    """Builds the MetisAPIError raised for a non-2xx Metis response (shared by the sync and async clients)."""
+    status_code = status_code_val if isinstance(status_code_val, int) else None
+    retry_after = _parse_retry_after(retry_after)
+    if response_text and 'application/json' in (content_type or ''):
+        try:
+            error_details = json.loads(response_text)
+        except json.JSONDecodeError:
+            return MetisAPIError(f"Metis AI API Error ({status_code_val}) (non-JSON response): {response_text}",
+                                 status_code, retry_after)
+        return MetisAPIError(
+            f"Metis AI API Error ({status_code_val}): {json.dumps(error_details, ensure_ascii=False)}",
+            status_code, retry_after)
+    return MetisAPIError(f"Metis AI API Error ({status_code_val}): {response_text}", status_code, retry_after)
+
+
+class CircuitBreaker:
+    """
+    Per-process breaker for one Metis endpoint family. After `failure_threshold` consecutive upstream failures
+    it opens for `reset_timeout` seconds and calls fail fast; then a single probe call is let through
+    (half-open) and its outcome closes or re-opens the breaker.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == self.OPEN and remaining <= 0:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            retry_after = max(1, int(math.ceil(remaining))) if remaining > 0 else 1
+        raise MetisUnavailableError(f"Metis AI '{self.name}' endpoints are unavailable (circuit open).",
+                                    status_code=503, retry_after=retry_after)
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Metis circuit '%s' closed.", self.name)
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """Ends a half-open probe that produced no outcome (cancelled), so the next call may probe again."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("Metis circuit '%s' opened after %s consecutive failures.",
+                                   self.name, self.consecutive_failures)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(family):
+    breaker = _circuit_breakers.get(family)
+    if breaker is None:
+        with _circuit_breakers_lock:
+            breaker = _circuit_breakers.get(family)
+            if breaker is None:
+                breaker = CircuitBreaker(family,
+                                         getattr(settings, 'METIS_BREAKER_FAILURE_THRESHOLD', 5),
+                                         getattr(settings, 'METIS_BREAKER_RESET_TIMEOUT', 30.0))
+                _circuit_breakers[family] = breaker
+    return breaker
+
+
+def _endpoint_family(base_url_type, endpoint):
+    if base_url_type == "bot_management":
+        return "bots"
+    if endpoint.endswith("/message") or endpoint.endswith("/message/stream"):
+        return "chat_message"
+    return "chat_session"
+
+
+def _endpoint_name(method, base_url_type, endpoint):
+    """Low-cardinality name of a Metis call for metrics (session ids stripped)."""
+    if base_url_type == "bot_management":
+        return f"bots_{method.lower()}"
+    if endpoint.endswith("/message/stream"):
+        return "message_stream"
+    if endpoint.endswith("/message"):
+        return "message"
+    if endpoint == "session":
+        return "session_create" if method == "POST" else "session_list"
+    return {"DELETE": "session_delete", "GET": "session_get"}.get(method, f"session_{method.lower()}")
+
+
+def _observe_metis_call(name, started, outcome):
+    metrics.observe('aiagent_metis_request_duration_seconds', time.perf_counter() - started, endpoint=name,
+                    outcome=outcome)
+
+
+def _call_outcome(exc):
+    if isinstance(exc.status_code, int):
+        return f"{exc.status_code // 100}xx"
+    return "network_error"
+
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'DELETE')
+
+
+def _max_attempts(method):
+    # Only idempotent calls are retried; a retried POST could create a second session or send a message twice.
+    if method.upper() in IDEMPOTENT_METHODS:
+        return max(1, getattr(settings, 'METIS_RETRY_MAX_ATTEMPTS', 3))
+    return 1
+
+
+def _backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff, never shorter than a server-sent Retry-After (both capped)."""
+    cap = getattr(settings, 'METIS_RETRY_BACKOFF_MAX', 4.0)
+    base = getattr(settings, 'METIS_RETRY_BACKOFF_BASE', 0.5)
+    delay = random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+    if retry_after:
+        delay = max(delay, retry_after)
+    return min(delay, cap)
+
+
+class MetisGateRejected(MetisUnavailableError):
+    """Raised when the outbound gate's wait queue is full (answered with 429)."""
+
+
+class OutboundGate:
+    """
+    Bulkhead in front of the chat calls to Metis: at most `max_concurrent` calls run at once per process,
+    up to `max_queue` callers wait for a slot (highest priority first, FIFO within a priority) and a waiter
+    gives up after `queue_timeout` seconds. Rejected callers never occupy a worker thread for long, so
+    non-chat endpoints keep their latency during chat spikes.
+    """
+
+    def __init__(self, max_concurrent, max_queue, queue_timeout):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters = []  # heap of [-priority, seq, threading.Event]
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def acquire(self, priority=0):
+        with self._lock:
+            if self.active < self.max_concurrent and not self._waiters:
+                self.active += 1
+                return
+            if len(self._waiters) >= self.max_queue:
+                raise MetisGateRejected("Too many pending Metis AI requests.", status_code=429,
+                                        retry_after=max(1, int(self.queue_timeout)))
+            waiter = [-priority, next(self._seq), threading.Event()]
+            heapq.heappush(self._waiters, waiter)
+        if waiter[2].wait(self.queue_timeout):
+            return
+        with self._lock:
+            if waiter[2].is_set():  # granted while timing out
+                return
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+        raise MetisUnavailableError("Timed out waiting for a Metis AI request slot.", status_code=503,
+                                    retry_after=max(1, int(self.queue_timeout)))
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                # hand the slot straight to the best waiter; `active` stays the same
+                heapq.heappop(self._waiters)[2].set()
+            else:
+                self.active -= 1
+
+    @contextmanager
+    def slot(self, priority=0):
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        return {"active": self.active, "queued": len(self._waiters), "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue}
+
+
+_outbound_gate = None
+_outbound_gate_lock = threading.Lock()
+
+
+def get_outbound_gate():
+    global _outbound_gate
+    if _outbound_gate is None:
+        with _outbound_gate_lock:
+            if _outbound_gate is None:
+                _outbound_gate = OutboundGate(getattr(settings, 'METIS_GATE_MAX_CONCURRENT', 8),
+                                              getattr(settings, 'METIS_GATE_MAX_QUEUE', 16),
+                                              getattr(settings, 'METIS_GATE_QUEUE_TIMEOUT', 10.0))
+    return _outbound_gate
+
+
+def get_role_priority(role):
+    """Lane of a UserRole (or role name) in the outbound gate; higher goes first."""
+    if role is None:
+        return 0
+    name = getattr(role, 'name', role)
+    priorities = getattr(settings, 'METIS_GATE_ROLE_PRIORITY', {})
+    if name in priorities:
+        return priorities[name]
+    return getattr(settings, 'METIS_GATE_DEFAULT_PRIORITY', 0)
+
+
+def _is_gated(method, base_url_type):
+    # Session creation and messages are the slow, high-volume calls; management/GET/DELETE calls bypass the gate.
+    return base_url_type == "chat" and method.upper() == "POST"
+
+
+def _extract_stream_chunk(payload):
+    """Text of one streamed event; Metis sends JSON (`{"message": {"content": ...}}` or `{"content": ...}`)."""
+    try:
+        event = json.loads(payload)
+    except json.JSONDecodeError:
+        return payload
+    if not isinstance(event, dict):
+        return str(event)
+    message = event.get('message')
+    if isinstance(message, dict) and message.get('content') is not None:
+        return message['content']
+    return event.get('content') or ''
+
 
 class MetisAIService:
-    def __init__(self):
-        self.chat_base_url = "https://api.metisai.ir/api/v1/chat"
-        self.bot_management_base_url = "https://api.metisai.ir/api/v1"
+    def __init__(self, priority=0):
+        # Lane in the outbound gate for chat calls, usually get_role_priority(user_profile.role)
+        self.priority = priority
+        api_base_url = getattr(settings, 'METIS_API_BASE_URL', "https://api.metisai.ir/api/v1").rstrip('/')
+        self.chat_base_url = f"{api_base_url}/chat"
+        self.bot_management_base_url = api_base_url
         self.api_key = settings.METIS_API_KEY
         self.bot_id = settings.METIS_BOT_ID
         self.headers = {
@@ -23,39 +379,82 @@ class MetisAIService:
             raise ValueError("Metis AI credentials are not set up.")
         logger.debug("MetisAIService initialized.")
 
-    def _make_request(self, method, base_url_type, endpoint, json_data=None, params=None):
-        base_url = ""
+    def _build_url(self, base_url_type, endpoint):
         if base_url_type == "chat":
-            base_url = self.chat_base_url
-        elif base_url_type == "bot_management":
-            base_url = self.bot_management_base_url
-        else:
-            raise ValueError("Invalid base_url_type provided to _make_request")
+            return f"{self.chat_base_url}/{endpoint}"
+        if base_url_type == "bot_management":
+            return f"{self.bot_management_base_url}/{endpoint}"
+        raise ValueError("Invalid base_url_type provided to _make_request")
 
-        url = f"{base_url}/{endpoint}"
+    def _make_request(self, method, base_url_type, endpoint, json_data=None, params=None):
+        if _is_gated(method, base_url_type):
+            with get_outbound_gate().slot(self.priority):
+                return self._make_request_with_retries(method, base_url_type, endpoint, json_data, params)
+        return self._make_request_with_retries(method, base_url_type, endpoint, json_data, params)
+
+    def _make_request_with_retries(self, method, base_url_type, endpoint, json_data=None, params=None):
+        url = self._build_url(base_url_type, endpoint)
+        breaker = get_circuit_breaker(_endpoint_family(base_url_type, endpoint))
+        metric_name = _endpoint_name(method, base_url_type, endpoint)
+        max_attempts = _max_attempts(method)
+        attempt = 1
+        while True:
+            breaker.before_request()
+            started = time.perf_counter()
+            try:
+                result = self._send_request(method, url, json_data, params)
+            except MetisAPIError as e:
+                _observe_metis_call(metric_name, started, _call_outcome(e))
+                if not e.is_upstream_failure:
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                if attempt >= max_attempts:
+                    raise
+                delay = _backoff_delay(attempt, e.retry_after)
+                logger.warning("[_make_request] %s %s failed (attempt %s/%s): %s. Retrying in %.2fs.",
+                               method, url, attempt, max_attempts, e, delay)
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except Exception:
+                # e.g. a 200 whose body is not JSON: a failed call as far as the breaker is concerned
+                _observe_metis_call(metric_name, started, "error")
+                breaker.record_failure()
+                raise
+            except BaseException:
+                # cancelled (client gone): no outcome, but a half-open probe must not stay in flight
+                breaker.release_probe()
+                raise
+            _observe_metis_call(metric_name, started, "2xx")
+            breaker.record_success()
+            return result
+
+    def _send_request(self, method, url, json_data=None, params=None):
         response = None  # Initialize response
         try:
-            logger.debug(f"[_make_request] Attempting request to {method} {url}")
+            logger.debug("[_make_request] Attempting request to %s %s", method, url)
             # logger.debug(f"[_make_request] Request Headers: {self.headers}") # Can be verbose
             if json_data:
                 log_data_keys = list(json_data.keys())
-                logger.info(f"[_make_request] JSON Sent (keys): {log_data_keys}")
+                logger.debug("[_make_request] JSON Sent (keys): %s", log_data_keys)
                 # To log full JSON for debugging (be careful with large payloads):
                 # if settings.DEBUG or logger.isEnabledFor(logging.DEBUG): # Only log full payload in debug
                 #    logger.debug(f"[_make_request] Full JSON Sent: {json.dumps(json_data, indent=2, ensure_ascii=False)}")
             if params:
-                logger.debug(f"[_make_request] Request Params: {params}")
+                logger.debug("[_make_request] Request Params: %s", params)
 
-            response = requests.request(method, url, headers=self.headers, json=json_data, params=params, timeout=60)
+            response = get_http_session().request(method, url, headers=self.headers, json=json_data, params=params,
+                                                  timeout=get_http_timeout())
 
-            logger.info(f"[_make_request] Response Status Code from Metis: {response.status_code} for URL: {url}")
+            logger.debug("[_make_request] Response Status Code from Metis: %s for URL: %s", response.status_code, url)
             # Log a snippet of the response text for quick diagnostics
             # logger.debug(f"[_make_request] Response Text from Metis (snippet): {response.text[:500] if response.text else 'No text'}")
 
             response.raise_for_status()
 
             if response.status_code == 204:
-                logger.info(f"[_make_request] Response Status: 204 No Content. Returning None for URL: {url}")
+                logger.debug("[_make_request] Response Status: 204 No Content. Returning None for URL: %s", url)
                 return None
 
             if response.text:  # Check if there's content to parse
@@ -64,39 +463,29 @@ class MetisAIService:
                 return response_json
             else:
                 logger.warning(
-                    f"[_make_request] Response was successful (status {response.status_code}) but had no content to decode as JSON for URL: {url}.")
+                    "[_make_request] Response was successful (status %s) but had no content to decode as JSON for URL: %s.", response.status_code, url)
                 return {}  # Return empty dict or None, depending on expected behavior for empty successful responses
 
         except requests.exceptions.HTTPError as e:
             response_text = getattr(e.response, 'text', 'No response text available in HTTPError')
             status_code_val = e.response.status_code if e.response is not None else 'N/A'
-            logger.error(
-                f"[_make_request] HTTP Error: {status_code_val} for url: {url}. Response: {response_text[:1000]}...")  # Log more of the error
-            try:
-                if response_text and e.response is not None and 'application/json' in e.response.headers.get(
-                        'Content-Type', ''):
-                    error_details = json.loads(response_text)
-                    raise ConnectionError(
-                        f"Metis AI API Error ({status_code_val}): {json.dumps(error_details, ensure_ascii=False)}")
-                else:
-                    raise ConnectionError(f"Metis AI API Error ({status_code_val}): {response_text}")
-            except json.JSONDecodeError:
-                raise ConnectionError(f"Metis AI API Error ({status_code_val}) (non-JSON response): {response_text}")
-            except AttributeError:
-                raise ConnectionError(f"Metis AI API Error (AttributeError accessing response): {response_text}")
+            logger.error("[_make_request] HTTP Error: %s for url: %s. Response: %s...",
+                         status_code_val, url, response_text[:1000])  # Log more of the error
+            headers = e.response.headers if e.response is not None else {}
+            raise _metis_http_error(status_code_val, response_text, headers.get('Content-Type', ''),
+                                    headers.get('Retry-After'))
 
         except json.JSONDecodeError as e_json:
             resp_status = response.status_code if response else 'N/A'
             resp_text = response.text if response else 'N/A'
-            logger.error(
-                f"[_make_request] JSON Decode Error: {e_json}. Response status: {resp_status}, Response content: {resp_text[:500]}...")
+            logger.error("[_make_request] JSON Decode Error: %s. Response status: %s, Response content: %s...",
+                         e_json, resp_status, resp_text[:500])
             raise ValueError(f"Invalid JSON response from Metis AI: {e_json}. Content: {resp_text[:500]}...")
         except requests.exceptions.RequestException as e_req:
-            logger.error(
-                f"[_make_request] Network/Request Error: {e_req} for url: {url}")
-            raise ConnectionError(f"Failed to connect to Metis AI: {e_req}")
+            logger.error("[_make_request] Network/Request Error: %s for url: %s", e_req, url)
+            raise MetisAPIError(f"Failed to connect to Metis AI: {e_req}")
         except Exception as e_gen:
-            logger.error(f"[_make_request] An unexpected error occurred for url {url}: {e_gen}", exc_info=True)
+            logger.error("[_make_request] An unexpected error occurred for url %s: %s", url, e_gen, exc_info=True)
             raise
 
     # Bot Management Methods
@@ -160,9 +549,69 @@ class MetisAIService:
         }
         return self._make_request("POST", "chat", endpoint, json_data=data)
 
+    def stream_message(self, session_id, content, message_type="USER"):
+        """
+        Sends a message on Metis' streaming endpoint and yields the reply text chunk by chunk as the
+        server-sent events arrive. The read timeout applies between chunks, not to the whole reply.
+        """
+        url = f"{self.chat_base_url}/session/{session_id}/message/stream"
+        data = {
+            "message": {
+                "content": content,
+                "type": message_type
+            }
+        }
+        headers = dict(self.headers, Accept="text/event-stream")
+        with get_outbound_gate().slot(self.priority):
+            yield from self._stream_message(url, headers, data)
+
+    def _stream_message(self, url, headers, data):
+        breaker = get_circuit_breaker("chat_message")
+        breaker.before_request()
+        started = time.perf_counter()
+        try:
+            response = get_http_session().post(url, headers=headers, json=data, timeout=get_http_timeout(),
+                                               stream=True)
+        except requests.exceptions.RequestException as e_req:
+            _observe_metis_call("message_stream", started, "network_error")
+            logger.error("[stream_message] Network/Request Error: %s for url: %s", e_req, url)
+            breaker.record_failure()
+            raise MetisAPIError(f"Failed to connect to Metis AI: {e_req}")
+        except BaseException:
+            breaker.release_probe()
+            raise
+
+        with response:
+            # time to the response headers; the body is streamed to the client afterwards
+            _observe_metis_call("message_stream", started, f"{response.status_code // 100}xx")
+            logger.debug("[stream_message] Response Status Code from Metis: %s for URL: %s", response.status_code, url)
+            if response.status_code >= 400:
+                error = _metis_http_error(response.status_code, response.text,
+                                          response.headers.get('Content-Type', ''), response.headers.get('Retry-After'))
+                breaker.record_failure() if error.is_upstream_failure else breaker.record_success()
+                raise error
+            breaker.record_success()
+            try:
+                for raw_line in response.iter_lines():
+                    # SSE bodies are UTF-8 regardless of what requests guesses from the Content-Type
+                    line = raw_line.decode('utf-8', errors='replace') if raw_line else ''
+                    if not line.startswith('data:'):
+                        continue
+                    payload = line[5:].strip()
+                    if not payload:
+                        continue
+                    if payload == '[DONE]':
+                        break
+                    chunk = _extract_stream_chunk(payload)
+                    if chunk:
+                        yield chunk
+            except requests.exceptions.RequestException as e_req:
+                logger.error("[stream_message] Stream interrupted: %s for url: %s", e_req, url)
+                raise MetisAPIError(f"Metis AI stream interrupted: {e_req}")
+
     def delete_chat_session(self, session_id):
         endpoint = f"session/{session_id}"
-        logger.debug(f"[delete_chat_session] Deleting session: {session_id}")
+        logger.debug("[delete_chat_session] Deleting session: %s", session_id)
         return self._make_request("DELETE", "chat", endpoint)
 
     def get_chat_session_info(self, session_id):
@@ -266,6 +715,24 @@ class MetisAIService:
             ]
         })
 
+        from .tool_dispatch import TOOL_REGISTRY, TOOL_BATCH_MAX_OPERATIONS
+        tools.append({
+            "name": "apply_user_updates_batch",
+            "description": "چند به‌روزرسانی پروفایل کاربر را یکجا و در یک درخواست ثبت می‌کند؛ وقتی چند مورد از ابزارهای بالا "
+                           "را پشت سر هم لازم دارید، به جای آنها از این ابزار استفاده کنید. نتیجه هر عملیات جداگانه برگردانده می‌شود.",
+            "url": f"{django_api_base_url}/tools/batch/",
+            "method": "POST",
+            "args": [
+                create_arg("user_id", "STRING", True, "شناسه عددی یکتای کاربر."),
+                create_arg("operations", "STRING", True,
+                           f"آرایه JSON از عملیات‌ها (حداکثر {TOOL_BATCH_MAX_OPERATIONS}). هر عملیات یک شیء با کلید "
+                           "\"tool\" (نام ابزار) و همان آرگومان‌های آن ابزار به جز user_id است؛ برای ویرایش یا حذف "
+                           "هدف/عادت، شناسه رکورد در \"pk\". مثال: [{\"tool\": \"update_health_record\", "
+                           "\"sleep_hours\": 7}, {\"tool\": \"create_new_goal_for_user\", \"goal_type\": \"سلامتی\", "
+                           "\"description\": \"روزی ۳۰ دقیقه پیاده‌روی\"}]. ابزارهای مجاز: " + ", ".join(TOOL_REGISTRY)),
+            ]
+        })
+
         tools.append({
             "name": "get_current_server_time",
             "description": "زمان و تاریخ فعلی سرور را برمی‌گرداند. برای اطلاع از ساعت فعلی استفاده می‌شود.",
@@ -274,5 +741,173 @@ class MetisAIService:
             "args": []
         })
 
-        logger.debug(f"Defined {len(tools)} tools for Metis Bot API.")
-        return tools
\ No newline at end of file
+        logger.debug("Defined %s tools for Metis Bot API.", len(tools))
+        return tools
+
+
+# One httpx.AsyncClient per event loop (an AsyncClient must not be shared across loops).
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_http_client():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        connect_timeout, read_timeout = get_http_timeout()
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=getattr(settings, 'METIS_ASYNC_MAX_CONNECTIONS', 200),
+                                max_keepalive_connections=getattr(settings, 'METIS_HTTP_POOL_MAXSIZE', 20)),
+        )
+        _async_clients[loop] = client
+        logger.debug("Metis async HTTP client created for event loop %s.", id(loop))
+    return client
+
+
+class AsyncOutboundGate:
+    """asyncio counterpart of OutboundGate (one per event loop, same limits and priority lanes)."""
+
+    def __init__(self, max_concurrent, max_queue, queue_timeout):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters = []  # heap of [-priority, seq, asyncio.Future]
+        self._seq = itertools.count()
+
+    async def acquire(self, priority=0):
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise MetisGateRejected("Too many pending Metis AI requests.", status_code=429,
+                                    retry_after=max(1, int(self.queue_timeout)))
+        future = asyncio.get_running_loop().create_future()
+        waiter = [-priority, next(self._seq), future]
+        heapq.heappush(self._waiters, waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.done():  # granted while timing out
+                return
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+            raise MetisUnavailableError("Timed out waiting for a Metis AI request slot.", status_code=503,
+                                        retry_after=max(1, int(self.queue_timeout)))
+        except asyncio.CancelledError:
+            # the caller went away (client disconnect): give the slot on if it was already granted, otherwise
+            # leave the queue so release() does not hand a slot to a waiter nobody awaits
+            if future.done():
+                self.release()
+            else:
+                future.cancel()
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+            raise
+
+    def release(self):
+        while self._waiters:
+            future = heapq.heappop(self._waiters)[2]
+            if not future.done():
+                future.set_result(True)
+                return
+        self.active -= 1
+
+
+_async_gates = weakref.WeakKeyDictionary()
+
+
+def get_async_outbound_gate():
+    loop = asyncio.get_running_loop()
+    gate = _async_gates.get(loop)
+    if gate is None:
+        gate = AsyncOutboundGate(getattr(settings, 'METIS_GATE_MAX_CONCURRENT', 8),
+                                 getattr(settings, 'METIS_GATE_MAX_QUEUE', 16),
+                                 getattr(settings, 'METIS_GATE_QUEUE_TIMEOUT', 10.0))
+        _async_gates[loop] = gate
+    return gate
+
+
+class AsyncMetisAIService(MetisAIService):
+    """
+    asyncio version of MetisAIService built on httpx.AsyncClient.
+    Only `_make_request` is overridden: every public method (create_chat_session, send_message, ...) simply
+    returns `self._make_request(...)`, so here they return a coroutine and must be awaited.
+    """
+
+    async def _make_request(self, method, base_url_type, endpoint, json_data=None, params=None):
+        if not _is_gated(method, base_url_type):
+            return await self._make_request_with_retries(method, base_url_type, endpoint, json_data, params)
+        gate = get_async_outbound_gate()
+        await gate.acquire(self.priority)
+        try:
+            return await self._make_request_with_retries(method, base_url_type, endpoint, json_data, params)
+        finally:
+            gate.release()
+
+    async def _make_request_with_retries(self, method, base_url_type, endpoint, json_data=None, params=None):
+        url = self._build_url(base_url_type, endpoint)
+        breaker = get_circuit_breaker(_endpoint_family(base_url_type, endpoint))
+        metric_name = _endpoint_name(method, base_url_type, endpoint)
+        max_attempts = _max_attempts(method)
+        attempt = 1
+        while True:
+            breaker.before_request()
+            started = time.perf_counter()
+            try:
+                result = await self._send_request(method, url, json_data, params)
+            except MetisAPIError as e:
+                _observe_metis_call(metric_name, started, _call_outcome(e))
+                if not e.is_upstream_failure:
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                if attempt >= max_attempts:
+                    raise
+                delay = _backoff_delay(attempt, e.retry_after)
+                logger.warning("[async _make_request] %s %s failed (attempt %s/%s): %s. Retrying in %.2fs.",
+                               method, url, attempt, max_attempts, e, delay)
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except Exception:
+                # e.g. a 200 whose body is not JSON: a failed call as far as the breaker is concerned
+                _observe_metis_call(metric_name, started, "error")
+                breaker.record_failure()
+                raise
+            except BaseException:
+                # cancelled (client gone): no outcome, but a half-open probe must not stay in flight
+                breaker.release_probe()
+                raise
+            _observe_metis_call(metric_name, started, "2xx")
+            breaker.record_success()
+            return result
+
+    async def _send_request(self, method, url, json_data=None, params=None):
+        logger.debug("[async _make_request] %s %s", method, url)
+        try:
+            response = await get_async_http_client().request(method, url, headers=self.headers, json=json_data,
+                                                             params=params)
+        except httpx.HTTPError as e_req:
+            logger.error("[async _make_request] Network/Request Error: %s for url: %s", e_req, url)
+            raise MetisAPIError(f"Failed to connect to Metis AI: {e_req}")
+
+        logger.debug("[async _make_request] Response Status Code from Metis: %s for URL: %s", response.status_code, url)
+        if response.is_error:
+            logger.error("[async _make_request] HTTP Error: %s for url: %s. Response: %s...",
+                         response.status_code, url, response.text[:1000])
+            raise _metis_http_error(response.status_code, response.text, response.headers.get('Content-Type', ''),
+                                    response.headers.get('Retry-After'))
+
+        if response.status_code == 204:
+            return None
+        if not response.content:
+            logger.warning("[async _make_request] Response was successful (status %s) but had no content for URL: %s.",
+                           response.status_code, url)
+            return {}
+        try:
+            return response.json()
+        except json.JSONDecodeError as e_json:
+            logger.error("[async _make_request] JSON Decode Error: %s. Response status: %s, Response content: %s...",
+                         e_json, response.status_code, response.text[:500])
+            raise ValueError(f"Invalid JSON response from Metis AI: {e_json}. Content: {response.text[:500]}...")
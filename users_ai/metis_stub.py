@@ -0,0 +1,361 @@
+# users_ai/metis_stub.py
+"""
+Local stand-in for the Metis AI API, for development, benchmarks and capacity planning without calling
+api.metisai.ir. Implements the endpoints MetisAIService uses:
+
+    POST   /api/v1/chat/session                         create session (replies to the last USER initial message)
+    GET    /api/v1/chat/session/{id}                    session info
+    DELETE /api/v1/chat/session/{id}
+    POST   /api/v1/chat/session/{id}/message            reply
+    POST   /api/v1/chat/session/{id}/message/stream     reply as server-sent events
+    GET    /api/v1/bots/all, GET|PUT|DELETE /api/v1/bots/{id}, POST /api/v1/bots
+    GET    /_stub/stats                                 request/error/callback counters
+
+Latency and reply size are drawn from distributions given as specs ("fixed:0.2", "uniform:0.1,0.6",
+"normal:0.4,0.1", "lognormal:-1.2,0.5", "exp:0.3"). Point Django at it with
+METIS_API_BASE_URL=http://127.0.0.1:<port>/api/v1. Run it with `python manage.py run_metis_stub`.
+"""
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import request as urllib_request
+from urllib.error import URLError
+
+logger = logging.getLogger(__name__)
+
+REPLY_WORDS = ("سلام", "ممنون", "از", "اینکه", "پیام", "دادید", "برنامه", "هدف", "سلامتی", "خواب", "ورزش",
+               "امروز", "می‌توانیم", "درباره", "صحبت", "کنیم", "the", "plan", "goal", "and", "today")
+
+
+class Distribution:
+    """Random distribution parsed from a "kind:arg1,arg2" spec; samples are never negative."""
+    KINDS = {'fixed': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2, 'exp': 1}
+
+    def __init__(self, spec):
+        kind, _, args = str(spec).partition(':')
+        if not args:  # a bare number means fixed
+            kind, args = 'fixed', kind
+        kind = kind.strip().lower()
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown distribution '{kind}' (expected one of {', '.join(self.KINDS)})")
+        self.kind = kind
+        self.args = [float(a) for a in args.split(',') if a.strip()]
+        if len(self.args) != self.KINDS[kind]:
+            raise ValueError(f"Distribution '{kind}' expects {self.KINDS[kind]} argument(s), got '{spec}'")
+        self.spec = spec
+
+    def sample(self, rng=random):
+        if self.kind == 'fixed':
+            value = self.args[0]
+        elif self.kind == 'uniform':
+            value = rng.uniform(*self.args)
+        elif self.kind == 'normal':
+            value = rng.gauss(*self.args)
+        elif self.kind == 'lognormal':
+            value = rng.lognormvariate(*self.args)
+        else:
+            value = rng.expovariate(1.0 / self.args[0]) if self.args[0] > 0 else 0.0
+        return max(0.0, value)
+
+    def __repr__(self):
+        return f"Distribution({self.spec!r})"
+
+
+# Sample tool calls replayed into our /tools/... callbacks (same names/paths as get_tool_schemas_for_metis_bot)
+SAMPLE_TOOL_CALLS = (
+    ("PATCH", "tools/profile/update/", lambda rng: {"age": rng.randint(18, 70), "location": "تهران"}),
+    ("PATCH", "tools/health/update/", lambda rng: {"sleep_hours": round(rng.uniform(5, 9), 1),
+                                                   "physical_activity_level": rng.choice(["کم", "متوسط", "زیاد"])}),
+    ("POST", "tools/goals/create/", lambda rng: {"goal_type": "سلامتی", "description": "روزی ۳۰ دقیقه پیاده‌روی",
+                                                 "priority": rng.randint(1, 5)}),
+    ("POST", "tools/feedback/update/", lambda rng: {"feedback_text": "پاسخ مفید بود", "interaction_type": "پاسخ_AI",
+                                                    "interaction_rating": rng.randint(1, 5)}),
+)
+
+
+class MetisStubConfig:
+    def __init__(self, latency='fixed:0.3', session_latency=None, reply_chars='uniform:200,800', error_rate=0.0,
+                 error_status=503, stream_chunks=8, callback_base_url=None, callback_token=None,
+                 tool_callback_rate=0.0, seed=None):
+        self.latency = Distribution(latency)
+        self.session_latency = Distribution(session_latency) if session_latency else self.latency
+        self.reply_chars = Distribution(reply_chars)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stream_chunks = max(1, stream_chunks)
+        self.callback_base_url = callback_base_url.rstrip('/') if callback_base_url else None
+        self.callback_token = callback_token
+        self.tool_callback_rate = tool_callback_rate
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+
+    def sample(self, distribution):
+        with self.rng_lock:
+            return distribution.sample(self.rng)
+
+    def chance(self, rate):
+        if rate <= 0:
+            return False
+        with self.rng_lock:
+            return self.rng.random() < rate
+
+
+class MetisStubState:
+    def __init__(self):
+        self.sessions = {}
+        self.bots = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+
+class MetisStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API behind its load balancer
+    server_version = 'MetisStub/1.0'
+
+    routes = (
+        ('POST', re.compile(r'^/api/v1/chat/session/?$'), 'create_session'),
+        ('POST', re.compile(r'^/api/v1/chat/session/(?P<sid>[^/]+)/message/stream/?$'), 'stream_message'),
+        ('POST', re.compile(r'^/api/v1/chat/session/(?P<sid>[^/]+)/message/?$'), 'send_message'),
+        ('GET', re.compile(r'^/api/v1/chat/session/(?P<sid>[^/]+)/?$'), 'get_session'),
+        ('DELETE', re.compile(r'^/api/v1/chat/session/(?P<sid>[^/]+)/?$'), 'delete_session'),
+        ('GET', re.compile(r'^/api/v1/bots/all/?$'), 'list_bots'),
+        ('POST', re.compile(r'^/api/v1/bots/?$'), 'create_bot'),
+        ('GET', re.compile(r'^/api/v1/bots/(?P<bot_id>[^/]+)/?$'), 'get_bot'),
+        ('PUT', re.compile(r'^/api/v1/bots/(?P<bot_id>[^/]+)/?$'), 'update_bot'),
+        ('DELETE', re.compile(r'^/api/v1/bots/(?P<bot_id>[^/]+)/?$'), 'delete_bot'),
+        ('GET', re.compile(r'^/_stub/stats/?$'), 'stats'),
+    )
+
+    @property
+    def config(self) -> MetisStubConfig:
+        return self.server.stub_config
+
+    @property
+    def state(self) -> MetisStubState:
+        return self.server.stub_state
+
+    def log_message(self, format, *args):
+        logger.debug("metis-stub: " + format, *args)
+
+    def _dispatch(self, method):
+        path = self.path.split('?', 1)[0]
+        for route_method, pattern, handler_name in self.routes:
+            match = pattern.match(path)
+            if route_method == method and match:
+                body = self._read_json()
+                self.state.count(f"requests.{handler_name}")
+                if handler_name != 'stats' and self.config.chance(self.config.error_rate):
+                    self.state.count("errors.injected")
+                    time.sleep(self.config.sample(self.config.latency) / 4)
+                    return self._send_json({"message": "injected stub error"}, self.config.error_status)
+                return getattr(self, f"handle_{handler_name}")(body, **match.groupdict())
+        self._send_json({"message": f"No stub route for {method} {path}"}, 404)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        raw = self.rfile.read(length)
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError:
+            return {}
+
+    def _send_json(self, payload, status_code=200):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reply_text(self):
+        target = int(self.config.sample(self.config.reply_chars))
+        words = []
+        length = 0
+        with self.config.rng_lock:
+            while length < target:
+                word = self.config.rng.choice(REPLY_WORDS)
+                words.append(word)
+                length += len(word) + 1
+        return " ".join(words)[:max(target, 1)]
+
+    def _maybe_fire_tool_callback(self, session):
+        """Replays a tool call into our Django /tools/... endpoints, as Metis does before answering."""
+        if not self.config.callback_base_url or not self.config.chance(self.config.tool_callback_rate):
+            return
+        with self.config.rng_lock:
+            method, path, build_args = self.config.rng.choice(SAMPLE_TOOL_CALLS)
+            args = build_args(self.config.rng)
+        args["user_id"] = session.get("user", {}).get("id", "1")
+        url = f"{self.config.callback_base_url}/{path}"
+        if self.config.callback_token:
+            url += f"?metis_secret_token={self.config.callback_token}"
+        req = urllib_request.Request(url, data=json.dumps(args).encode('utf-8'), method=method,
+                                     headers={'Content-Type': 'application/json'})
+        try:
+            with urllib_request.urlopen(req, timeout=30) as resp:
+                self.state.count(f"callbacks.status_{resp.status}")
+        except URLError as e:
+            status_code = getattr(e, 'code', 'error')
+            self.state.count(f"callbacks.status_{status_code}")
+            logger.debug("metis-stub: tool callback %s %s failed: %s", method, url, e)
+
+    def _ai_message(self, session_id, content):
+        return {"id": str(uuid.uuid4()), "sessionId": session_id, "type": "AI", "content": content}
+
+    # ---- handlers ----
+    def handle_create_session(self, body):
+        session_id = str(uuid.uuid4())
+        session = {"id": session_id, "botId": body.get("botId"), "user": body.get("user") or {},
+                   "messages": list(body.get("initialMessages") or [])}
+        with self.state.lock:
+            self.state.sessions[session_id] = session
+        time.sleep(self.config.sample(self.config.session_latency))
+        payload = dict(session)
+        if any(m.get("type") == "USER" for m in session["messages"]):
+            self._maybe_fire_tool_callback(session)
+            payload["content"] = self._reply_text()
+        self._send_json(payload)
+
+    def _get_session_or_404(self, sid):
+        with self.state.lock:
+            session = self.state.sessions.get(sid)
+        if session is None:
+            self._send_json({"message": f"Session {sid} not found"}, 404)
+        return session
+
+    def handle_send_message(self, body, sid):
+        session = self._get_session_or_404(sid)
+        if session is None:
+            return
+        session["messages"].append(body.get("message") or {})
+        time.sleep(self.config.sample(self.config.latency))
+        self._maybe_fire_tool_callback(session)
+        self._send_json(self._ai_message(sid, self._reply_text()))
+
+    def handle_stream_message(self, body, sid):
+        session = self._get_session_or_404(sid)
+        if session is None:
+            return
+        session["messages"].append(body.get("message") or {})
+        self._maybe_fire_tool_callback(session)
+        text = self._reply_text()
+        chunks = self.config.stream_chunks
+        step = max(1, -(-len(text) // chunks))
+        pause = self.config.sample(self.config.latency) / chunks
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        for start in range(0, len(text), step):
+            time.sleep(pause)
+            event = {"message": {"type": "AI", "content": text[start:start + step]}}
+            self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def handle_get_session(self, body, sid):
+        session = self._get_session_or_404(sid)
+        if session is not None:
+            self._send_json(session)
+
+    def handle_delete_session(self, body, sid):
+        with self.state.lock:
+            self.state.sessions.pop(sid, None)
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def handle_list_bots(self, body):
+        with self.state.lock:
+            self._send_json(list(self.state.bots.values()))
+
+    def handle_create_bot(self, body):
+        bot = dict(body, id=str(uuid.uuid4()))
+        with self.state.lock:
+            self.state.bots[bot["id"]] = bot
+        self._send_json(bot)
+
+    def handle_get_bot(self, body, bot_id):
+        with self.state.lock:
+            bot = self.state.bots.setdefault(bot_id, {"id": bot_id, "name": "Metis stub bot", "enabled": True,
+                                                      "functions": []})
+        self._send_json(bot)
+
+    def handle_update_bot(self, body, bot_id):
+        with self.state.lock:
+            bot = self.state.bots.setdefault(bot_id, {"id": bot_id, "name": "Metis stub bot", "enabled": True})
+            bot.update(body)
+        self._send_json(bot)
+
+    def handle_delete_bot(self, body, bot_id):
+        with self.state.lock:
+            self.state.bots.pop(bot_id, None)
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def handle_stats(self, body):
+        with self.state.lock:
+            payload = {"sessions": len(self.state.sessions), "counters": dict(self.state.counters)}
+        self._send_json(payload)
+
+
+class MetisStubServer:
+    """Threaded stub server; `start()` runs it in a daemon thread, `serve_forever()` blocks."""
+
+    def __init__(self, config: MetisStubConfig = None, host='127.0.0.1', port=0):
+        self.httpd = ThreadingHTTPServer((host, port), MetisStubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub_config = config or MetisStubConfig()
+        self.httpd.stub_state = MetisStubState()
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    @property
+    def base_url(self):
+        host = self.httpd.server_address[0]
+        return f"http://{host}:{self.port}/api/v1"
+
+    @property
+    def state(self):
+        return self.httpd.stub_state
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='metis-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,232 @@
+# users_ai/metrics.py
+"""
+In-process metrics in the Prometheus text format, without extra dependencies.
+
+Every thread writes into its own shard (a plain dict only that thread mutates), so recording an observation
+takes no lock. The shards are merged only when /metrics is scraped. With several worker processes each process
+periodically dumps its totals to METRICS_MULTIPROC_DIR and the scrape adds up all the files there.
+"""
+import json
+import os
+import secrets
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'aiagent_http_request_duration_seconds': (
+        'histogram', 'Time spent handling a request, by view class.', LATENCY_BUCKETS),
+    'aiagent_http_request_size_bytes': ('histogram', 'Request body size, by view class.', SIZE_BUCKETS),
+    'aiagent_http_response_size_bytes': ('histogram', 'Response body size, by view class.', SIZE_BUCKETS),
+    'aiagent_db_queries_per_request': (
+        'histogram', 'Number of database queries run by one request, by view class.', QUERY_COUNT_BUCKETS),
+    'aiagent_db_query_seconds_per_request': (
+        'histogram', 'Total database time of one request, by view class.', LATENCY_BUCKETS),
+    'aiagent_metis_request_duration_seconds': (
+        'histogram', 'Duration of one HTTP call to Metis AI, by endpoint and outcome.', LATENCY_BUCKETS),
+}
+
+
+class _Shard:
+    __slots__ = ('thread', 'values')
+
+    def __init__(self, thread):
+        self.thread = thread
+        # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self.values = {}
+
+
+_local = threading.local()
+_shards = []
+_retired = {}  # totals of shards whose thread has exited
+_registry_lock = threading.Lock()
+_last_flush = 0.0
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = _Shard(threading.current_thread())
+        with _registry_lock:  # once per thread, not per observation
+            _shards.append(shard)
+    return shard
+
+
+def observe(name, value, **labels):
+    """Records one observation of histogram `name`. Lock-free: only the calling thread touches its shard."""
+    values = _shard().values
+    key = (name, tuple(sorted(labels.items())))
+    series = values.get(key)
+    if series is None:
+        buckets = METRICS[name][2]
+        series = values[key] = [0] * (len(buckets) + 1) + [0.0]
+    series[bisect_left(METRICS[name][2], value)] += 1
+    series[-1] += value
+
+
+def _merge_into(target, values):
+    for key, series in values:
+        current = target.get(key)
+        if current is None:
+            target[key] = list(series)
+        else:
+            for i, v in enumerate(series):
+                current[i] += v
+
+
+def collect():
+    """Merged totals of every thread of this process."""
+    merged = {}
+    with _registry_lock:
+        for shard in list(_shards):
+            while True:
+                try:
+                    items = [(key, list(series)) for key, series in list(shard.values.items())]
+                    break
+                except RuntimeError:  # the owner thread added a series while we were copying
+                    continue
+            if shard.thread.is_alive():
+                _merge_into(merged, items)
+            else:
+                # fold finished threads (runserver starts one per request) into a single dict
+                _merge_into(_retired, items)
+                _shards.remove(shard)
+        _merge_into(merged, [(key, list(series)) for key, series in _retired.items()])
+    return merged
+
+
+def _multiproc_dir():
+    return getattr(settings, 'METRICS_MULTIPROC_DIR', None)
+
+
+def _snapshot_path(directory, pid):
+    return os.path.join(directory, f'metrics_{pid}.json')
+
+
+def _gauges():
+    from .metis_ai_service import get_outbound_gate, get_pool_stats
+
+    gauges = []
+    for pool in get_pool_stats()['pools']:
+        labels = {'host': pool['host'], 'port': str(pool['port'])}
+        gauges.append(('aiagent_metis_pool_idle_connections', labels, pool['idle_connections']))
+        gauges.append(('aiagent_metis_pool_connections_opened', labels, pool['connections_opened']))
+        gauges.append(('aiagent_metis_pool_requests_sent', labels, pool['requests_sent']))
+    gate = get_outbound_gate().stats()
+    gauges.append(('aiagent_metis_gate_active', {}, gate['active']))
+    gauges.append(('aiagent_metis_gate_queued', {}, gate['queued']))
+    return gauges
+
+
+def flush(force=False):
+    """Writes this process' totals to METRICS_MULTIPROC_DIR (at most every METRICS_FLUSH_INTERVAL seconds)."""
+    global _last_flush
+    directory = _multiproc_dir()
+    if not directory:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < getattr(settings, 'METRICS_FLUSH_INTERVAL', 5.0):
+        return
+    _last_flush = now
+    snapshot = {
+        'histograms': [[name, labels, series] for (name, labels), series in collect().items()],
+        'gauges': _gauges(),
+    }
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.metrics_')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, _snapshot_path(directory, os.getpid()))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _collect_all_processes():
+    histograms = collect()
+    gauges = [(name, dict(labels, pid=str(os.getpid())), value) for name, labels, value in _gauges()]
+    directory = _multiproc_dir()
+    if not directory or not os.path.isdir(directory):
+        return histograms, gauges
+    own_pid = os.getpid()
+    for filename in os.listdir(directory):
+        if not (filename.startswith('metrics_') and filename.endswith('.json')):
+            continue
+        try:
+            pid = int(filename[len('metrics_'):-len('.json')])
+        except ValueError:
+            continue
+        if pid == own_pid:
+            continue  # our live totals are newer than our last dump
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        # histogram totals of exited workers are kept so the counters never go backwards
+        _merge_into(histograms, [((name, tuple(tuple(pair) for pair in labels)), series)
+                                 for name, labels, series in snapshot.get('histograms', [])])
+        if _pid_alive(pid):
+            gauges.extend((name, dict(labels, pid=str(pid)), value)
+                          for name, labels, value in snapshot.get('gauges', []))
+    return histograms, gauges
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (k + '="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+               for k, v in labels)
+    return '{' + ','.join(escaped) + '}'
+
+
+def render():
+    histograms, gauges = _collect_all_processes()
+    lines = []
+    for name, (metric_type, help_text, buckets) in METRICS.items():
+        series_for_metric = sorted((labels, series) for (n, labels), series in histograms.items() if n == name)
+        if not series_for_metric:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for labels, series in series_for_metric:
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), series[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", str(bound)),))} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {series[-1]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    seen = set()
+    for name, labels, value in sorted(gauges, key=lambda g: g[0]):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name}{_format_labels(tuple(sorted(labels.items())))} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Needs `Authorization: Bearer <METRICS_AUTH_TOKEN>`; without a token it is open only with METRICS_PUBLIC."""
+    token = getattr(settings, 'METRICS_AUTH_TOKEN', None)
+    if token:
+        if not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponseForbidden()
+    elif not getattr(settings, 'METRICS_PUBLIC', False):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
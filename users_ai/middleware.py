@@ -0,0 +1,179 @@
+# users_ai/middleware.py
+import math
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import JsonResponse
+
+from . import metrics, rate_limit
+
+# _QueryStats of the request being handled. A context variable rather than a wrapper on the request thread's
+# connection: sync_to_async runs the ORM calls of async views on other threads (with other connections) but
+# copies the context, so those queries are counted for the request too.
+_request_query_stats = ContextVar('request_query_stats', default=None)
+
+
+class _QueryStats:
+    """execute_wrapper that counts the queries of one request and sums their time."""
+
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def _count_request_query(execute, sql, params, many, context):
+    query_stats = _request_query_stats.get()
+    if query_stats is None:
+        return execute(sql, params, many, context)
+    return query_stats(execute, sql, params, many, context)
+
+
+def _install_query_counter(connection, **kwargs):
+    """Adds _count_request_query to a connection (of any thread) once; it stays across reconnects."""
+    if _count_request_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_request_query)
+
+
+connection_created.connect(_install_query_counter)
+
+
+class MetricsMiddleware:
+    """
+    Records, per view class: request latency, request/response body sizes and the number and total time of
+    database queries. Nothing is logged; the numbers are exposed by users_ai.metrics.metrics_view.
+    Queries run while a streaming body is being sent come after the request is recorded and are not counted.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        query_stats = _QueryStats()
+        started = time.perf_counter()
+        token = self._start_counting(query_stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_query_stats.reset(token)
+        self._record(request, response, time.perf_counter() - started, query_stats)
+        return response
+
+    async def __acall__(self, request):
+        query_stats = _QueryStats()
+        started = time.perf_counter()
+        token = self._start_counting(query_stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_query_stats.reset(token)
+        self._record(request, response, time.perf_counter() - started, query_stats)
+        return response
+
+    @staticmethod
+    def _start_counting(query_stats):
+        # connections opened before this module was imported missed connection_created
+        for connection in connections.all(initialized_only=True):
+            _install_query_counter(connection)
+        return _request_query_stats.set(query_stats)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        request._metrics_view_name = view_class.__name__ if view_class else view_func.__name__
+
+    def _record(self, request, response, elapsed, query_stats):
+        view = getattr(request, '_metrics_view_name', 'unmatched')
+        labels = {'view': view, 'method': request.method, 'status': f'{response.status_code // 100}xx'}
+        metrics.observe('aiagent_http_request_duration_seconds', elapsed, **labels)
+        metrics.observe('aiagent_http_request_size_bytes', int(request.META.get('CONTENT_LENGTH') or 0), view=view)
+        metrics.observe('aiagent_db_queries_per_request', query_stats.count, view=view)
+        metrics.observe('aiagent_db_query_seconds_per_request', query_stats.seconds, view=view)
+        if response.streaming:
+            # the body does not exist yet; count it as it is sent
+            response.streaming_content = self._count_streamed(response.streaming_content, view,
+                                                               response.is_async)
+        else:
+            metrics.observe('aiagent_http_response_size_bytes', len(response.content), view=view)
+        metrics.flush()
+
+    @staticmethod
+    def _count_streamed(content, view, is_async):
+        if is_async:
+            async def counted():
+                size = 0
+                try:
+                    async for chunk in content:
+                        size += len(chunk)
+                        yield chunk
+                finally:
+                    metrics.observe('aiagent_http_response_size_bytes', size, view=view)
+            return counted()
+
+        def counted():
+            size = 0
+            try:
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+            finally:
+                metrics.observe('aiagent_http_response_size_bytes', size, view=view)
+        return counted()
+
+
+class RateLimitMiddleware:
+    """
+    Rejects requests of a user whose token bucket (users_ai.rate_limit, limits from the user's role) is empty
+    with 429 and Retry-After, before any view, DB transaction or Metis call runs. Requests without a valid
+    access token pass through untouched; authentication rejects them later.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        rejection = self._check(request)
+        return rejection or self.get_response(request)
+
+    async def __acall__(self, request):
+        rejection = await sync_to_async(self._check)(request)
+        return rejection or await self.get_response(request)
+
+    def _check(self, request):
+        if not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+            return None
+        user_id = rate_limit.user_id_from_request(request)
+        if user_id is None:
+            return None
+        per_minute, burst = rate_limit.limits_for_user(user_id)
+        retry_after = rate_limit.consume(user_id, per_minute, burst)
+        if not retry_after:
+            return None
+        response = JsonResponse(
+            {'detail': 'تعداد درخواست‌های شما بیش از حد مجاز است. لطفاً کمی بعد دوباره تلاش کنید.'}, status=429)
+        response['Retry-After'] = str(math.ceil(retry_after))
+        return response
@@ -0,0 +1,720 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users_ai', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='airesponse',
+            options={'ordering': ['-created_at'], 'verbose_name': 'جلسه چت AI', 'verbose_name_plural': 'جلسات چت AI'},
+        ),
+        migrations.AlterModelOptions(
+            name='careereducation',
+            options={'verbose_name': 'اطلاعات شغلی و تحصیلی', 'verbose_name_plural': 'اطلاعات شغلی و تحصیلی'},
+        ),
+        migrations.AlterModelOptions(
+            name='environmentalcontext',
+            options={'verbose_name': 'زمینه محیطی', 'verbose_name_plural': 'زمینه\u200cهای محیطی'},
+        ),
+        migrations.AlterModelOptions(
+            name='feedbacklearning',
+            options={'verbose_name': 'بازخورد و یادگیری', 'verbose_name_plural': 'بازخوردها و یادگیری\u200cها'},
+        ),
+        migrations.AlterModelOptions(
+            name='financialinfo',
+            options={'verbose_name': 'اطلاعات مالی', 'verbose_name_plural': 'اطلاعات مالی'},
+        ),
+        migrations.AlterModelOptions(
+            name='goal',
+            options={'verbose_name': 'هدف', 'verbose_name_plural': 'اهداف'},
+        ),
+        migrations.AlterModelOptions(
+            name='habit',
+            options={'verbose_name': 'عادت', 'verbose_name_plural': 'عادات'},
+        ),
+        migrations.AlterModelOptions(
+            name='healthrecord',
+            options={'verbose_name': 'سابقه سلامت', 'verbose_name_plural': 'سوابق سلامت'},
+        ),
+        migrations.AlterModelOptions(
+            name='preferenceinterest',
+            options={'verbose_name': 'ترجیحات و علایق', 'verbose_name_plural': 'ترجیحات و علایق'},
+        ),
+        migrations.AlterModelOptions(
+            name='psychologicalprofile',
+            options={'verbose_name': 'پروفایل روانشناختی', 'verbose_name_plural': 'پروفایل\u200cهای روانشناختی'},
+        ),
+        migrations.AlterModelOptions(
+            name='realtimedata',
+            options={'verbose_name': 'داده بلادرنگ', 'verbose_name_plural': 'داده\u200cهای بلادرنگ'},
+        ),
+        migrations.AlterModelOptions(
+            name='socialrelationship',
+            options={'verbose_name': 'روابط اجتماعی', 'verbose_name_plural': 'روابط اجتماعی'},
+        ),
+        migrations.AlterModelOptions(
+            name='userprofile',
+            options={'verbose_name': 'پروفایل کاربر', 'verbose_name_plural': 'پروفایل\u200cهای کاربران'},
+        ),
+        migrations.AlterModelOptions(
+            name='userrole',
+            options={'verbose_name': 'نقش کاربر', 'verbose_name_plural': 'نقش\u200cهای کاربران'},
+        ),
+        migrations.RemoveField(
+            model_name='feedbacklearning',
+            name='interaction_frequency',
+        ),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='first_name',
+        ),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='last_name',
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='is_in_profile_setup',
+            field=models.BooleanField(default=False, help_text='مشخص می\u200cکند آیا کاربر در حال حاضر در مرحله تنظیم پروفایل (تست پویا) است یا خیر', verbose_name='در حال تنظیم پروفایل؟'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='last_form_submission_time',
+            field=models.DateTimeField(blank=True, help_text='آخرین زمان ارسال فرم اطلاعات جامع', null=True, verbose_name='آخرین زمان ارسال فرم'),
+        ),
+        migrations.AddField(
+            model_name='userrole',
+            name='description',
+            field=models.TextField(blank=True, null=True, verbose_name='توضیحات'),
+        ),
+        migrations.AddField(
+            model_name='userrole',
+            name='form_submission_interval_hours',
+            field=models.IntegerField(default=24, help_text='ساعت فاصله زمانی مجاز برای پر کردن مجدد فرم اطلاعات جامع توسط کاربر', verbose_name='فاصله ارسال فرم (ساعت)'),
+        ),
+        migrations.AddField(
+            model_name='userrole',
+            name='psych_test_duration_hours',
+            field=models.IntegerField(default=1, verbose_name='مدت زمان تست روانشناسی (ساعت)'),
+        ),
+        migrations.AddField(
+            model_name='userrole',
+            name='psych_test_message_limit',
+            field=models.IntegerField(default=5, verbose_name='محدودیت پیام تست روانشناسی'),
+        ),
+        migrations.AlterField(
+            model_name='airesponse',
+            name='ai_response_name',
+            field=models.CharField(default='New AI Chat Session', max_length=255, verbose_name='نام جلسه AI'),
+        ),
+        migrations.AlterField(
+            model_name='airesponse',
+            name='ai_session_id',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True, verbose_name='شناسه جلسه داخلی AI'),
+        ),
+        migrations.AlterField(
+            model_name='airesponse',
+            name='chat_history',
+            field=models.TextField(blank=True, null=True, verbose_name='تاریخچه چت (JSON)'),
+        ),
+        migrations.AlterField(
+            model_name='airesponse',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='زمان ایجاد'),
+        ),
+        migrations.AlterField(
+            model_name='airesponse',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='زمان انقضا'),
+        ),
+        migrations.AlterField(
+            model_name='airesponse',
+            name='is_active',
+            field=models.BooleanField(default=True, verbose_name='فعال است؟'),
+        ),
+        migrations.AlterField(
+            model_name='airesponse',
+            name='metis_session_id',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='شناسه جلسه متیس'),
+        ),
+        migrations.AlterField(
+            model_name='airesponse',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='زمان بروزرسانی'),
+        ),
+        migrations.AlterField(
+            model_name='airesponse',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ai_responses', to=settings.AUTH_USER_MODEL, verbose_name='کاربر'),
+        ),
+        migrations.AlterField(
+            model_name='careereducation',
+            name='career_goals',
+            field=models.TextField(blank=True, null=True, verbose_name='اهداف شغلی'),
+        ),
+        migrations.AlterField(
+            model_name='careereducation',
+            name='certifications',
+            field=models.TextField(blank=True, null=True, verbose_name='گواهینامه\u200cها'),
+        ),
+        migrations.AlterField(
+            model_name='careereducation',
+            name='education_level',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='سطح تحصیلات'),
+        ),
+        migrations.AlterField(
+            model_name='careereducation',
+            name='field_of_study',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='رشته تحصیلی'),
+        ),
+        migrations.AlterField(
+            model_name='careereducation',
+            name='industry',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='صنعت'),
+        ),
+        migrations.AlterField(
+            model_name='careereducation',
+            name='job_satisfaction',
+            field=models.IntegerField(blank=True, null=True, verbose_name='رضایت شغلی (1-10)'),
+        ),
+        migrations.AlterField(
+            model_name='careereducation',
+            name='job_title',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='عنوان شغلی'),
+        ),
+        migrations.AlterField(
+            model_name='careereducation',
+            name='learning_style',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='سبک یادگیری'),
+        ),
+        migrations.AlterField(
+            model_name='careereducation',
+            name='skills',
+            field=models.TextField(blank=True, null=True, verbose_name='مهارت\u200cها'),
+        ),
+        migrations.AlterField(
+            model_name='careereducation',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='career_education', to=settings.AUTH_USER_MODEL, verbose_name='کاربر'),
+        ),
+        migrations.AlterField(
+            model_name='careereducation',
+            name='work_hours',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True, verbose_name='ساعات کاری هفتگی'),
+        ),
+        migrations.AlterField(
+            model_name='environmentalcontext',
+            name='climate',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='آب و هوا'),
+        ),
+        migrations.AlterField(
+            model_name='environmentalcontext',
+            name='current_city',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='شهر فعلی'),
+        ),
+        migrations.AlterField(
+            model_name='environmentalcontext',
+            name='housing_type',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='نوع مسکن'),
+        ),
+        migrations.AlterField(
+            model_name='environmentalcontext',
+            name='life_events',
+            field=models.TextField(blank=True, null=True, verbose_name='رویدادهای مهم زندگی'),
+        ),
+        migrations.AlterField(
+            model_name='environmentalcontext',
+            name='tech_access',
+            field=models.TextField(blank=True, null=True, verbose_name='دسترسی به تکنولوژی'),
+        ),
+        migrations.AlterField(
+            model_name='environmentalcontext',
+            name='transportation',
+            field=models.TextField(blank=True, null=True, verbose_name='روش\u200cهای حمل و نقل'),
+        ),
+        migrations.AlterField(
+            model_name='environmentalcontext',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='environmental_context', to=settings.AUTH_USER_MODEL, verbose_name='کاربر'),
+        ),
+        migrations.AlterField(
+            model_name='feedbacklearning',
+            name='feedback_text',
+            field=models.TextField(blank=True, null=True, verbose_name='متن بازخورد'),
+        ),
+        migrations.AlterField(
+            model_name='feedbacklearning',
+            name='interaction_rating',
+            field=models.IntegerField(blank=True, null=True, verbose_name='امتیاز به تعامل'),
+        ),
+        migrations.AlterField(
+            model_name='feedbacklearning',
+            name='interaction_type',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='نوع تعامل'),
+        ),
+        migrations.AlterField(
+            model_name='feedbacklearning',
+            name='timestamp',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='زمان ثبت بازخورد'),
+        ),
+        migrations.AlterField(
+            model_name='feedbacklearning',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feedback_learnings', to=settings.AUTH_USER_MODEL, verbose_name='کاربر'),
+        ),
+        migrations.AlterField(
+            model_name='financialinfo',
+            name='budgeting_habits',
+            field=models.TextField(blank=True, null=True, verbose_name='عادات بودجه\u200cبندی'),
+        ),
+        migrations.AlterField(
+            model_name='financialinfo',
+            name='debts',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True, verbose_name='بدهی\u200cها'),
+        ),
+        migrations.AlterField(
+            model_name='financialinfo',
+            name='financial_goals',
+            field=models.TextField(blank=True, null=True, verbose_name='اهداف مالی'),
+        ),
+        migrations.AlterField(
+            model_name='financialinfo',
+            name='investment_types',
+            field=models.TextField(blank=True, null=True, verbose_name='انواع سرمایه\u200cگذاری'),
+        ),
+        migrations.AlterField(
+            model_name='financialinfo',
+            name='monthly_expenses',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True, verbose_name='هزینه\u200cهای ماهانه'),
+        ),
+        migrations.AlterField(
+            model_name='financialinfo',
+            name='monthly_income',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True, verbose_name='درآمد ماهانه'),
+        ),
+        migrations.AlterField(
+            model_name='financialinfo',
+            name='risk_tolerance',
+            field=models.CharField(blank=True, max_length=50, null=True, verbose_name='تحمل ریسک'),
+        ),
+        migrations.AlterField(
+            model_name='financialinfo',
+            name='savings',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True, verbose_name='پس\u200cانداز'),
+        ),
+        migrations.AlterField(
+            model_name='financialinfo',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='financial_info', to=settings.AUTH_USER_MODEL, verbose_name='کاربر'),
+        ),
+        migrations.AlterField(
+            model_name='goal',
+            name='deadline',
+            field=models.DateField(blank=True, null=True, verbose_name='مهلت'),
+        ),
+        migrations.AlterField(
+            model_name='goal',
+            name='description',
+            field=models.TextField(blank=True, null=True, verbose_name='شرح هدف'),
+        ),
+        migrations.AlterField(
+            model_name='goal',
+            name='goal_type',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='نوع هدف'),
+        ),
+        migrations.AlterField(
+            model_name='goal',
+            name='priority',
+            field=models.IntegerField(blank=True, null=True, verbose_name='اولویت'),
+        ),
+        migrations.AlterField(
+            model_name='goal',
+            name='progress',
+            field=models.DecimalField(blank=True, decimal_places=2, default=0.0, max_digits=5, null=True, verbose_name='درصد پیشرفت'),
+        ),
+        migrations.AlterField(
+            model_name='goal',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='goals', to=settings.AUTH_USER_MODEL, verbose_name='کاربر'),
+        ),
+        migrations.AlterField(
+            model_name='habit',
+            name='duration',
+            field=models.IntegerField(blank=True, help_text='به دقیقه', null=True, verbose_name='مدت زمان (دقیقه)'),
+        ),
+        migrations.AlterField(
+            model_name='habit',
+            name='frequency',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='فرکانس'),
+        ),
+        migrations.AlterField(
+            model_name='habit',
+            name='habit_name',
+            field=models.CharField(default='عادت تعریف نشده', max_length=255, verbose_name='نام عادت'),
+        ),
+        migrations.AlterField(
+            model_name='habit',
+            name='start_date',
+            field=models.DateField(blank=True, null=True, verbose_name='تاریخ شروع'),
+        ),
+        migrations.AlterField(
+            model_name='habit',
+            name='success_rate',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True, verbose_name='درصد موفقیت'),
+        ),
+        migrations.AlterField(
+            model_name='habit',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='habits', to=settings.AUTH_USER_MODEL, verbose_name='کاربر'),
+        ),
+        migrations.AlterField(
+            model_name='healthrecord',
+            name='allergies',
+            field=models.TextField(blank=True, null=True, verbose_name='آلرژی\u200cها'),
+        ),
+        migrations.AlterField(
+            model_name='healthrecord',
+            name='bmi',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True, verbose_name='شاخص توده بدنی (BMI)'),
+        ),
+        migrations.AlterField(
+            model_name='healthrecord',
+            name='chronic_conditions',
+            field=models.TextField(blank=True, null=True, verbose_name='بیماری\u200cهای مزمن'),
+        ),
+        migrations.AlterField(
+            model_name='healthrecord',
+            name='daily_calorie_intake',
+            field=models.IntegerField(blank=True, null=True, verbose_name='کالری دریافتی روزانه'),
+        ),
+        migrations.AlterField(
+            model_name='healthrecord',
+            name='diet_type',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='نوع رژیم غذایی'),
+        ),
+        migrations.AlterField(
+            model_name='healthrecord',
+            name='height',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True, verbose_name='قد (سانتی\u200cمتر)'),
+        ),
+        migrations.AlterField(
+            model_name='healthrecord',
+            name='last_checkup_date',
+            field=models.DateField(blank=True, null=True, verbose_name='تاریخ آخرین چکاپ'),
+        ),
+        migrations.AlterField(
+            model_name='healthrecord',
+            name='medical_history',
+            field=models.TextField(blank=True, null=True, verbose_name='تاریخچه پزشکی'),
+        ),
+        migrations.AlterField(
+            model_name='healthrecord',
+            name='medications',
+            field=models.TextField(blank=True, null=True, verbose_name='داروهای مصرفی'),
+        ),
+        migrations.AlterField(
+            model_name='healthrecord',
+            name='mental_health_status',
+            field=models.TextField(blank=True, null=True, verbose_name='وضعیت سلامت روان'),
+        ),
+        migrations.AlterField(
+            model_name='healthrecord',
+            name='physical_activity_level',
+            field=models.CharField(blank=True, max_length=50, null=True, verbose_name='سطح فعالیت بدنی'),
+        ),
+        migrations.AlterField(
+            model_name='healthrecord',
+            name='sleep_hours',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=4, null=True, verbose_name='ساعات خواب'),
+        ),
+        migrations.AlterField(
+            model_name='healthrecord',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='health_record', to=settings.AUTH_USER_MODEL, verbose_name='کاربر'),
+        ),
+        migrations.AlterField(
+            model_name='healthrecord',
+            name='weight',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True, verbose_name='وزن (کیلوگرم)'),
+        ),
+        migrations.AlterField(
+            model_name='preferenceinterest',
+            name='favorite_movies',
+            field=models.TextField(blank=True, null=True, verbose_name='فیلم\u200cهای موردعلاقه'),
+        ),
+        migrations.AlterField(
+            model_name='preferenceinterest',
+            name='favorite_music_genres',
+            field=models.TextField(blank=True, null=True, verbose_name='ژانرهای موسیقی موردعلاقه'),
+        ),
+        migrations.AlterField(
+            model_name='preferenceinterest',
+            name='food_preferences',
+            field=models.TextField(blank=True, null=True, verbose_name='ترجیحات غذایی'),
+        ),
+        migrations.AlterField(
+            model_name='preferenceinterest',
+            name='hobbies',
+            field=models.TextField(blank=True, null=True, verbose_name='سرگرمی\u200cها'),
+        ),
+        migrations.AlterField(
+            model_name='preferenceinterest',
+            name='lifestyle_choices',
+            field=models.TextField(blank=True, null=True, verbose_name='انتخاب\u200cهای سبک زندگی'),
+        ),
+        migrations.AlterField(
+            model_name='preferenceinterest',
+            name='movie_fav_choices',
+            field=models.TextField(blank=True, null=True, verbose_name='فیلم\u200cهای سینمایی مورد علاقه (لیست)'),
+        ),
+        migrations.AlterField(
+            model_name='preferenceinterest',
+            name='reading_preferences',
+            field=models.TextField(blank=True, null=True, verbose_name='ترجیحات مطالعه'),
+        ),
+        migrations.AlterField(
+            model_name='preferenceinterest',
+            name='travel_preferences',
+            field=models.TextField(blank=True, null=True, verbose_name='ترجیحات سفر'),
+        ),
+        migrations.AlterField(
+            model_name='preferenceinterest',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='preference_interest', to=settings.AUTH_USER_MODEL, verbose_name='کاربر'),
+        ),
+        migrations.AlterField(
+            model_name='psychologicalprofile',
+            name='core_values',
+            field=models.TextField(blank=True, null=True, verbose_name='ارزش\u200cهای اصلی'),
+        ),
+        migrations.AlterField(
+            model_name='psychologicalprofile',
+            name='decision_making_style',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='سبک تصمیم\u200cگیری'),
+        ),
+        migrations.AlterField(
+            model_name='psychologicalprofile',
+            name='emotional_triggers',
+            field=models.TextField(blank=True, null=True, verbose_name='محرک\u200cهای احساسی'),
+        ),
+        migrations.AlterField(
+            model_name='psychologicalprofile',
+            name='motivations',
+            field=models.TextField(blank=True, null=True, verbose_name='انگیزه\u200cها'),
+        ),
+        migrations.AlterField(
+            model_name='psychologicalprofile',
+            name='personality_type',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='تیپ شخصیتی'),
+        ),
+        migrations.AlterField(
+            model_name='psychologicalprofile',
+            name='preferred_communication',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='سبک ارتباطی ترجیحی'),
+        ),
+        migrations.AlterField(
+            model_name='psychologicalprofile',
+            name='resilience_level',
+            field=models.CharField(blank=True, max_length=50, null=True, verbose_name='سطح تاب\u200cآوری'),
+        ),
+        migrations.AlterField(
+            model_name='psychologicalprofile',
+            name='stress_response',
+            field=models.TextField(blank=True, null=True, verbose_name='واکنش به استرس'),
+        ),
+        migrations.AlterField(
+            model_name='psychologicalprofile',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='psychological_profile', to=settings.AUTH_USER_MODEL, verbose_name='کاربر'),
+        ),
+        migrations.AlterField(
+            model_name='realtimedata',
+            name='current_activity',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='فعالیت فعلی'),
+        ),
+        migrations.AlterField(
+            model_name='realtimedata',
+            name='current_location',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='مکان فعلی'),
+        ),
+        migrations.AlterField(
+            model_name='realtimedata',
+            name='current_mood',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='حال فعلی'),
+        ),
+        migrations.AlterField(
+            model_name='realtimedata',
+            name='daily_schedule',
+            field=models.TextField(blank=True, null=True, verbose_name='برنامه روزانه'),
+        ),
+        migrations.AlterField(
+            model_name='realtimedata',
+            name='heart_rate',
+            field=models.IntegerField(blank=True, null=True, verbose_name='ضربان قلب'),
+        ),
+        migrations.AlterField(
+            model_name='realtimedata',
+            name='timestamp',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='زمان ثبت'),
+        ),
+        migrations.AlterField(
+            model_name='realtimedata',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='real_time_data', to=settings.AUTH_USER_MODEL, verbose_name='کاربر'),
+        ),
+        migrations.AlterField(
+            model_name='socialrelationship',
+            name='communication_style',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='سبک ارتباطی'),
+        ),
+        migrations.AlterField(
+            model_name='socialrelationship',
+            name='conflict_resolution',
+            field=models.TextField(blank=True, null=True, verbose_name='روش حل تعارض'),
+        ),
+        migrations.AlterField(
+            model_name='socialrelationship',
+            name='emotional_needs',
+            field=models.TextField(blank=True, null=True, verbose_name='نیازهای عاطفی'),
+        ),
+        migrations.AlterField(
+            model_name='socialrelationship',
+            name='key_relationships',
+            field=models.TextField(blank=True, null=True, verbose_name='روابط کلیدی'),
+        ),
+        migrations.AlterField(
+            model_name='socialrelationship',
+            name='relationship_status',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='وضعیت رابطه عاطفی'),
+        ),
+        migrations.AlterField(
+            model_name='socialrelationship',
+            name='social_frequency',
+            field=models.CharField(blank=True, max_length=50, null=True, verbose_name='میزان تعاملات اجتماعی'),
+        ),
+        migrations.AlterField(
+            model_name='socialrelationship',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='social_relationship', to=settings.AUTH_USER_MODEL, verbose_name='کاربر'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='age',
+            field=models.IntegerField(blank=True, null=True, verbose_name='سن'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='ai_psychological_test',
+            field=models.TextField(blank=True, null=True, verbose_name='نتیجه تست روانشناسی AI'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='زمان ایجاد'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='cultural_background',
+            field=models.TextField(blank=True, null=True, verbose_name='پیشینه فرهنگی'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='gender',
+            field=models.CharField(blank=True, max_length=50, null=True, verbose_name='جنسیت'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='languages',
+            field=models.TextField(blank=True, null=True, verbose_name='زبان\u200cها'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='last_message_date',
+            field=models.DateField(blank=True, null=True, verbose_name='تاریخ آخرین پیام'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='location',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='مکان'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='marital_status',
+            field=models.CharField(blank=True, max_length=50, null=True, verbose_name='وضعیت تأهل'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='messages_sent_today',
+            field=models.IntegerField(default=0, verbose_name='پیام\u200cهای ارسالی امروز'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='nationality',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='ملیت'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='role',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='users_ai.userrole', verbose_name='نقش کاربر'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='زمان بروزرسانی'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='profile', to=settings.AUTH_USER_MODEL, verbose_name='کاربر'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='user_information_summary',
+            field=models.TextField(blank=True, null=True, verbose_name='خلاصه اطلاعات کاربر توسط AI'),
+        ),
+        migrations.AlterField(
+            model_name='userrole',
+            name='daily_message_limit',
+            field=models.IntegerField(default=50, verbose_name='محدودیت پیام روزانه'),
+        ),
+        migrations.AlterField(
+            model_name='userrole',
+            name='max_active_sessions',
+            field=models.IntegerField(default=1, verbose_name='حداکثر جلسات فعال'),
+        ),
+        migrations.AlterField(
+            model_name='userrole',
+            name='name',
+            field=models.CharField(max_length=100, unique=True, verbose_name='نام نقش'),
+        ),
+        migrations.AlterField(
+            model_name='userrole',
+            name='session_duration_hours',
+            field=models.IntegerField(default=24, verbose_name='مدت زمان اعتبار جلسه (ساعت)'),
+        ),
+        migrations.CreateModel(
+            name='PsychTestHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('test_name', models.CharField(max_length=255, verbose_name='نام تست')),
+                ('test_date', models.DateTimeField(auto_now_add=True, verbose_name='تاریخ انجام تست')),
+                ('test_result_summary', models.TextField(blank=True, null=True, verbose_name='خلاصه نتایج تست')),
+                ('full_test_data', models.JSONField(blank=True, null=True, verbose_name='داده\u200cهای کامل تست (JSON)')),
+                ('ai_analysis', models.TextField(blank=True, null=True, verbose_name='تحلیل AI از نتایج')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='psych_test_history', to=settings.AUTH_USER_MODEL, verbose_name='کاربر')),
+            ],
+            options={
+                'verbose_name': 'تاریخچه تست روانشناسی',
+                'verbose_name_plural': 'تاریخچه\u200cهای تست روانشناسی',
+                'ordering': ['-test_date'],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:34
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users_ai', '0002_sync_model_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('client_request_id', models.CharField(blank=True, max_length=64, null=True, verbose_name='شناسه درخواست سمت کلاینت')),
+                ('message', models.TextField(verbose_name='پیام کاربر')),
+                ('session_id', models.CharField(blank=True, max_length=255, null=True, verbose_name='شناسه جلسه ارسالی')),
+                ('status', models.CharField(choices=[('queued', 'در صف'), ('running', 'در حال پردازش'), ('succeeded', 'انجام شد'), ('failed', 'ناموفق')], default='queued', max_length=16, verbose_name='وضعیت')),
+                ('http_status', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='کد وضعیت پاسخ')),
+                ('result', models.TextField(blank=True, null=True, verbose_name='پاسخ (JSON)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='زمان ایجاد')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='زمان شروع')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='زمان پایان')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_jobs', to=settings.AUTH_USER_MODEL, verbose_name='کاربر')),
+            ],
+            options={
+                'verbose_name': 'کار چت',
+                'verbose_name_plural': 'کارهای چت',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='chat_job_status_created_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'client_request_id'), name='unique_chat_job_client_request')],
+            },
+        ),
+    ]
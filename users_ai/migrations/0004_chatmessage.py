@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users_ai', '0003_chatjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField(verbose_name='ترتیب')),
+                ('role', models.CharField(max_length=20, verbose_name='نقش')),
+                ('content', models.TextField(verbose_name='متن پیام')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='زمان')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='users_ai.airesponse', verbose_name='جلسه چت')),
+            ],
+            options={
+                'verbose_name': 'پیام چت',
+                'verbose_name_plural': 'پیام\u200cهای چت',
+                'ordering': ['session', 'sequence'],
+                'constraints': [models.UniqueConstraint(fields=('session', 'sequence'), name='unique_chat_message_sequence')],
+            },
+        ),
+    ]
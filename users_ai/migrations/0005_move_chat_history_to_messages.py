@@ -0,0 +1,48 @@
+import json
+
+from django.db import migrations
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+def move_chat_history_to_messages(apps, schema_editor):
+    AiResponse = apps.get_model('users_ai', 'AiResponse')
+    ChatMessage = apps.get_model('users_ai', 'ChatMessage')
+    sessions = AiResponse.objects.exclude(chat_history__isnull=True).exclude(chat_history='')
+    for session in sessions.only('id', 'chat_history', 'created_at').iterator(chunk_size=200):
+        try:
+            history = json.loads(session.chat_history)
+        except json.JSONDecodeError:
+            history = []
+        messages = []
+        for sequence, entry in enumerate(history if isinstance(history, list) else [], start=1):
+            created_at = parse_datetime(entry.get('timestamp') or '') or session.created_at or timezone.now()
+            messages.append(ChatMessage(session_id=session.id, sequence=sequence, role=entry.get('role', ''),
+                                        content=entry.get('content') or '', created_at=created_at))
+        ChatMessage.objects.bulk_create(messages, batch_size=500)
+        AiResponse.objects.filter(pk=session.pk).update(chat_history=None)
+
+
+def move_messages_to_chat_history(apps, schema_editor):
+    AiResponse = apps.get_model('users_ai', 'AiResponse')
+    ChatMessage = apps.get_model('users_ai', 'ChatMessage')
+    session_ids = ChatMessage.objects.values_list('session_id', flat=True).distinct()
+    for session_id in session_ids.iterator():
+        history = [
+            {"role": role, "content": content, "timestamp": created_at.isoformat()}
+            for role, content, created_at in ChatMessage.objects.filter(session_id=session_id)
+            .order_by('sequence').values_list('role', 'content', 'created_at')
+        ]
+        AiResponse.objects.filter(pk=session_id).update(chat_history=json.dumps(history, ensure_ascii=False))
+    ChatMessage.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users_ai', '0004_chatmessage'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_chat_history_to_messages, move_messages_to_chat_history),
+    ]
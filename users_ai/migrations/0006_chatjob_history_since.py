@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users_ai', '0005_move_chat_history_to_messages'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatjob',
+            name='history_since',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='ترتیب آخرین پیام دریافتی کلاینت'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users_ai', '0006_chatjob_history_since'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='airesponse',
+            index=models.Index(fields=['user', 'is_active', '-created_at', '-id'], name='ai_session_user_list_idx'),
+        ),
+    ]
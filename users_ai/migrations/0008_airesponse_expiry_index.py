@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users_ai', '0007_airesponse_user_list_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='airesponse',
+            index=models.Index(fields=['is_active', 'expires_at'], name='ai_session_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:47
+
+from django.db import migrations, models
+
+
+def mark_profile_setup_sessions(apps, schema_editor):
+    AiResponse = apps.get_model('users_ai', 'AiResponse')
+    # before session_type existed, setup sessions were only recognisable by the name the chat view gave them
+    AiResponse.objects.filter(ai_response_name__startswith='Profile Setup - ').update(session_type='profile_setup')
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users_ai', '0008_airesponse_expiry_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='airesponse',
+            name='session_type',
+            field=models.CharField(choices=[('chat', 'چت عادی'), ('profile_setup', 'تکمیل پروفایل')], default='chat', max_length=20, verbose_name='نوع جلسه'),
+        ),
+        migrations.AddField(
+            model_name='chatjob',
+            name='new_session',
+            field=models.BooleanField(default=False, verbose_name='درخواست جلسه جدید'),
+        ),
+        migrations.RunPython(mark_profile_setup_sessions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_profile_counters(apps, schema_editor):
+    UserProfile = apps.get_model('users_ai', 'UserProfile')
+    DailyMessageCounter = apps.get_model('users_ai', 'DailyMessageCounter')
+    profiles = UserProfile.objects.filter(last_message_date__isnull=False, messages_sent_today__gt=0)
+    DailyMessageCounter.objects.bulk_create(
+        [DailyMessageCounter(user_id=user_id, day=day, count=count) for user_id, day, count in
+         profiles.values_list('user_id', 'last_message_date', 'messages_sent_today').iterator()],
+        batch_size=500)
+
+
+def copy_counters_to_profiles(apps, schema_editor):
+    UserProfile = apps.get_model('users_ai', 'UserProfile')
+    DailyMessageCounter = apps.get_model('users_ai', 'DailyMessageCounter')
+    for counter in DailyMessageCounter.objects.order_by('user_id', '-day').iterator():
+        # the first row per user is the latest day; later ones are skipped by the last_message_date check
+        UserProfile.objects.filter(user_id=counter.user_id, last_message_date__isnull=True).update(
+            last_message_date=counter.day, messages_sent_today=counter.count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users_ai', '0009_airesponse_session_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyMessageCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='روز')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='تعداد پیام')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='message_counters', to=settings.AUTH_USER_MODEL, verbose_name='کاربر')),
+            ],
+            options={
+                'verbose_name': 'شمارنده پیام روزانه',
+                'verbose_name_plural': 'شمارنده\u200cهای پیام روزانه',
+                'constraints': [models.UniqueConstraint(fields=('user', 'day'), name='unique_daily_message_counter')],
+            },
+        ),
+        migrations.RunPython(copy_profile_counters, copy_counters_to_profiles),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='last_message_date',
+        ),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='messages_sent_today',
+        ),
+    ]
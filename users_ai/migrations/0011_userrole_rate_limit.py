@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users_ai', '0010_dailymessagecounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userrole',
+            name='rate_limit_burst',
+            field=models.IntegerField(default=10, help_text='تعداد درخواست\u200cهایی که می\u200cتوانند پشت سر هم ارسال شوند', verbose_name='ظرفیت درخواست\u200cهای پیاپی'),
+        ),
+        migrations.AddField(
+            model_name='userrole',
+            name='rate_limit_per_minute',
+            field=models.IntegerField(default=60, help_text='0 یعنی بدون محدودیت', verbose_name='حداکثر درخواست در دقیقه'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users_ai', '0011_userrole_rate_limit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatjob',
+            name='requeued_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='زمان ارسال دوباره به صف'),
+        ),
+    ]
@@ -1,10 +1,11 @@
 # users_ai/models.py
 import json
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.utils import timezone
 from django.conf import settings
 from datetime import timedelta  # Import timedelta
+from django.utils.functional import cached_property
 import uuid  # <--- این خط را اضافه کنید
 import logging # <--- این خط را اضافه کنید
 
@@ -81,6 +82,11 @@ class UserRole(models.Model):
     form_submission_interval_hours = models.IntegerField(default=24,
                                                          help_text="ساعت فاصله زمانی مجاز برای پر کردن مجدد فرم اطلاعات جامع توسط کاربر",
                                                          verbose_name='فاصله ارسال فرم (ساعت)')
+    # Request rate limit of users with this role (users_ai.rate_limit); 0 turns it off
+    rate_limit_per_minute = models.IntegerField(default=60, help_text="0 یعنی بدون محدودیت",
+                                                verbose_name='حداکثر درخواست در دقیقه')
+    rate_limit_burst = models.IntegerField(default=10, help_text="تعداد درخواست‌هایی که می‌توانند پشت سر هم ارسال شوند",
+                                           verbose_name='ظرفیت درخواست‌های پیاپی')
 
     def __str__(self):
         return self.name
@@ -115,8 +121,7 @@ class UserProfile(models.Model):
     user_information_summary = models.TextField(blank=True, null=True, verbose_name='خلاصه اطلاعات کاربر توسط AI')
 
     role = models.ForeignKey(UserRole, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='نقش کاربر')
-    messages_sent_today = models.IntegerField(default=0, verbose_name='پیام‌های ارسالی امروز')
-    last_message_date = models.DateField(blank=True, null=True, verbose_name='تاریخ آخرین پیام')
+    # messages_sent_today / last_message_date are derived from DailyMessageCounter (see the properties below)
 
     # Fields for new dynamic test/profile setup flow
     last_form_submission_time = models.DateTimeField(null=True, blank=True,
@@ -126,6 +131,20 @@ class UserProfile(models.Model):
                                               help_text="مشخص می‌کند آیا کاربر در حال حاضر در مرحله تنظیم پروفایل (تست پویا) است یا خیر",
                                               verbose_name='در حال تنظیم پروفایل؟')
 
+    @property
+    def messages_sent_today(self):
+        counter = self._latest_message_counter
+        return counter.count if counter and counter.day == timezone.localdate() else 0
+
+    @property
+    def last_message_date(self):
+        counter = self._latest_message_counter
+        return counter.day if counter else None
+
+    @cached_property
+    def _latest_message_counter(self):
+        return DailyMessageCounter.objects.filter(user_id=self.user_id).order_by('-day').first()
+
     def __str__(self):
         return f"Profile of {self.user.phone_number}"
 
@@ -362,37 +381,67 @@ class Habit(models.Model):
         verbose_name_plural = 'عادات'
 
 
+class AiResponseQuerySet(models.QuerySet):
+    def live(self, now=None):
+        """Active sessions that have not expired (the expire_ai_sessions sweeper flags expired ones later)."""
+        now = now or timezone.now()
+        return self.filter(models.Q(expires_at__isnull=True) | models.Q(expires_at__gt=now), is_active=True)
+
+    def expired(self, now=None):
+        """Sessions still flagged active whose expires_at has passed."""
+        return self.filter(is_active=True, expires_at__lte=now or timezone.now())
+
+
 class AiResponse(models.Model):
+    TYPE_CHAT = 'chat'
+    TYPE_PROFILE_SETUP = 'profile_setup'
+    TYPE_CHOICES = [
+        (TYPE_CHAT, 'چت عادی'),
+        (TYPE_PROFILE_SETUP, 'تکمیل پروفایل'),
+    ]
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='ai_responses',
                              verbose_name='کاربر')
     ai_session_id = models.CharField(max_length=255, unique=True, null=True, blank=True,
                                      verbose_name='شناسه جلسه داخلی AI')
     metis_session_id = models.CharField(max_length=255, null=True, blank=True, verbose_name='شناسه جلسه متیس')
     ai_response_name = models.CharField(max_length=255, default="New AI Chat Session", verbose_name='نام جلسه AI')
+    # Legacy JSON blob; messages are stored in ChatMessage (migrated by 0005_move_chat_history_to_messages)
     chat_history = models.TextField(blank=True, null=True, verbose_name='تاریخچه چت (JSON)')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='زمان ایجاد')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='زمان بروزرسانی')
     expires_at = models.DateTimeField(null=True, blank=True, verbose_name='زمان انقضا')
     is_active = models.BooleanField(default=True, verbose_name='فعال است؟')
-
-    def get_chat_history(self):
-        if self.chat_history:
-            try:
-                return json.loads(self.chat_history)
-            except json.JSONDecodeError:
-                logger.error(f"Failed to decode chat_history for AiResponse ID {self.pk}")
-                return []
-        return []
+    session_type = models.CharField(max_length=20, choices=TYPE_CHOICES, default=TYPE_CHAT,
+                                    verbose_name='نوع جلسه')
+
+    objects = AiResponseQuerySet.as_manager()
+
+    def get_chat_history(self, after=None, before=None, limit=None, include_system=True):
+        """
+        Messages in order, as [{"role", "content", "timestamp", "sequence"}, ...]. `after` and `before` are
+        exclusive sequence bounds. With `limit` the window ends at the newest matching message unless `after`
+        is given, in which case it starts right after it.
+        """
+        messages = self.messages.all()
+        if not include_system:
+            messages = messages.exclude(role='system')
+        if after is not None:
+            messages = messages.filter(sequence__gt=after)
+        if before is not None:
+            messages = messages.filter(sequence__lt=before)
+        if limit is not None and after is None:
+            rows = list(messages.order_by('-sequence')[:limit])[::-1]
+        else:
+            rows = list(messages.order_by('sequence')[:limit] if limit is not None else messages.order_by('sequence'))
+        return [message.as_dict() for message in rows]
 
     def add_to_chat_history(self, role, content):
-        history = self.get_chat_history()
-        history.append({
-            "role": role,
-            "content": content,
-            "timestamp": timezone.now().isoformat()
-        })
-        self.chat_history = json.dumps(history, ensure_ascii=False)
-        # self.save() # Defer save to the view to avoid multiple saves per request
+        """Appends one message with a single INSERT (the session must already be saved)."""
+        if self._last_sequence is None:
+            self._last_sequence = self.messages.aggregate(last=models.Max('sequence'))['last'] or 0
+        self._last_sequence += 1
+        return ChatMessage.objects.create(session=self, sequence=self._last_sequence, role=role, content=content)
 
     def save(self, *args, **kwargs):
         if not self.ai_session_id:  # Generate an internal session ID if not provided
@@ -405,6 +454,10 @@ class AiResponse(models.Model):
                 self.expires_at = timezone.now() + timedelta(hours=duration_hours)
         super().save(*args, **kwargs)
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._last_sequence = None  # highest ChatMessage.sequence, looked up on the first append
+
     def __str__(self):
         return f"AI Chat Session {self.ai_session_id or self.pk} for {self.user.phone_number}"
 
@@ -412,6 +465,143 @@ class AiResponse(models.Model):
         verbose_name = 'جلسه چت AI'
         verbose_name_plural = 'جلسات چت AI'
         ordering = ['-created_at']
+        indexes = [
+            # session list: keyset pagination over the user's active sessions
+            models.Index(fields=['user', 'is_active', '-created_at', '-id'], name='ai_session_user_list_idx'),
+            # expire_ai_sessions sweeper
+            models.Index(fields=['is_active', 'expires_at'], name='ai_session_expiry_idx'),
+        ]
+
+
+class DailyMessageCounter(models.Model):
+    """
+    Messages a user sent on one (local) day. A new day is simply a new row, so there is no reset step, and
+    increments are a single UPDATE ... SET count = count + 1 that never touches the UserProfile row.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='message_counters',
+                             verbose_name='کاربر')
+    day = models.DateField(verbose_name='روز')
+    count = models.PositiveIntegerField(default=0, verbose_name='تعداد پیام')
+
+    @classmethod
+    def count_for(cls, user_id, day=None):
+        day = day or timezone.localdate()
+        return cls.objects.filter(user_id=user_id, day=day).values_list('count', flat=True).first() or 0
+
+    @classmethod
+    def increment(cls, user_id, day=None):
+        """Atomically adds one message to the user's counter of `day` (today by default), creating it if needed."""
+        day = day or timezone.localdate()
+        if cls.objects.filter(user_id=user_id, day=day).update(count=models.F('count') + 1):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(user_id=user_id, day=day, count=1)
+        except IntegrityError:  # a concurrent request created today's row first
+            cls.objects.filter(user_id=user_id, day=day).update(count=models.F('count') + 1)
+
+    def __str__(self):
+        return f"{self.count} messages of user {self.user_id} on {self.day}"
+
+    class Meta:
+        verbose_name = 'شمارنده پیام روزانه'
+        verbose_name_plural = 'شمارنده‌های پیام روزانه'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_daily_message_counter'),
+        ]
+
+
+class ChatMessage(models.Model):
+    """One chat message of an AiResponse session; `sequence` numbers the messages of a session from 1."""
+    session = models.ForeignKey(AiResponse, on_delete=models.CASCADE, related_name='messages',
+                                verbose_name='جلسه چت')
+    sequence = models.PositiveIntegerField(verbose_name='ترتیب')
+    role = models.CharField(max_length=20, verbose_name='نقش')
+    content = models.TextField(verbose_name='متن پیام')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='زمان')
+
+    def as_dict(self):
+        return {
+            "role": self.role,
+            "content": self.content,
+            "timestamp": self.created_at.isoformat(),
+            "sequence": self.sequence,
+        }
+
+    def __str__(self):
+        return f"{self.role} #{self.sequence} in session {self.session_id}"
+
+    class Meta:
+        verbose_name = 'پیام چت'
+        verbose_name_plural = 'پیام‌های چت'
+        ordering = ['session', 'sequence']
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'sequence'], name='unique_chat_message_sequence'),
+        ]
+
+
+class ChatJob(models.Model):
+    """A chat message accepted in job mode; a background worker does the Metis round-trip and stores the reply."""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'در صف'),
+        (STATUS_RUNNING, 'در حال پردازش'),
+        (STATUS_SUCCEEDED, 'انجام شد'),
+        (STATUS_FAILED, 'ناموفق'),
+    ]
+    FINISHED_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED)
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='chat_jobs',
+                             verbose_name='کاربر')
+    client_request_id = models.CharField(max_length=64, null=True, blank=True,
+                                         verbose_name='شناسه درخواست سمت کلاینت')
+    message = models.TextField(verbose_name='پیام کاربر')
+    session_id = models.CharField(max_length=255, null=True, blank=True, verbose_name='شناسه جلسه ارسالی')
+    history_since = models.PositiveIntegerField(null=True, blank=True, verbose_name='ترتیب آخرین پیام دریافتی کلاینت')
+    new_session = models.BooleanField(default=False, verbose_name='درخواست جلسه جدید')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED, verbose_name='وضعیت')
+    http_status = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name='کد وضعیت پاسخ')
+    result = models.TextField(blank=True, null=True, verbose_name='پاسخ (JSON)')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='زمان ایجاد')
+    requeued_at = models.DateTimeField(null=True, blank=True, verbose_name='زمان ارسال دوباره به صف')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='زمان شروع')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='زمان پایان')
+
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED_STATUSES
+
+    def get_result(self):
+        if self.result:
+            try:
+                return json.loads(self.result)
+            except json.JSONDecodeError:
+                logger.error("Failed to decode result for ChatJob %s", self.pk)
+        return None
+
+    def set_result(self, http_status, data):
+        self.http_status = http_status
+        self.result = json.dumps(data, ensure_ascii=False, default=str)
+        self.status = self.STATUS_SUCCEEDED if http_status < 400 else self.STATUS_FAILED
+        self.finished_at = timezone.now()
+
+    def __str__(self):
+        return f"Chat job {self.pk} ({self.status}) for {self.user.phone_number}"
+
+    class Meta:
+        verbose_name = 'کار چت'
+        verbose_name_plural = 'کارهای چت'
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'client_request_id'], name='unique_chat_job_client_request'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='chat_job_status_created_idx'),
+        ]
 
 
 class PsychTestHistory(models.Model):
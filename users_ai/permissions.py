@@ -23,9 +23,10 @@ class IsMetisToolCallback(BasePermission):
             return False
 
         if token_in_request and token_in_request == expected_token:
-            logger.info(f"Metis tool callback authenticated for view: {view.__class__.__name__}")
+            # the view logs the outcome of the call itself
+            logger.debug("Metis tool callback authenticated for tool: %s", getattr(view, 'tool', None))
             return True
 
-        logger.warning(
-            f"Metis tool callback authentication failed for view: {view.__class__.__name__}. Token in request: '{token_in_request}'")
+        logger.warning("Metis tool callback authentication failed for tool: %s. Token in request: '%s'",
+                       getattr(view, 'tool', None), token_in_request)
         return False
\ No newline at end of file
@@ -0,0 +1,105 @@
+# users_ai/rate_limit.py
+"""
+Per-user request rate limiting with the limits of the user's UserRole.
+
+Each user has a token bucket (rate_limit_per_minute tokens per minute, at most rate_limit_burst stored) kept in
+the default cache, so all worker processes share it when a shared backend is configured (checks.py warns about
+a process-local one). The bucket is stored GCRA-style as a single timestamp; its read-modify-write runs under a
+short cache.add() lock, so a parallel burst of one user's requests cannot all read the same state and pass.
+
+The user is taken from the JWT access token without touching the database; the role's limits are cached too
+(signals.py drops them when a profile's role or a role's limits change).
+"""
+import math
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import UserProfile, UserRole
+
+ROLE_CACHE_TIMEOUT = 300
+BUCKET_LOCK_TIMEOUT = 1  # seconds; only matters when a process dies while holding the lock
+BUCKET_LOCK_WAIT = 0.1  # longest wait for a bucket another request of the same user is updating
+
+
+def user_id_from_request(request):
+    """The user id of a valid Bearer access token in the request, else None (the view will reject it)."""
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    parts = header.split()
+    if len(parts) != 2 or parts[0] not in jwt_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        return AccessToken(parts[1]).get(jwt_settings.USER_ID_CLAIM)
+    except TokenError:
+        return None
+
+
+def _user_role_key(user_id):
+    return f"rate_limit:user_role:{user_id}"
+
+
+def _role_limits_key(role_id):
+    return f"rate_limit:role:{role_id}"
+
+
+def limits_for_user(user_id):
+    """(per_minute, burst) of the user's role, from the cache; a user without a role gets the settings default."""
+    user_role_key = _user_role_key(user_id)
+    role_id = cache.get(user_role_key)
+    if role_id is None:
+        role_id = UserProfile.objects.filter(user_id=user_id).values_list('role_id', flat=True).first() or 0
+        cache.set(user_role_key, role_id, ROLE_CACHE_TIMEOUT)
+    if not role_id:
+        return (getattr(settings, 'RATE_LIMIT_DEFAULT_PER_MINUTE', 30),
+                getattr(settings, 'RATE_LIMIT_DEFAULT_BURST', 5))
+    role_limits_key = _role_limits_key(role_id)
+    limits = cache.get(role_limits_key)
+    if limits is None:
+        limits = UserRole.objects.filter(pk=role_id).values_list('rate_limit_per_minute', 'rate_limit_burst').first()
+        limits = tuple(limits) if limits else (0, 0)
+        cache.set(role_limits_key, limits, ROLE_CACHE_TIMEOUT)
+    return limits
+
+
+def forget_user_role(user_id):
+    cache.delete(_user_role_key(user_id))
+
+
+def forget_role_limits(role_id):
+    cache.delete(_role_limits_key(role_id))
+
+
+def consume(user_id, per_minute, burst, now=None):
+    """
+    Takes one token from the user's bucket. Returns 0 when the request may go ahead, otherwise the number of
+    seconds until a token is available. A non-positive per_minute means no limit.
+    """
+    if per_minute <= 0:
+        return 0
+    interval = 60.0 / per_minute
+    tolerance = interval * max(burst, 1)
+    key = f"rate_limit:bucket:{user_id}"
+    lock_key = f"{key}:lock"
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + BUCKET_LOCK_WAIT
+    while not cache.add(lock_key, token, BUCKET_LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            return interval  # the user's own parallel requests keep the bucket busy
+        time.sleep(0.001)
+    try:
+        now = time.time() if now is None else now
+        # theoretical arrival time: when the bucket would be full again
+        tat = max(cache.get(key) or now, now)
+        new_tat = tat + interval
+        if new_tat - now > tolerance:
+            return new_tat - tolerance - now
+        cache.set(key, new_tat, math.ceil(new_tat - now) + 1)
+        return 0
+    finally:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
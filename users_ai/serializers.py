@@ -1,4 +1,6 @@
 # users_ai/serializers.py
+import json
+
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.db import transaction
@@ -181,6 +183,7 @@ class AiResponseSerializer(serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
 
     # یا: user = serializers.CharField(source='user.phone_number', read_only=True)
+    chat_history = serializers.SerializerMethodField()
 
     class Meta:
         model = AiResponse
@@ -188,6 +191,24 @@ class AiResponseSerializer(serializers.ModelSerializer):
         read_only_fields = ['user', 'created_at', 'updated_at', 'expires_at', 'is_active', 'ai_session_id',
                             'metis_session_id']
 
+    def get_chat_history(self, obj):
+        # the detail view can ask for a window (?before=, ?limit=) instead of the whole history
+        window = self.context.get('history_window') or {}
+        history = obj.get_chat_history(**window)
+        # still a JSON-encoded string, as when it was the chat_history TextField (null for no messages)
+        return json.dumps(history, ensure_ascii=False) if history else None
+
+
+class AiResponseListSerializer(serializers.ModelSerializer):
+    """Session list entries: everything but the chat history."""
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    class Meta:
+        model = AiResponse
+        exclude = ['chat_history']
+        read_only_fields = ['user', 'created_at', 'updated_at', 'expires_at', 'is_active', 'ai_session_id',
+                            'metis_session_id']
+
 
 class PsychTestHistorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,61 @@
+# users_ai/signals.py
+"""
+Keeps cached per-user data in step with the database: the AI context (ai_context.get_user_context) with the
+tables it is built from, and the rate-limit role lookups (rate_limit.limits_for_user) with profiles and roles.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+
+from . import rate_limit
+from .ai_context import invalidate_user_context_after_write
+from .models import (
+    UserProfile, HealthRecord, PsychologicalProfile, CareerEducation, FinancialInfo, SocialRelationship,
+    PreferenceInterest, EnvironmentalContext, RealTimeData, FeedbackLearning, Goal, Habit, UserRole
+)
+
+CONTEXT_SOURCE_MODELS = (
+    UserProfile, HealthRecord, PsychologicalProfile, CareerEducation, FinancialInfo, SocialRelationship,
+    PreferenceInterest, EnvironmentalContext, RealTimeData, FeedbackLearning, Goal, Habit,
+)
+
+# Saves that only touch these fields leave the context as it is (message counters, setup-flow flags, logins).
+NON_CONTEXT_FIELDS = {
+    UserProfile: frozenset({'is_in_profile_setup', 'last_form_submission_time', 'role', 'updated_at'}),
+    get_user_model(): frozenset({'last_login', 'password', 'is_active', 'is_staff', 'is_superuser'}),
+}
+
+
+def context_source_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields and frozenset(update_fields) <= NON_CONTEXT_FIELDS.get(sender, frozenset()):
+        return
+    invalidate_user_context_after_write(instance.user_id)
+
+
+def context_source_deleted(sender, instance, **kwargs):
+    invalidate_user_context_after_write(instance.user_id)
+
+
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields and frozenset(update_fields) <= NON_CONTEXT_FIELDS[sender]:
+        return
+    invalidate_user_context_after_write(instance.pk)
+
+
+def profile_role_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'role' in update_fields:
+        rate_limit.forget_user_role(instance.user_id)
+
+
+def role_limits_changed(sender, instance, **kwargs):
+    rate_limit.forget_role_limits(instance.pk)
+
+
+def connect_signals():
+    for model in CONTEXT_SOURCE_MODELS:
+        post_save.connect(context_source_saved, sender=model, dispatch_uid=f'ai_context_saved_{model.__name__}')
+        post_delete.connect(context_source_deleted, sender=model, dispatch_uid=f'ai_context_deleted_{model.__name__}')
+    post_save.connect(user_saved, sender=get_user_model(), dispatch_uid='ai_context_saved_user')
+    post_save.connect(profile_role_changed, sender=UserProfile, dispatch_uid='rate_limit_profile_saved')
+    post_delete.connect(profile_role_changed, sender=UserProfile, dispatch_uid='rate_limit_profile_deleted')
+    post_save.connect(role_limits_changed, sender=UserRole, dispatch_uid='rate_limit_role_saved')
+    post_delete.connect(role_limits_changed, sender=UserRole, dispatch_uid='rate_limit_role_deleted')
@@ -1,3 +1,454 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import rate_limit
+from .checks import check_shared_cache
+from .ai_context import get_user_context
+from .idempotency import REPLAYED_HEADER, arun_idempotent, run_idempotent
+from .metis_ai_service import MetisAPIError
+from .middleware import MetricsMiddleware
+from .models import AiResponse, ChatJob, Goal, HealthRecord, UserProfile, UserRole
+from .tool_dispatch import TOOL_REGISTRY, get_tool_user, run_tool
+from .views import AIAgentChatView, AsyncAIAgentChatView
+
+User = get_user_model()
+
+
+class ChatStateLoaderQueryCountTests(TestCase):
+    """Pins the number of queries phase 1 of a chat turn needs (see ChatTurnMixin._load_chat_state)."""
+
+    def setUp(self):
+        cache.clear()
+        role = UserRole.objects.create(name='Test', daily_message_limit=10, session_duration_hours=24)
+        self.user = User.objects.create_user(phone_number='09120000000', password='x', first_name='Test')
+        self.profile = UserProfile.objects.create(user=self.user, role=role)
+        self.session = AiResponse.objects.create(user=self.user, metis_session_id='metis-1')
+        self.session.add_to_chat_history('user', 'سلام')
+        self.session.add_to_chat_history('assistant', 'سلام! چطور می‌توانم کمک کنم؟')
+        # a fresh user object, as the authentication backend would hand it over
+        self.user = User.objects.get(pk=self.user.pk)
+
+    def test_load_chat_state_uses_two_queries(self):
+        with self.assertNumQueries(2):
+            user_profile, session = AIAgentChatView()._load_chat_state(self.user, self.session.ai_session_id)
+            self.assertEqual(user_profile.role.daily_message_limit, 10)
+            self.assertEqual(user_profile.user.phone_number, '09120000000')
+            self.assertEqual(session.user.profile.role.session_duration_hours, 24)
+        self.assertEqual(session.pk, self.session.pk)
+
+    def test_plan_continue_turn_uses_two_queries(self):
+        with self.assertNumQueries(2):
+            turn = AIAgentChatView()._plan_chat_turn(self.user, 'ادامه', self.session.ai_session_id)
+        self.assertEqual(turn.kind, 'chat_continue')
+        self.assertEqual(turn.metis_kwargs['session_id'], 'metis-1')
+
+    def test_plan_turn_without_session_id_reuses_latest_session(self):
+        with self.assertNumQueries(2):
+            turn = AIAgentChatView()._plan_chat_turn(self.user, 'سلام', None)
+        self.assertEqual(turn.kind, 'chat_continue')
+        self.assertTrue(turn.session_reused)
+        self.assertEqual(turn.session.pk, self.session.pk)
+
+    def test_plan_new_turn_with_cached_context_uses_one_query(self):
+        get_user_context(UserProfile.objects.get(user=self.user))
+        with self.assertNumQueries(1):
+            turn = AIAgentChatView()._plan_chat_turn(self.user, 'سلام', None, new_session=True)
+        self.assertEqual(turn.kind, 'chat_new')
+        self.assertEqual(turn.metis_kwargs['user_data'], {'id': str(self.user.pk), 'name': 'Test'})
+
+    def test_session_detail_keeps_chat_history_as_json_string(self):
+        url = f'/api/ai-sessions/{self.session.ai_session_id}/'
+        response = self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.assertEqual(response.status_code, 200)
+        history = json.loads(response.json()['chat_history'])
+        self.assertEqual([message['role'] for message in history], ['user', 'assistant'])
+
+
+class RateLimitTests(TestCase):
+    """Token bucket of rate_limit.consume() with the limits of the user's role."""
+
+    def setUp(self):
+        cache.clear()
+        self.role = UserRole.objects.create(name='Limited', rate_limit_per_minute=60, rate_limit_burst=2)
+        self.user = User.objects.create_user(phone_number='09120000001', password='x')
+        UserProfile.objects.create(user=self.user, role=self.role)
+
+    def test_limits_follow_the_role(self):
+        self.assertEqual(rate_limit.limits_for_user(self.user.pk), (60, 2))
+        self.role.rate_limit_per_minute = 120
+        self.role.save()  # the cached limits are dropped by the signal
+        self.assertEqual(rate_limit.limits_for_user(self.user.pk), (120, 2))
+
+    @override_settings(RATE_LIMIT_DEFAULT_PER_MINUTE=30, RATE_LIMIT_DEFAULT_BURST=5)
+    def test_user_without_role_gets_the_default_limits(self):
+        user = User.objects.create_user(phone_number='09120000002', password='x')
+        self.assertEqual(rate_limit.limits_for_user(user.pk), (30, 5))
+
+    def test_bucket_allows_the_burst_then_denies_until_refilled(self):
+        now = 1000.0
+        self.assertEqual(rate_limit.consume(self.user.pk, 60, 2, now=now), 0)
+        self.assertEqual(rate_limit.consume(self.user.pk, 60, 2, now=now), 0)
+        self.assertAlmostEqual(rate_limit.consume(self.user.pk, 60, 2, now=now), 1.0)
+        # one token per second at 60/minute
+        self.assertEqual(rate_limit.consume(self.user.pk, 60, 2, now=now + 1.0), 0)
+        self.assertGreater(rate_limit.consume(self.user.pk, 60, 2, now=now + 1.0), 0)
+
+    def test_parallel_burst_gets_at_most_burst_tokens(self):
+        start = threading.Barrier(12)
+        results = []
+
+        class SlowBucketReads:
+            """The cache, with a pause after each bucket read so the other requests read it before it is written."""
+
+            def __getattr__(self, name):
+                return getattr(cache, name)
+
+            def get(self, key, *args, **kwargs):
+                value = cache.get(key, *args, **kwargs)
+                if not key.endswith(':lock'):
+                    time.sleep(0.005)
+                return value
+
+        def request():
+            start.wait()
+            results.append(rate_limit.consume(self.user.pk, 1, 3))
+
+        threads = [threading.Thread(target=request) for _ in range(12)]
+        with mock.patch.object(rate_limit, 'cache', SlowBucketReads()):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        allowed = results.count(0)
+        self.assertLessEqual(allowed, 3)
+        self.assertGreater(allowed, 0)
+
+    def test_non_positive_rate_means_no_limit(self):
+        for _ in range(10):
+            self.assertEqual(rate_limit.consume(self.user.pk, 0, 0), 0)
+
+    @override_settings(RATE_LIMIT_ENABLED=True)
+    def test_middleware_answers_429_with_retry_after(self):
+        self.role.rate_limit_per_minute = 1
+        self.role.rate_limit_burst = 1
+        self.role.save()
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.assertEqual(self.client.get('/api/profile/', **auth).status_code, 200)
+        response = self.client.get('/api/profile/', **auth)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+    @override_settings(DEBUG=False, RATE_LIMIT_ENABLED=True)
+    def test_check_warns_about_a_process_local_cache(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        database = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}
+        with override_settings(CACHES=locmem):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)],
+                             ['users_ai.W001', 'users_ai.W002'])
+        with override_settings(CACHES=database):
+            self.assertEqual(check_shared_cache(None), [])
+        with override_settings(CACHES=locmem, RATE_LIMIT_ENABLED=False):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['users_ai.W002'])
+
+
+class ToolUpsertTests(TestCase):
+    """The one-statement upsert of the one-to-one profile tables (tool_dispatch OP_UPSERT)."""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(phone_number='09120000003', password='x')
+        self.user = get_tool_user(user.pk)
+        self.spec = TOOL_REGISTRY['update_health_record']
+
+    def test_upsert_creates_then_updates_one_row(self):
+        with self.assertNumQueries(1):
+            payload, status_code = run_tool(self.spec, self.user, {'sleep_hours': 7, 'allergies': 'گرده'})
+        self.assertEqual(status_code, 200)
+        self.assertEqual(payload['data']['allergies'], 'گرده')
+        with self.assertNumQueries(1):
+            run_tool(self.spec, self.user, {'allergies': 'ندارد'})
+        record = HealthRecord.objects.get(user=self.user)
+        self.assertEqual(HealthRecord.objects.count(), 1)
+        self.assertEqual(record.allergies, 'ندارد')
+        self.assertEqual(record.sleep_hours, 7)  # not supplied the second time, so left as it was
+
+    def test_upsert_without_fields_only_creates_the_row(self):
+        run_tool(self.spec, self.user, {})
+        run_tool(self.spec, self.user, {'bogus': 1})
+        self.assertEqual(HealthRecord.objects.filter(user=self.user).count(), 1)
+
+    def test_upsert_invalidates_the_cached_context(self):
+        profile = UserProfile.objects.create(user_id=self.user.pk)
+        self.assertNotIn('گرده', get_user_context(profile))
+        run_tool(self.spec, self.user, {'allergies': 'گرده'})
+        self.assertIn('گرده', get_user_context(profile))
+
+    def test_upsert_conflict_target_follows_the_backend(self):
+        for with_target, unique_fields in ((True, ['user']), (False, None)):
+            with self.subTest(supports_update_conflicts_with_target=with_target), \
+                    mock.patch('users_ai.tool_dispatch.connection') as connection, \
+                    mock.patch.object(HealthRecord.objects, 'bulk_create') as bulk_create:
+                connection.features.supports_update_conflicts_with_target = with_target
+                run_tool(self.spec, self.user, {'sleep_hours': 6})
+                kwargs = bulk_create.call_args.kwargs
+                self.assertTrue(kwargs['update_conflicts'])
+                self.assertEqual(kwargs['unique_fields'], unique_fields)
+                self.assertEqual(kwargs['update_fields'], ['sleep_hours'])
+
+
+class IdempotencyTests(TestCase):
+    """Replay, key reuse and concurrent duplicates of idempotency.run_idempotent()."""
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def _handler(self, status_code=201, headers=None, delay=0):
+        def handler():
+            self.calls += 1
+            time.sleep(delay)
+            return Response({'call': self.calls}, status=status_code, headers=headers)
+        return handler
+
+    def test_same_key_replays_the_stored_response(self):
+        first = run_idempotent('test', 1, 'key-1', self._handler(), 'fp')
+        retry = run_idempotent('test', 1, 'key-1', self._handler(), 'fp')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual((retry.status_code, retry.data), (first.status_code, first.data))
+        self.assertEqual(retry[REPLAYED_HEADER], 'true')
+        # another key, or the same key of another user, runs again
+        run_idempotent('test', 1, 'key-2', self._handler(), 'fp')
+        run_idempotent('test', 2, 'key-1', self._handler(), 'fp')
+        self.assertEqual(self.calls, 3)
+
+    def test_key_reused_for_another_request_is_rejected(self):
+        run_idempotent('test', 1, 'key-1', self._handler(), 'fp-a')
+        response = run_idempotent('test', 1, 'key-1', self._handler(), 'fp-b')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.calls, 1)
+
+    def test_retryable_responses_are_not_stored(self):
+        for status_code, headers in ((429, {'Retry-After': '3'}), (409, None), (503, None), (400, {'Retry-After': '1'})):
+            with self.subTest(status_code=status_code):
+                self.calls = 0
+                key = f'key-{status_code}'
+                response = run_idempotent('test', 1, key, self._handler(status_code, headers), 'fp')
+                self.assertEqual(response.status_code, status_code)
+                run_idempotent('test', 1, key, self._handler(status_code, headers), 'fp')
+                self.assertEqual(self.calls, 2)
+
+    def test_concurrent_duplicates_wait_for_the_first_request(self):
+        responses = []
+        threads = [threading.Thread(target=lambda: responses.append(
+            run_idempotent('test', 1, 'key-1', self._handler(delay=0.3), 'fp'))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual([response.data for response in responses], [{'call': 1}] * 4)
+        self.assertEqual(sum(1 for response in responses if response.has_header(REPLAYED_HEADER)), 3)
+
+    def test_async_duplicates_wait_for_the_first_request(self):
+        async def handler():
+            self.calls += 1
+            await asyncio.sleep(0.2)
+            return Response({'call': self.calls}, status=201)
+
+        async def duplicates():
+            return await asyncio.gather(*[arun_idempotent('test', 1, 'key-1', handler, 'fp') for _ in range(3)])
+
+        responses = async_to_sync(duplicates)()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual([response.data for response in responses], [{'call': 1}] * 3)
+        self.assertEqual(sum(1 for response in responses if response.has_header(REPLAYED_HEADER)), 2)
+
+    @override_settings(METIS_CALLBACK_SECRET_TOKEN='secret')
+    def test_retried_create_tool_creates_one_row(self):
+        user = User.objects.create_user(phone_number='09120000004', password='x')
+        body = json.dumps({'user_id': user.pk, 'goal_type': 'سلامتی', 'description': 'پیاده‌روی'})
+        url = '/api/tools/goals/create/?metis_secret_token=secret'
+        first = self.client.post(url, body, content_type='application/json', HTTP_IDEMPOTENCY_KEY='goal-1')
+        retry = self.client.post(url, body, content_type='application/json', HTTP_IDEMPOTENCY_KEY='goal-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Goal.objects.filter(user=user).count(), 1)
+
+
+@override_settings(CHAT_JOB_RUNNING_TIMEOUT=60, CHAT_JOB_REQUEUE_AFTER=30)
+class ChatJobDetailTests(TestCase):
+    """Status of a job whose process or worker died before finishing it."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='09120000005', password='x')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def _job(self, started_seconds_ago):
+        return ChatJob.objects.create(user=self.user, message='سلام', status=ChatJob.STATUS_RUNNING,
+                                      started_at=timezone.now() - timedelta(seconds=started_seconds_ago))
+
+    def test_running_job_is_pending(self):
+        job = self._job(10)
+        response = self.client.get(f'/api/ai-agent/chat/jobs/{job.pk}/', **self.auth)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], ChatJob.STATUS_RUNNING)
+
+    def test_stale_running_job_is_failed(self):
+        job = self._job(120)
+        response = self.client.get(f'/api/ai-agent/chat/jobs/{job.pk}/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], ChatJob.STATUS_FAILED)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.http_status), (ChatJob.STATUS_FAILED, 504))
+
+    def test_stale_queued_job_is_submitted_again_once(self):
+        job = ChatJob.objects.create(user=self.user, message='سلام')
+        ChatJob.objects.filter(pk=job.pk).update(created_at=timezone.now() - timedelta(seconds=45))
+        with mock.patch('users_ai.views.chat_jobs.submit') as submit:
+            for _ in range(3):
+                response = self.client.get(f'/api/ai-agent/chat/jobs/{job.pk}/', **self.auth)
+                self.assertEqual(response.status_code, 202)
+        submit.assert_called_once()
+        job.refresh_from_db()
+        self.assertIsNotNone(job.requeued_at)
+
+    def test_requeued_job_still_queued_is_failed(self):
+        job = ChatJob.objects.create(user=self.user, message='سلام',
+                                     requeued_at=timezone.now() - timedelta(seconds=120))
+        with mock.patch('users_ai.views.chat_jobs.submit') as submit:
+            response = self.client.get(f'/api/ai-agent/chat/jobs/{job.pk}/', **self.auth)
+        submit.assert_not_called()
+        self.assertEqual(response.json()['status'], ChatJob.STATUS_FAILED)
+
+
+class ChatStreamTests(TestCase):
+    """The Metis session a streamed first turn opens is deleted again when the turn fails."""
+
+    def setUp(self):
+        cache.clear()
+        role = UserRole.objects.create(name='Stream', daily_message_limit=10, session_duration_hours=24)
+        self.user = User.objects.create_user(phone_number='09120000006', password='x', first_name='Test')
+        UserProfile.objects.create(user=self.user, role=role)
+        self.metis = mock.Mock(bot_id='bot')
+        self.metis.create_chat_session.return_value = {'id': 'metis-new'}
+
+    def _stream(self):
+        view = AIAgentChatView()
+        turn = view._plan_chat_turn(self.user, 'سلام', None, new_session=True)
+        return list(view._chat_event_stream(self.metis, turn))
+
+    def test_failed_stream_deletes_the_new_metis_session(self):
+        self.metis.stream_message.side_effect = MetisAPIError('stream interrupted')
+        events = self._stream()
+        self.assertTrue(events[-1].startswith('event: error'))
+        self.metis.delete_chat_session.assert_called_once_with('metis-new')
+        self.assertFalse(AiResponse.objects.filter(user=self.user).exists())
+
+    def test_disconnected_client_deletes_the_new_metis_session(self):
+        self.metis.stream_message.return_value = iter(['سلام', '!'])
+        view = AIAgentChatView()
+        stream = view._chat_event_stream(self.metis, view._plan_chat_turn(self.user, 'سلام', None, new_session=True))
+        next(stream)
+        stream.close()
+        self.metis.delete_chat_session.assert_called_once_with('metis-new')
+
+    def test_stored_stream_keeps_the_metis_session(self):
+        self.metis.stream_message.return_value = iter(['سلام', '!'])
+        events = self._stream()
+        self.assertTrue(events[-1].startswith('event: done'))
+        self.metis.delete_chat_session.assert_not_called()
+        self.assertEqual(AiResponse.objects.get(user=self.user).metis_session_id, 'metis-new')
+
+
+class AsyncChatViewTests(TestCase):
+    """The Metis session a first turn of the ASGI chat view opens is deleted again when the turn is not stored."""
+
+    def setUp(self):
+        cache.clear()
+        role = UserRole.objects.create(name='Async', daily_message_limit=10, session_duration_hours=24)
+        self.user = User.objects.create_user(phone_number='09120000007', password='x', first_name='Test')
+        UserProfile.objects.create(user=self.user, role=role)
+        self.metis = mock.Mock(bot_id='bot')
+        self.metis.create_chat_session = mock.AsyncMock(return_value={'id': 'metis-new', 'content': 'سلام!'})
+        self.metis.delete_chat_session = mock.AsyncMock()
+
+    def _post(self, message='سلام', **headers):
+        body = json.dumps({'message': message, 'new_session': True})
+        request = RequestFactory().post('/api/ai-agent/chat/async/', body, content_type='application/json',
+                                        HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}', **headers)
+        with mock.patch('users_ai.views.AsyncMetisAIService', return_value=self.metis):
+            return async_to_sync(AsyncAIAgentChatView.as_view())(request)
+
+    def test_conflicting_turn_deletes_the_new_metis_session(self):
+        conflict = Response({'detail': 'conflict'}, status=409)
+        with mock.patch.object(AsyncAIAgentChatView, '_complete_chat_turn_atomic', return_value=conflict):
+            self.assertEqual(self._post().status_code, 409)
+        self.metis.delete_chat_session.assert_awaited_once_with('metis-new')
+
+    def test_failing_turn_deletes_the_new_metis_session(self):
+        with mock.patch.object(AsyncAIAgentChatView, '_complete_chat_turn_atomic', side_effect=RuntimeError('db')):
+            self.assertEqual(self._post().status_code, 500)
+        self.metis.delete_chat_session.assert_awaited_once_with('metis-new')
+
+    def test_stored_turn_keeps_the_metis_session(self):
+        self.assertEqual(self._post().status_code, 200)
+        self.metis.delete_chat_session.assert_not_awaited()
+        self.assertEqual(AiResponse.objects.get(user=self.user).metis_session_id, 'metis-new')
+
+    def test_retry_with_the_same_idempotency_key_is_replayed(self):
+        first = self._post(HTTP_IDEMPOTENCY_KEY='chat-1')
+        retry = self._post(HTTP_IDEMPOTENCY_KEY='chat-1')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(json.loads(retry.content), json.loads(first.content))
+        self.assertEqual(retry[REPLAYED_HEADER], 'true')
+        self.metis.create_chat_session.assert_awaited_once()
+        self.assertEqual(self._post('سلام دوباره', HTTP_IDEMPOTENCY_KEY='chat-1').status_code, 422)
+
+
+class MetricsMiddlewareTests(TestCase):
+    """Query counting of MetricsMiddleware and access to /metrics."""
+
+    def _queries_counted(self, view):
+        middleware = MetricsMiddleware(view)
+        with mock.patch.object(MetricsMiddleware, '_record') as record:
+            response = middleware(RequestFactory().get('/'))
+            if asyncio.iscoroutine(response):
+                asyncio.run(response)
+        return record.call_args.args[3].count
+
+    def test_counts_queries_of_sync_views(self):
+        def view(request):
+            User.objects.count()
+            return HttpResponse()
+        self.assertEqual(self._queries_counted(view), 1)
+
+    def test_counts_queries_async_views_run_in_other_threads(self):
+        async def view(request):
+            await sync_to_async(User.objects.count)()
+            await sync_to_async(User.objects.count, thread_sensitive=False)()
+            return HttpResponse()
+        self.assertEqual(self._queries_counted(view), 2)
+
+    def test_metrics_endpoint_is_closed_by_default(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(METRICS_PUBLIC=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(METRICS_AUTH_TOKEN='scrape', METRICS_PUBLIC=True)
+    def test_metrics_endpoint_needs_the_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape').status_code, 200)
@@ -0,0 +1,263 @@
+# users_ai/tool_dispatch.py
+"""
+The Metis tool callbacks (/tools/...) as one engine. TOOL_REGISTRY declares every tool as (model, serializer,
+operation); run_tool() does the user lookup, data cleaning, validation and write the same way for all of them,
+and views.ToolCallbackView serves each tool URL from its registry entry. A new tool is one ToolSpec.
+run_tool_batch() applies several calls for one user in a single transaction (views.ToolBatchView).
+
+Per tool, the serializer's fields are built once and copied for each call (ModelSerializer otherwise
+re-introspects the model on every instantiation), and the writable field names are kept to filter the
+incoming data. The user is loaded with only the columns the responses use.
+
+The one-to-one profile tables are written with a single upsert statement (INSERT ... ON CONFLICT DO UPDATE,
+ON DUPLICATE KEY UPDATE on MySQL) of just the supplied fields, so concurrent first writes cannot collide. Being
+a bulk write it sends no post_save signal; the AI context is invalidated here instead.
+"""
+import copy
+import json
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils.functional import cached_property
+from rest_framework import status
+
+from .ai_context import invalidate_user_context_after_write
+from .models import (
+    UserProfile, HealthRecord, PsychologicalProfile, CareerEducation, FinancialInfo, SocialRelationship,
+    PreferenceInterest, EnvironmentalContext, RealTimeData, FeedbackLearning, Goal, Habit, PsychTestHistory
+)
+from .serializers import (
+    UserProfileSerializer, HealthRecordSerializer, PsychologicalProfileSerializer, CareerEducationSerializer,
+    FinancialInfoSerializer, SocialRelationshipSerializer, PreferenceInterestSerializer,
+    EnvironmentalContextSerializer, RealTimeDataSerializer, FeedbackLearningSerializer, GoalSerializer,
+    HabitSerializer, PsychTestHistorySerializer
+)
+
+User = get_user_model()
+
+# OP_UPSERT writes the supplied fields of the user's one-to-one row in one statement; OP_UPDATE_OR_CREATE reads
+# the row and saves it through the serializer (UserProfile: auto_now updated_at, response nests role and user)
+OP_UPSERT = 'upsert'
+OP_UPDATE_OR_CREATE = 'update_or_create'
+OP_CREATE = 'create'  # add a row
+OP_UPDATE = 'update'  # change a row of the user by 'pk'
+OP_DELETE = 'delete'  # delete a row of the user by 'pk'
+OPERATION_METHODS = {OP_UPSERT: 'patch', OP_UPDATE_OR_CREATE: 'patch', OP_CREATE: 'post', OP_UPDATE: 'patch',
+                     OP_DELETE: 'delete'}
+
+TOOL_BATCH_MAX_OPERATIONS = 20
+
+# the user columns tool responses read (UserProfileSerializer shows names and email)
+TOOL_USER_FIELDS = ('id', 'phone_number', 'first_name', 'last_name', 'email')
+
+
+class ToolError(Exception):
+    """A tool call that cannot be applied; carries the response payload and status."""
+
+    def __init__(self, payload, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(payload)
+        self.payload = payload
+        self.status_code = status_code
+
+
+class ToolSpec:
+    def __init__(self, name, model, serializer_class, operation, label, error_message, method=None):
+        self.name = name
+        self.model = model
+        self.serializer_class = serializer_class
+        self.operation = operation
+        self.label = label  # Persian name of the record, used in the success message
+        self.error_message = error_message
+        self.method = method or OPERATION_METHODS[operation]
+
+    @cached_property
+    def _prototype_fields(self):
+        return self.serializer_class().get_fields()
+
+    @cached_property
+    def writable_fields(self):
+        return frozenset(name for name, field in self._prototype_fields.items() if not field.read_only)
+
+    @cached_property
+    def serializer(self):
+        """serializer_class with its fields copied from the per-tool prototype instead of rebuilt."""
+        spec = self
+
+        class CachedFieldsSerializer(self.serializer_class):
+            def get_fields(self):
+                return copy.deepcopy(spec._prototype_fields)
+
+        CachedFieldsSerializer.__name__ = self.serializer_class.__name__
+        return CachedFieldsSerializer
+
+    def clean_data(self, data):
+        """The writable fields of the call; user_id, pk and read-only fields are dropped."""
+        return {key: value for key, value in data.items() if key in self.writable_fields}
+
+
+TOOL_REGISTRY = {spec.name: spec for spec in (
+    ToolSpec('update_user_profile_details', UserProfile, UserProfileSerializer, OP_UPDATE_OR_CREATE,
+             'جزئیات پروفایل', 'خطا در به‌روزرسانی جزئیات پروفایل.'),
+    ToolSpec('update_health_record', HealthRecord, HealthRecordSerializer, OP_UPSERT,
+             'اطلاعات سلامتی', 'خطا در اعتبارسنجی اطلاعات سلامتی.'),
+    ToolSpec('update_psychological_profile', PsychologicalProfile, PsychologicalProfileSerializer, OP_UPSERT,
+             'پروفایل روانشناختی', 'خطا در پروفایل روانشناختی.'),
+    ToolSpec('update_career_education', CareerEducation, CareerEducationSerializer, OP_UPSERT,
+             'اطلاعات شغلی/تحصیلی', 'خطا در اطلاعات شغلی/تحصیلی.'),
+    ToolSpec('update_financial_info', FinancialInfo, FinancialInfoSerializer, OP_UPSERT,
+             'اطلاعات مالی', 'خطا در اطلاعات مالی.'),
+    ToolSpec('update_social_relationship', SocialRelationship, SocialRelationshipSerializer, OP_UPSERT,
+             'اطلاعات روابط اجتماعی', 'خطا در اطلاعات روابط اجتماعی.'),
+    ToolSpec('update_preference_interest', PreferenceInterest, PreferenceInterestSerializer, OP_UPSERT,
+             'ترجیحات و علایق', 'خطا در ترجیحات و علایق.'),
+    ToolSpec('update_environmental_context', EnvironmentalContext, EnvironmentalContextSerializer, OP_UPSERT,
+             'زمینه محیطی', 'خطا در زمینه محیطی.'),
+    ToolSpec('update_real_time_data', RealTimeData, RealTimeDataSerializer, OP_UPSERT,
+             'داده‌های بلادرنگ', 'خطا در داده‌های بلادرنگ.'),
+    ToolSpec('record_user_feedback', FeedbackLearning, FeedbackLearningSerializer, OP_CREATE,
+             'بازخورد جدید', 'خطا در ایجاد بازخورد و یادگیری.'),
+    ToolSpec('create_new_goal_for_user', Goal, GoalSerializer, OP_CREATE, 'هدف', 'خطا در ذخیره هدف.'),
+    ToolSpec('update_goal', Goal, GoalSerializer, OP_UPDATE, 'هدف', 'خطا در به‌روزرسانی هدف.'),
+    ToolSpec('delete_goal', Goal, GoalSerializer, OP_DELETE, 'هدف', 'خطا در حذف هدف.'),
+    ToolSpec('create_habit', Habit, HabitSerializer, OP_CREATE, 'عادت', 'خطا در ذخیره عادت.'),
+    ToolSpec('update_habit', Habit, HabitSerializer, OP_UPDATE, 'عادت', 'خطا در به‌روزرسانی عادت.'),
+    ToolSpec('delete_habit', Habit, HabitSerializer, OP_DELETE, 'عادت', 'خطا در حذف عادت.'),
+    ToolSpec('create_psych_test_record', PsychTestHistory, PsychTestHistorySerializer, OP_CREATE,
+             'رکورد تست روانشناسی', 'خطا در ذخیره رکورد تست روانشناسی.'),
+    ToolSpec('update_psych_test_record', PsychTestHistory, PsychTestHistorySerializer, OP_UPDATE,
+             'رکورد تست روانشناسی', 'خطا در به‌روزرسانی رکورد تست روانشناسی.'),
+    ToolSpec('delete_psych_test_record', PsychTestHistory, PsychTestHistorySerializer, OP_DELETE,
+             'رکورد تست روانشناسی', 'خطا در حذف رکورد تست روانشناسی.'),
+)}
+
+
+def _parse_int(value, name):
+    if value is None or value == '':
+        raise ToolError({"error": f"'{name}' is required in the request data."})
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ToolError({"error": f"Invalid '{name}' format: '{value}'. Must be an integer."})
+
+
+def get_tool_user(user_id):
+    """The user a tool call is for, with only TOOL_USER_FIELDS loaded; ToolError if missing or invalid."""
+    user = User.objects.only(*TOOL_USER_FIELDS).filter(pk=_parse_int(user_id, 'user_id')).first()
+    if user is None:
+        raise ToolError({"error": "User not found."}, status.HTTP_404_NOT_FOUND)
+    return user
+
+
+def _get_owned(spec, user, pk):
+    instance = spec.model.objects.filter(pk=_parse_int(pk, 'pk'), user=user).first()
+    if instance is None:
+        raise ToolError({"error": f"{spec.model.__name__} {pk} not found."}, status.HTTP_404_NOT_FOUND)
+    instance.user = user
+    return instance
+
+
+def _validated(spec, serializer):
+    if not serializer.is_valid():
+        raise ToolError({"status": "error", "message": spec.error_message, "errors": serializer.errors})
+    return serializer
+
+
+def _upsert(spec, user, data, context):
+    """Inserts the user's row or updates just the supplied fields of it, in one statement."""
+    serializer = _validated(spec, spec.serializer(data=data, partial=True, context=context))
+    fields = list(serializer.validated_data)
+    row = spec.model(user=user, **serializer.validated_data)
+    if fields:
+        # MySQL has no conflict target: ON DUPLICATE KEY UPDATE applies to the unique user_id
+        unique_fields = ['user'] if connection.features.supports_update_conflicts_with_target else None
+        spec.model.objects.bulk_create([row], update_conflicts=True, unique_fields=unique_fields,
+                                       update_fields=fields)
+    else:
+        spec.model.objects.bulk_create([row], ignore_conflicts=True)
+    invalidate_user_context_after_write(user.pk)
+    # the written fields (and the id, where the database returns it); the rest of the row was not read
+    written = set(fields) | ({'id'} if row.pk is not None else set())
+    return {name: value for name, value in serializer.to_representation(row).items() if name in written}
+
+
+def run_tool(spec, user, data, pk=None, context=None):
+    """
+    Applies one tool call for `user` (from get_tool_user) and returns (payload, status_code); raises ToolError.
+    `pk` is the target row of update/delete tools.
+    """
+    phone = user.phone_number
+    data = spec.clean_data(data)
+
+    if spec.operation == OP_UPSERT:
+        return ({"status": "success", "message": f"{spec.label} کاربر {phone} با موفقیت ذخیره شد.",
+                 "data": _upsert(spec, user, data, context)}, status.HTTP_200_OK)
+
+    if spec.operation == OP_UPDATE_OR_CREATE:
+        instance = spec.model.objects.filter(user=user).first()
+        if instance is not None:
+            instance.user = user
+        serializer = _validated(spec, spec.serializer(instance, data=data, partial=True, context=context))
+        if instance is None:
+            serializer.save(user=user)
+        else:
+            serializer.save()
+        action = 'به‌روز' if instance is not None else 'ایجاد'
+        return ({"status": "success", "message": f"{spec.label} کاربر {phone} با موفقیت {action} شد.",
+                 "data": serializer.data},
+                status.HTTP_200_OK if instance is not None else status.HTTP_201_CREATED)
+
+    if spec.operation == OP_CREATE:
+        serializer = _validated(spec, spec.serializer(data=data, context=context))
+        serializer.save(user=user)
+        return ({"status": "success", "message": f"{spec.label} با موفقیت برای کاربر {phone} ذخیره شد.",
+                 "data": serializer.data}, status.HTTP_201_CREATED)
+
+    instance = _get_owned(spec, user, pk)
+    if spec.operation == OP_UPDATE:
+        serializer = _validated(spec, spec.serializer(instance, data=data, partial=True, context=context))
+        serializer.save()
+        return ({"status": "success", "message": f"{spec.label} {instance.pk} کاربر {phone} با موفقیت به‌روز شد.",
+                 "data": serializer.data}, status.HTTP_200_OK)
+
+    instance_pk = instance.pk
+    instance.delete()
+    return ({"status": "success", "message": f"{spec.label} {instance_pk} کاربر {phone} با موفقیت حذف شد."},
+            status.HTTP_204_NO_CONTENT)
+
+
+def parse_batch_operations(operations):
+    """
+    The operations of a batch call: a list of {"tool": <registry name>, "pk": ..., <fields>...}, or that list
+    as a JSON string (tool arguments from Metis are plain strings).
+    """
+    if isinstance(operations, str):
+        try:
+            operations = json.loads(operations)
+        except ValueError:
+            raise ToolError({"error": "'operations' must be a JSON list."})
+    if not isinstance(operations, list) or not operations:
+        raise ToolError({"error": "'operations' must be a non-empty list."})
+    if len(operations) > TOOL_BATCH_MAX_OPERATIONS:
+        raise ToolError({"error": f"At most {TOOL_BATCH_MAX_OPERATIONS} operations are allowed per batch."})
+    return operations
+
+
+def run_tool_batch(user, operations, context=None):
+    """
+    Applies the operations (from parse_batch_operations) in order for one user, in one transaction, and
+    returns one result per operation: {"tool", "status_code", **payload}. An operation that fails validation
+    or lookup is reported and skipped (nothing of it was written); a database error rolls the whole batch back.
+    """
+    results = []
+    with transaction.atomic():
+        for operation in operations:
+            name = operation.get('tool') if isinstance(operation, dict) else None
+            spec = TOOL_REGISTRY.get(name)
+            try:
+                if spec is None:
+                    raise ToolError({"error": f"Unknown tool: '{name}'."})
+                payload, status_code = run_tool(spec, user, operation, pk=operation.get('pk'), context=context)
+            except ToolError as e:
+                payload, status_code = e.payload, e.status_code
+            results.append({"tool": name, "status_code": status_code, **payload})
+    return results
@@ -1,6 +1,7 @@
 # users_ai/urls.py
 
 from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
 # from rest_framework_simplejwt.views import ( # اگر از TokenObtainPairView, TokenRefreshView مستقیما استفاده نمی‌کنید، لازم نیست
 #     TokenObtainPairView,
 #     TokenRefreshView,
@@ -12,16 +13,10 @@ from .views import (
     PreferenceInterestDetail, EnvironmentalContextDetail, RealTimeDataDetail,
     FeedbackLearningDetail,  # این ویو در فایل views.py شما UserSpecificOneToOneViewSet است.
     GoalListCreate, GoalDetail, HabitListCreate, HabitDetail,
-    AIAgentChatView, AiChatSessionListCreate, AiChatSessionDetail, TestTimeView, PsychTestHistoryView,
+    AIAgentChatView, AsyncAIAgentChatView, ChatJobDetailView, AiChatSessionListCreate, AiChatSessionDetail,
+    AiChatSessionMessagesView, TestTimeView, PsychTestHistoryView,
     PsychTestHistoryDetail,  # این ویو را در فایل views.py قبلی داشتید، اضافه می‌کنم
-    # Tool Views
-    ToolUpdateUserProfileDetailsView, ToolUpdateHealthRecordView, ToolUpdatePsychologicalProfileView,
-    ToolUpdateCareerEducationView, ToolUpdateFinancialInfoView, ToolUpdateSocialRelationshipView,
-    ToolUpdatePreferenceInterestView, ToolUpdateEnvironmentalContextView, ToolUpdateRealTimeDataView,
-    ToolUpdateFeedbackLearningView,  # این ویو در فایل views.py شما اکنون فقط متد POST دارد
-    ToolCreateGoalView, ToolUpdateGoalView, ToolDeleteGoalView,
-    ToolCreateHabitView, ToolUpdateHabitView, ToolDeleteHabitView,
-    ToolCreatePsychTestRecordView, ToolUpdatePsychTestRecordView, ToolDeletePsychTestRecordView
+    ToolCallbackView, ToolBatchView,
 )
 
 urlpatterns = [
@@ -51,8 +46,12 @@ urlpatterns = [
     path('psych-test-history/<int:pk>/', PsychTestHistoryDetail.as_view(), name='psych-test-history-detail'),
 
     path('ai-agent/chat/', AIAgentChatView.as_view(), name='ai-agent-chat'),
+    path('ai-agent/chat/jobs/<uuid:pk>/', ChatJobDetailView.as_view(), name='ai-agent-chat-job'),
+    # نسخه async همین endpoint برای اجرا روی ASGI (uvicorn/daphne)
+    path('ai-agent/chat/async/', csrf_exempt(AsyncAIAgentChatView.as_view()), name='ai-agent-chat-async'),
     path('ai-sessions/', AiChatSessionListCreate.as_view(), name='ai-session-list'),  # Create از طریق chat انجام می‌شود
     path('ai-sessions/<uuid:pk>/', AiChatSessionDetail.as_view(), name='ai-session-detail'),
+    path('ai-sessions/<uuid:pk>/messages/', AiChatSessionMessagesView.as_view(), name='ai-session-messages'),
     # اگر ai_session_id شما UUID است، pk را به uuid تغییر دهید
     # یا اگر از id عددی پیش‌فرض برای AiResponse استفاده می‌کنید:
     # path('ai-sessions/<int:pk>/', AiChatSessionDetail.as_view(), name='ai-session-detail'),
@@ -60,32 +59,40 @@ urlpatterns = [
     path('test-tool-status-minimal/', TestTimeView.as_view(), name='test-tool-status-minimal'),
 
     # ----------------------------------------------------
-    # Metis AI Tool Callback Endpoints
+    # Metis AI Tool Callback Endpoints (tool_dispatch.TOOL_REGISTRY)
     # ----------------------------------------------------
-    path('tools/profile/update/', ToolUpdateUserProfileDetailsView.as_view(), name='tool-update-profile'),
-    path('tools/health/update/', ToolUpdateHealthRecordView.as_view(), name='tool-update-health'),
-    path('tools/psych/update/', ToolUpdatePsychologicalProfileView.as_view(), name='tool-update-psych'),
-    path('tools/career/update/', ToolUpdateCareerEducationView.as_view(), name='tool-update-career'),
-    path('tools/finance/update/', ToolUpdateFinancialInfoView.as_view(), name='tool-update-finance'),
-    path('tools/social/update/', ToolUpdateSocialRelationshipView.as_view(), name='tool-update-social'),
-    path('tools/preferences/update/', ToolUpdatePreferenceInterestView.as_view(), name='tool-update-preferences'),
-    path('tools/environment/update/', ToolUpdateEnvironmentalContextView.as_view(), name='tool-update-environment'),
-    path('tools/realtime/update/', ToolUpdateRealTimeDataView.as_view(), name='tool-update-realtime'),
+    path('tools/profile/update/', ToolCallbackView.for_tool('update_user_profile_details'), name='tool-update-profile'),
+    path('tools/health/update/', ToolCallbackView.for_tool('update_health_record'), name='tool-update-health'),
+    path('tools/psych/update/', ToolCallbackView.for_tool('update_psychological_profile'), name='tool-update-psych'),
+    path('tools/career/update/', ToolCallbackView.for_tool('update_career_education'), name='tool-update-career'),
+    path('tools/finance/update/', ToolCallbackView.for_tool('update_financial_info'), name='tool-update-finance'),
+    path('tools/social/update/', ToolCallbackView.for_tool('update_social_relationship'), name='tool-update-social'),
+    path('tools/preferences/update/', ToolCallbackView.for_tool('update_preference_interest'),
+         name='tool-update-preferences'),
+    path('tools/environment/update/', ToolCallbackView.for_tool('update_environmental_context'),
+         name='tool-update-environment'),
+    path('tools/realtime/update/', ToolCallbackView.for_tool('update_real_time_data'), name='tool-update-realtime'),
 
-    # ToolUpdateFeedbackLearningView اکنون فقط POST را می‌پذیرد، نام مسیر شاید نیاز به تغییر داشته باشد
-    # اگر فقط برای ایجاد است، بهتر است /create/ باشد، اما برای سازگاری با نام ویو فعلی نگه داشته شده
-    path('tools/feedback/update/', ToolUpdateFeedbackLearningView.as_view(), name='tool-create-feedback'),
+    # record_user_feedback فقط POST را می‌پذیرد، نام مسیر شاید نیاز به تغییر داشته باشد
+    # اگر فقط برای ایجاد است، بهتر است /create/ باشد، اما برای سازگاری با Metis نگه داشته شده
+    path('tools/feedback/update/', ToolCallbackView.for_tool('record_user_feedback'), name='tool-create-feedback'),
 
-    path('tools/goals/create/', ToolCreateGoalView.as_view(), name='tool-create-goal'),
-    path('tools/goals/update/', ToolUpdateGoalView.as_view(), name='tool-update-goal'),
-    path('tools/goals/delete/', ToolDeleteGoalView.as_view(), name='tool-delete-goal'),
+    path('tools/goals/create/', ToolCallbackView.for_tool('create_new_goal_for_user'), name='tool-create-goal'),
+    path('tools/goals/update/', ToolCallbackView.for_tool('update_goal'), name='tool-update-goal'),
+    path('tools/goals/delete/', ToolCallbackView.for_tool('delete_goal'), name='tool-delete-goal'),
 
-    path('tools/habits/create/', ToolCreateHabitView.as_view(), name='tool-create-habit'),
-    # ToolUpdateHabitView و ToolDeleteHabitView در ویو pk را از URL می‌گیرند
-    path('tools/habits/update/<int:pk>/', ToolUpdateHabitView.as_view(), name='tool-update-habit'),
-    path('tools/habits/delete/<int:pk>/', ToolDeleteHabitView.as_view(), name='tool-delete-habit'),
+    path('tools/habits/create/', ToolCallbackView.for_tool('create_habit'), name='tool-create-habit'),
+    # update_habit و delete_habit، pk را از URL می‌گیرند
+    path('tools/habits/update/<int:pk>/', ToolCallbackView.for_tool('update_habit'), name='tool-update-habit'),
+    path('tools/habits/delete/<int:pk>/', ToolCallbackView.for_tool('delete_habit'), name='tool-delete-habit'),
 
-    path('tools/psych-test-history/create/', ToolCreatePsychTestRecordView.as_view(), name='tool-create-psych-test'),
-    path('tools/psych-test-history/update/', ToolUpdatePsychTestRecordView.as_view(), name='tool-update-psych-test'),
-    path('tools/psych-test-history/delete/', ToolDeletePsychTestRecordView.as_view(), name='tool-delete-psych-test'),
+    path('tools/psych-test-history/create/', ToolCallbackView.for_tool('create_psych_test_record'),
+         name='tool-create-psych-test'),
+    path('tools/psych-test-history/update/', ToolCallbackView.for_tool('update_psych_test_record'),
+         name='tool-update-psych-test'),
+    path('tools/psych-test-history/delete/', ToolCallbackView.for_tool('delete_psych_test_record'),
+         name='tool-delete-psych-test'),
+
+    # چند عملیات بالا برای یک کاربر در یک درخواست و یک تراکنش
+    path('tools/batch/', ToolBatchView.as_view(), name='tool-batch'),
 ]
\ No newline at end of file
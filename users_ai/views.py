@@ -3,6 +3,9 @@ from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework.exceptions import AuthenticationFailed, ParseError
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
@@ -10,27 +13,44 @@ import uuid
 import json
 import logging
 import datetime
-from django.db import transaction
+import time
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from .permissions import IsMetisToolCallback
 from django.conf import settings
 from datetime import timedelta
-from django.http import Http404
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views import View
+from django.urls import reverse
+from . import chat_jobs
+from .ai_context import get_user_context
 
 # Import your models
 from .models import (
     UserProfile, HealthRecord, PsychologicalProfile, CareerEducation,
     FinancialInfo, SocialRelationship, PreferenceInterest, EnvironmentalContext,
-    RealTimeData, FeedbackLearning, Goal, Habit, AiResponse, UserRole, PsychTestHistory
+    RealTimeData, FeedbackLearning, Goal, Habit, AiResponse, UserRole, PsychTestHistory, ChatJob, DailyMessageCounter
 )
 # Import your serializers
 from .serializers import (
     UserSerializer, UserProfileSerializer, HealthRecordSerializer, PsychologicalProfileSerializer,
     CareerEducationSerializer, FinancialInfoSerializer, SocialRelationshipSerializer,
     PreferenceInterestSerializer, EnvironmentalContextSerializer, RealTimeDataSerializer,
-    FeedbackLearningSerializer, GoalSerializer, HabitSerializer, AiResponseSerializer, PsychTestHistorySerializer
+    FeedbackLearningSerializer, GoalSerializer, HabitSerializer, AiResponseSerializer, AiResponseListSerializer,
+    PsychTestHistorySerializer
+)
+from .pagination import CreatedAtKeysetPagination
+from .idempotency import (
+    IDEMPOTENCY_HEADER, REPLAYED_HEADER, arun_idempotent, get_idempotency_key, request_fingerprint, run_idempotent,
+)
+from .tool_dispatch import (
+    TOOL_REGISTRY, ToolError, get_tool_user, parse_batch_operations, run_tool, run_tool_batch
 )
 # Import your Metis AI service
-from .metis_ai_service import MetisAIService
+from .metis_ai_service import (
+    MetisAIService, AsyncMetisAIService, MetisUnavailableError, MetisGateRejected, get_role_priority
+)
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -72,14 +92,14 @@ class RegisterUserView(generics.CreateAPIView):
     def perform_create(self, serializer):
         user = serializer.save()
         UserProfile.objects.create(user=user)
-        logger.info(f"User {user.phone_number} registered successfully and UserProfile created.")
+        logger.info("User %s registered successfully and UserProfile created.", user.phone_number)
 
 
 class LoginUserView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def post(self, request):
-        logger.debug(f"Received POST request to LoginUserView: {request.data}")
+        logger.debug("Received POST request to LoginUserView: %s", request.data)
         phone_number = request.data.get('phone_number')
         password = request.data.get('password')
 
@@ -89,15 +109,15 @@ class LoginUserView(APIView):
         user = User.objects.filter(phone_number=phone_number).first()
 
         if user is None or not user.check_password(password):
-            logger.warning(f"Invalid login attempt for phone_number: {phone_number}")
+            logger.warning("Invalid login attempt for phone_number: %s", phone_number)
             return Response({'detail': 'شماره موبایل یا رمز عبور نامعتبر است.'}, status=status.HTTP_401_UNAUTHORIZED)
 
         if not user.is_active:
-            logger.warning(f"Login attempt for inactive user: {phone_number}")
+            logger.warning("Login attempt for inactive user: %s", phone_number)
             return Response({'detail': 'حساب کاربری شما غیرفعال است.'}, status=status.HTTP_401_UNAUTHORIZED)
 
         refresh = RefreshToken.for_user(user)
-        logger.info(f"User {phone_number} logged in successfully.")
+        logger.info("User %s logged in successfully.", phone_number)
         return Response({
             'refresh': str(refresh),
             'access': str(refresh.access_token),
@@ -206,805 +226,169 @@ class HabitDetail(UserSpecificForeignKeyDetailViewSet):
     serializer_class = HabitSerializer
 
 
-class ToolUpdateUserProfileDetailsView(APIView):
-    permission_classes = [IsMetisToolCallback]
-    http_method_names = ['patch']
-
-    def patch(self, request, *args, **kwargs):
-        logger.info(f"Tool {self.__class__.__name__} - Request Query Params: {request.query_params}")
-        logger.info(f"Tool {self.__class__.__name__} - Request Data: {request.data}")
-        user_id = request.data.get('user_id')
-        if not user_id:
-            logger.error(f"Tool {self.__class__.__name__}: 'user_id' NOT FOUND in request data: {request.data}")
-            return Response({"error": "User ID ('user_id') is required in the request data."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        try:
-            user_id_int = int(user_id)
-            user = User.objects.get(id=user_id_int)
-        except ValueError:
-            logger.error(f"Tool {self.__class__.__name__}: Invalid 'user_id' format: {user_id}.")
-            return Response({"error": "Invalid User ID format."}, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
-            logger.error(f"Tool {self.__class__.__name__}: User with ID {user_id} not found.")
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-        profile_data_for_serializer = request.data.copy()
-        profile_data_for_serializer.pop('user_id', None)
-        defaults_for_create = profile_data_for_serializer.copy()
-        profile, created = UserProfile.objects.get_or_create(user=user, defaults=defaults_for_create)
-        serializer = UserProfileSerializer(profile, data=profile_data_for_serializer, partial=True,
-                                           context={'request': request})
-        if serializer.is_valid():
-            serializer.save()
-            action_message = 'ایجاد' if created else 'به‌روز'
-            response_status_code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
-            logger.info(f"Tool: UserProfile details {action_message} for user {user.phone_number}.")
-            return Response({"status": "success",
-                             "message": f"جزئیات پروفایل کاربر {user.phone_number} با موفقیت {action_message} شد.",
-                             "data": serializer.data}, status=response_status_code)
-        else:
-            logger.error(
-                f"Tool: Error updating/creating user profile details for {user.phone_number}: {serializer.errors}")
-            return Response(
-                {"status": "error", "message": "خطا در به‌روزرسانی جزئیات پروفایل.", "errors": serializer.errors},
-                status=status.HTTP_400_BAD_REQUEST)
-
-
-class ToolUpdateHealthRecordView(APIView):
-    permission_classes = [IsMetisToolCallback]
-    http_method_names = ['patch']
-
-    def patch(self, request, *args, **kwargs):
-        logger.info(f"Tool {self.__class__.__name__} - Request Query Params: {request.query_params}")
-        logger.info(f"Tool {self.__class__.__name__} - Request Data: {request.data}")
-        user_id = request.data.get('user_id')
-        if not user_id:
-            logger.error(f"Tool {self.__class__.__name__}: 'user_id' NOT FOUND in request data: {request.data}")
-            return Response({"error": "User ID ('user_id') is required in the request data for tool calls."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        try:
-            user_id_int = int(user_id)
-            user = User.objects.get(id=user_id_int)
-        except ValueError:
-            logger.error(f"Tool {self.__class__.__name__}: Invalid 'user_id' format: {user_id}.")
-            return Response({"error": f"Invalid User ID format: '{user_id}'. Must be an integer."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
-            logger.error(f"Tool {self.__class__.__name__}: User with ID {user_id} not found.")
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-        health_data_for_serializer = request.data.copy()
-        health_data_for_serializer.pop('user_id', None)
-        defaults_for_create = health_data_for_serializer.copy()
-        record, created = HealthRecord.objects.get_or_create(user=user, defaults=defaults_for_create)
-        serializer = HealthRecordSerializer(instance=record, data=health_data_for_serializer, partial=True,
-                                            context={'request': request})
-        if serializer.is_valid():
-            serializer.save()
-            action_message = 'ایجاد' if created else 'به‌روز'
-            response_status_code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
-            logger.info(f"Tool: HealthRecord {action_message} for user {user.phone_number}.")
-            return Response({"status": "success",
-                             "message": f"اطلاعات سلامتی کاربر {user.phone_number} با موفقیت {action_message} شد.",
-                             "data": serializer.data}, status=response_status_code)
-        else:
-            logger.error(
-                f"Tool: Error updating/creating HealthRecord for user {user.phone_number}: {serializer.errors}")
-            return Response(
-                {"status": "error", "message": "خطا در اعتبارسنجی اطلاعات سلامتی.", "errors": serializer.errors},
-                status=status.HTTP_400_BAD_REQUEST)
-
-
-class ToolUpdatePsychologicalProfileView(APIView):
-    permission_classes = [IsMetisToolCallback]
-    http_method_names = ['patch']
-
-    def patch(self, request, *args, **kwargs):
-        logger.info(f"Tool {self.__class__.__name__} - Request Query Params: {request.query_params}")
-        logger.info(f"Tool {self.__class__.__name__} - Request Data: {request.data}")
-        user_id = request.data.get('user_id')
-        if not user_id:
-            logger.error(f"Tool {self.__class__.__name__}: 'user_id' NOT FOUND in request data: {request.data}")
-            return Response({"error": "User ID ('user_id') is required in the request data."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        try:
-            user_id_int = int(user_id)
-            user = User.objects.get(id=user_id_int)
-        except ValueError:
-            logger.error(f"Tool {self.__class__.__name__}: Invalid 'user_id' format: {user_id}.")
-            return Response({"error": "Invalid User ID format."}, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
-            logger.error(f"Tool {self.__class__.__name__}: User with ID {user_id} not found.")
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-        data_for_serializer = request.data.copy()
-        data_for_serializer.pop('user_id', None)
-        defaults_for_create = data_for_serializer.copy()
-        record, created = PsychologicalProfile.objects.get_or_create(user=user, defaults=defaults_for_create)
-        serializer = PsychologicalProfileSerializer(record, data=data_for_serializer, partial=True,
-                                                    context={'request': request})
-        if serializer.is_valid():
-            serializer.save()
-            action_message = 'ایجاد' if created else 'به‌روز'
-            response_status_code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
-            logger.info(f"Tool: PsychologicalProfile {action_message} for user {user.phone_number}.")
-            return Response({"status": "success",
-                             "message": f"پروفایل روانشناختی کاربر {user.phone_number} با موفقیت {action_message} شد.",
-                             "data": serializer.data}, status=response_status_code)
-        else:
-            logger.error(
-                f"Tool: Error updating/creating PsychologicalProfile for user {user.phone_number}: {serializer.errors}")
-            return Response({"status": "error", "message": "خطا در پروفایل روانشناختی.", "errors": serializer.errors},
-                            status=status.HTTP_400_BAD_REQUEST)
-
-
-class ToolUpdateCareerEducationView(APIView):
-    permission_classes = [IsMetisToolCallback]
-    http_method_names = ['patch']
-
-    def patch(self, request, *args, **kwargs):
-        logger.info(f"Tool {self.__class__.__name__} - Request Query Params: {request.query_params}")
-        logger.info(f"Tool {self.__class__.__name__} - Request Data: {request.data}")
-        user_id = request.data.get('user_id')
-        if not user_id:
-            logger.error(f"Tool {self.__class__.__name__}: 'user_id' NOT FOUND in request data: {request.data}")
-            return Response({"error": "User ID ('user_id') is required in the request data."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        try:
-            user_id_int = int(user_id)
-            user = User.objects.get(id=user_id_int)
-        except ValueError:
-            logger.error(f"Tool {self.__class__.__name__}: Invalid 'user_id' format: {user_id}.")
-            return Response({"error": "Invalid User ID format."}, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
-            logger.error(f"Tool {self.__class__.__name__}: User with ID {user_id} not found.")
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-        data_for_serializer = request.data.copy()
-        data_for_serializer.pop('user_id', None)
-        defaults_for_create = data_for_serializer.copy()
-        record, created = CareerEducation.objects.get_or_create(user=user, defaults=defaults_for_create)
-        serializer = CareerEducationSerializer(record, data=data_for_serializer, partial=True,
-                                               context={'request': request})
-        if serializer.is_valid():
-            serializer.save()
-            action_message = 'ایجاد' if created else 'به‌روز'
-            response_status_code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
-            logger.info(f"Tool: CareerEducation {action_message} for user {user.phone_number}.")
-            return Response({"status": "success",
-                             "message": f"اطلاعات شغلی/تحصیلی کاربر {user.phone_number} با موفقیت {action_message} شد.",
-                             "data": serializer.data}, status=response_status_code)
-        else:
-            logger.error(
-                f"Tool: Error updating/creating CareerEducation for user {user.phone_number}: {serializer.errors}")
-            return Response({"status": "error", "message": "خطا در اطلاعات شغلی/تحصیلی.", "errors": serializer.errors},
-                            status=status.HTTP_400_BAD_REQUEST)
-
-
-class ToolUpdateFinancialInfoView(APIView):
-    permission_classes = [IsMetisToolCallback]
-    http_method_names = ['patch']
-
-    def patch(self, request, *args, **kwargs):
-        logger.info(f"Tool {self.__class__.__name__} - Request Query Params: {request.query_params}")
-        logger.info(f"Tool {self.__class__.__name__} - Request Data: {request.data}")
-        user_id = request.data.get('user_id')
-        if not user_id:
-            logger.error(f"Tool {self.__class__.__name__}: 'user_id' NOT FOUND in request data: {request.data}")
-            return Response({"error": "User ID ('user_id') is required in the request data."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        try:
-            user_id_int = int(user_id)
-            user = User.objects.get(id=user_id_int)
-        except ValueError:
-            logger.error(f"Tool {self.__class__.__name__}: Invalid 'user_id' format: {user_id}.")
-            return Response({"error": "Invalid User ID format."}, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
-            logger.error(f"Tool {self.__class__.__name__}: User with ID {user_id} not found.")
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-        data_for_serializer = request.data.copy()
-        data_for_serializer.pop('user_id', None)
-        defaults_for_create = data_for_serializer.copy()
-        record, created = FinancialInfo.objects.get_or_create(user=user, defaults=defaults_for_create)
-        serializer = FinancialInfoSerializer(record, data=data_for_serializer, partial=True,
-                                             context={'request': request})
-        if serializer.is_valid():
-            serializer.save()
-            action_message = 'ایجاد' if created else 'به‌روز'
-            response_status_code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
-            logger.info(f"Tool: FinancialInfo {action_message} for user {user.phone_number}.")
-            return Response({"status": "success",
-                             "message": f"اطلاعات مالی کاربر {user.phone_number} با موفقیت {action_message} شد.",
-                             "data": serializer.data}, status=response_status_code)
-        else:
-            logger.error(
-                f"Tool: Error updating/creating FinancialInfo for user {user.phone_number}: {serializer.errors}")
-            return Response({"status": "error", "message": "خطا در اطلاعات مالی.", "errors": serializer.errors},
-                            status=status.HTTP_400_BAD_REQUEST)
-
-
-class ToolUpdateSocialRelationshipView(APIView):
-    permission_classes = [IsMetisToolCallback]
-    http_method_names = ['patch']
-
-    def patch(self, request, *args, **kwargs):
-        logger.info(f"Tool {self.__class__.__name__} - Request Query Params: {request.query_params}")
-        logger.info(f"Tool {self.__class__.__name__} - Request Data: {request.data}")
-        user_id = request.data.get('user_id')
-        if not user_id:
-            logger.error(f"Tool {self.__class__.__name__}: 'user_id' NOT FOUND in request data: {request.data}")
-            return Response({"error": "User ID ('user_id') is required in the request data."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        try:
-            user_id_int = int(user_id)
-            user = User.objects.get(id=user_id_int)
-        except ValueError:
-            logger.error(f"Tool {self.__class__.__name__}: Invalid 'user_id' format: {user_id}.")
-            return Response({"error": "Invalid User ID format."}, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
-            logger.error(f"Tool {self.__class__.__name__}: User with ID {user_id} not found.")
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-        data_for_serializer = request.data.copy()
-        data_for_serializer.pop('user_id', None)
-        defaults_for_create = data_for_serializer.copy()
-        record, created = SocialRelationship.objects.get_or_create(user=user, defaults=defaults_for_create)
-        serializer = SocialRelationshipSerializer(record, data=data_for_serializer, partial=True,
-                                                  context={'request': request})
-        if serializer.is_valid():
-            serializer.save()
-            action_message = 'ایجاد' if created else 'به‌روز'
-            response_status_code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
-            logger.info(f"Tool: SocialRelationship {action_message} for user {user.phone_number}.")
-            return Response({"status": "success",
-                             "message": f"اطلاعات روابط اجتماعی کاربر {user.phone_number} با موفقیت {action_message} شد.",
-                             "data": serializer.data}, status=response_status_code)
-        else:
-            logger.error(
-                f"Tool: Error updating/creating SocialRelationship for user {user.phone_number}: {serializer.errors}")
-            return Response(
-                {"status": "error", "message": "خطا در اطلاعات روابط اجتماعی.", "errors": serializer.errors},
-                status=status.HTTP_400_BAD_REQUEST)
-
-
-class ToolUpdatePreferenceInterestView(APIView):
-    permission_classes = [IsMetisToolCallback]
-    http_method_names = ['patch']
-
-    def patch(self, request, *args, **kwargs):
-        logger.info(f"Tool {self.__class__.__name__} - Request Query Params: {request.query_params}")
-        logger.info(f"Tool {self.__class__.__name__} - Request Data: {request.data}")
-        user_id = request.data.get('user_id')
-        if not user_id:
-            logger.error(f"Tool {self.__class__.__name__}: 'user_id' NOT FOUND in request data: {request.data}")
-            return Response({"error": "User ID ('user_id') is required in the request data."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        try:
-            user_id_int = int(user_id)
-            user = User.objects.get(id=user_id_int)
-        except ValueError:
-            logger.error(f"Tool {self.__class__.__name__}: Invalid 'user_id' format: {user_id}.")
-            return Response({"error": "Invalid User ID format."}, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
-            logger.error(f"Tool {self.__class__.__name__}: User with ID {user_id} not found.")
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-        data_for_serializer = request.data.copy()
-        data_for_serializer.pop('user_id', None)
-        defaults_for_create = data_for_serializer.copy()
-        record, created = PreferenceInterest.objects.get_or_create(user=user, defaults=defaults_for_create)
-        serializer = PreferenceInterestSerializer(record, data=data_for_serializer, partial=True,
-                                                  context={'request': request})
-        if serializer.is_valid():
-            serializer.save()
-            action_message = 'ایجاد' if created else 'به‌روز'
-            response_status_code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
-            logger.info(f"Tool: PreferenceInterest {action_message} for user {user.phone_number}.")
-            return Response({"status": "success",
-                             "message": f"ترجیحات و علایق کاربر {user.phone_number} با موفقیت {action_message} شد.",
-                             "data": serializer.data}, status=response_status_code)
-        else:
-            logger.error(
-                f"Tool: Error updating/creating PreferenceInterest for user {user.phone_number}: {serializer.errors}")
-            return Response({"status": "error", "message": "خطا در ترجیحات و علایق.", "errors": serializer.errors},
-                            status=status.HTTP_400_BAD_REQUEST)
-
-
-class ToolUpdateEnvironmentalContextView(APIView):
+class ToolCallbackView(APIView):
+    """
+    A Metis tool callback (/tools/...), served from its tool_dispatch.TOOL_REGISTRY entry; urls.py binds each
+    tool path with ToolCallbackView.for_tool(name). A retried call with the same idempotency key gets the
+    first call's response back.
+    """
     permission_classes = [IsMetisToolCallback]
-    http_method_names = ['patch']
-
-    def patch(self, request, *args, **kwargs):
-        logger.info(f"Tool {self.__class__.__name__} - Request Query Params: {request.query_params}")
-        logger.info(f"Tool {self.__class__.__name__} - Request Data: {request.data}")
-        user_id = request.data.get('user_id')
-        if not user_id:
-            logger.error(f"Tool {self.__class__.__name__}: 'user_id' NOT FOUND in request data: {request.data}")
-            return Response({"error": "User ID ('user_id') is required in the request data."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        try:
-            user_id_int = int(user_id)
-            user = User.objects.get(id=user_id_int)
-        except ValueError:
-            logger.error(f"Tool {self.__class__.__name__}: Invalid 'user_id' format: {user_id}.")
-            return Response({"error": "Invalid User ID format."}, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
-            logger.error(f"Tool {self.__class__.__name__}: User with ID {user_id} not found.")
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-        data_for_serializer = request.data.copy()
-        data_for_serializer.pop('user_id', None)
-        defaults_for_create = data_for_serializer.copy()
-        record, created = EnvironmentalContext.objects.get_or_create(user=user, defaults=defaults_for_create)
-        serializer = EnvironmentalContextSerializer(record, data=data_for_serializer, partial=True,
-                                                    context={'request': request})
-        if serializer.is_valid():
-            serializer.save()
-            action_message = 'ایجاد' if created else 'به‌روز'
-            response_status_code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
-            logger.info(f"Tool: EnvironmentalContext {action_message} for user {user.phone_number}.")
-            return Response({"status": "success",
-                             "message": f"زمینه محیطی کاربر {user.phone_number} با موفقیت {action_message} شد.",
-                             "data": serializer.data}, status=response_status_code)
-        else:
-            logger.error(
-                f"Tool: Error updating/creating EnvironmentalContext for user {user.phone_number}: {serializer.errors}")
-            return Response({"status": "error", "message": "خطا در زمینه محیطی.", "errors": serializer.errors},
-                            status=status.HTTP_400_BAD_REQUEST)
+    tool = None
 
+    @classmethod
+    def for_tool(cls, name):
+        return cls.as_view(tool=name, http_method_names=[TOOL_REGISTRY[name].method])
 
-class ToolUpdateRealTimeDataView(APIView):
-    permission_classes = [IsMetisToolCallback]
-    http_method_names = ['patch']
+    def handle_tool(self, request, pk=None, *args, **kwargs):
+        return run_idempotent(f'tool:{self.tool}', request.data.get('user_id'), get_idempotency_key(request),
+                              lambda: self._run_tool(request, pk), request_fingerprint(request))
 
-    def patch(self, request, *args, **kwargs):
-        logger.info(f"Tool {self.__class__.__name__} - Request Query Params: {request.query_params}")
-        logger.info(f"Tool {self.__class__.__name__} - Request Data: {request.data}")
+    def _run_tool(self, request, pk=None):
+        spec = TOOL_REGISTRY[self.tool]
         user_id = request.data.get('user_id')
-        if not user_id:
-            logger.error(f"Tool {self.__class__.__name__}: 'user_id' NOT FOUND in request data: {request.data}")
-            return Response({"error": "User ID ('user_id') is required in the request data."},
-                            status=status.HTTP_400_BAD_REQUEST)
         try:
-            user_id_int = int(user_id)
-            user = User.objects.get(id=user_id_int)
-        except ValueError:
-            logger.error(f"Tool {self.__class__.__name__}: Invalid 'user_id' format: {user_id}.")
-            return Response({"error": "Invalid User ID format."}, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
-            logger.error(f"Tool {self.__class__.__name__}: User with ID {user_id} not found.")
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-        data_for_serializer = request.data.copy()
-        data_for_serializer.pop('user_id', None)
-        data_for_serializer.pop('timestamp', None)
-        defaults_for_create = data_for_serializer.copy()
-        record, created = RealTimeData.objects.get_or_create(user=user, defaults=defaults_for_create)
-        serializer = RealTimeDataSerializer(record, data=data_for_serializer, partial=True,
+            user = get_tool_user(user_id)
+            payload, status_code = run_tool(spec, user, request.data, pk=request.data.get('pk') if pk is None else pk,
                                             context={'request': request})
-        if serializer.is_valid():
-            serializer.save()
-            action_message = 'ایجاد' if created else 'به‌روز'
-            response_status_code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
-            logger.info(f"Tool: RealTimeData {action_message} for user {user.phone_number}.")
-            return Response({"status": "success",
-                             "message": f"داده‌های بلادرنگ کاربر {user.phone_number} با موفقیت {action_message} شد.",
-                             "data": serializer.data}, status=response_status_code)
-        else:
-            logger.error(
-                f"Tool: Error updating/creating RealTimeData for user {user.phone_number}: {serializer.errors}")
-            return Response({"status": "error", "message": "خطا در داده‌های بلادرنگ.", "errors": serializer.errors},
-                            status=status.HTTP_400_BAD_REQUEST)
-
-
-class ToolUpdateFeedbackLearningView(APIView):
-    permission_classes = [IsMetisToolCallback]
-    http_method_names = ['post']
-
-    def post(self, request, *args, **kwargs):
-        logger.info(f"Tool {self.__class__.__name__} (POST) - Request Query Params: {request.query_params}")
-        logger.info(f"Tool {self.__class__.__name__} (POST) - Request Data: {request.data}")
-        user_id = request.data.get('user_id')
-        if not user_id:
-            logger.error(f"Tool {self.__class__.__name__}: 'user_id' NOT FOUND in request data: {request.data}")
-            return Response({"error": "User ID ('user_id') is required in the request data."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        try:
-            user_id_int = int(user_id)
-            user = User.objects.get(id=user_id_int)
-        except ValueError:
-            logger.error(f"Tool {self.__class__.__name__}: Invalid 'user_id' format: {user_id}.")
-            return Response({"error": "Invalid User ID format."}, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
-            logger.error(f"Tool {self.__class__.__name__}: User with ID {user_id} not found.")
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-        feedback_data_for_serializer = request.data.copy()
-        feedback_data_for_serializer.pop('user_id', None)
-        feedback_data_for_serializer.pop('timestamp', None)
-        serializer = FeedbackLearningSerializer(data=feedback_data_for_serializer, context={'request': request})
-        if serializer.is_valid():
-            serializer.save(user=user)
-            logger.info(f"Tool: New FeedbackLearning created for user {user.phone_number}.")
-            return Response(
-                {"status": "success", "message": f"بازخورد جدید برای کاربر {user.phone_number} با موفقیت ایجاد شد.",
-                 "data": serializer.data}, status=status.HTTP_201_CREATED)
-        else:
-            logger.error(f"Tool: Error creating FeedbackLearning for user {user.phone_number}: {serializer.errors}")
-            return Response(
-                {"status": "error", "message": "خطا در ایجاد بازخورد و یادگیری.", "errors": serializer.errors},
-                status=status.HTTP_400_BAD_REQUEST)
-
-
-class ToolCreateGoalView(APIView):
-    permission_classes = [IsMetisToolCallback]
-    http_method_names = ['post']
-
-    def post(self, request, *args, **kwargs):
-        logger.info(f"Tool {self.__class__.__name__} - Request Query Params: {request.query_params}")
-        logger.info(f"Tool {self.__class__.__name__} - Request Data: {request.data}")
-        user_id = request.data.get('user_id')
-        if not user_id:
-            logger.error(f"Tool {self.__class__.__name__}: 'user_id' NOT FOUND in request data: {request.data}")
-            return Response({"error": "User ID ('user_id') is required in the request data."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        try:
-            user_id_int = int(user_id)
-            user = User.objects.get(id=user_id_int)
-        except ValueError:
-            logger.error(f"Tool {self.__class__.__name__}: Invalid 'user_id' format: {user_id}.")
-            return Response({"error": "Invalid User ID format."}, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
-            logger.error(f"Tool {self.__class__.__name__}: User with ID {user_id} not found.")
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-        goal_data_for_serializer = request.data.copy()
-        goal_data_for_serializer.pop('user_id', None)
-        serializer = GoalSerializer(data=goal_data_for_serializer, context={'request': request})
-        if serializer.is_valid():
-            goal = serializer.save(user=user)
-            logger.info(f"Tool: Goal created for user {user.phone_number}: {goal.id}")
-            return Response({"status": "success", "message": f"هدف با موفقیت برای کاربر {user.phone_number} ذخیره شد.",
-                             "data": serializer.data}, status=status.HTTP_201_CREATED)
-        else:
-            logger.error(f"Tool: Error creating goal for user {user.phone_number}: {serializer.errors}")
-            return Response({"status": "error", "message": "خطا در ذخیره هدف.", "errors": serializer.errors},
-                            status=status.HTTP_400_BAD_REQUEST)
-
-
-class ToolUpdateGoalView(APIView):
-    permission_classes = [IsMetisToolCallback]
-    http_method_names = ['patch']
-
-    def patch(self, request, *args, **kwargs):
-        logger.info(f"Tool {self.__class__.__name__} - Request Query Params: {request.query_params}")
-        logger.info(f"Tool {self.__class__.__name__} - Request Data: {request.data}")
-        user_id = request.data.get('user_id')
-        pk = request.data.get('pk')
-        if not user_id:
-            logger.error(f"Tool {self.__class__.__name__}: 'user_id' NOT FOUND in request data: {request.data}")
-            return Response({"error": "User ID ('user_id') is required in the request data."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        if not pk:
-            logger.error(f"Tool {self.__class__.__name__}: 'pk' NOT FOUND in request data: {request.data}")
-            return Response({"error": "Goal PK ('pk') is required in the request data."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        try:
-            user_id_int = int(user_id)
-            pk_int = int(pk)
-            user = User.objects.get(id=user_id_int)
-        except ValueError:
-            logger.error(f"Tool {self.__class__.__name__}: Invalid 'user_id' or 'pk' format.")
-            return Response({"error": "Invalid User ID or PK format."}, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
-            logger.error(f"Tool {self.__class__.__name__}: User with ID {user_id} not found.")
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-        goal = get_object_or_404(Goal, pk=pk_int, user=user)
-        goal_data_for_serializer = request.data.copy()
-        goal_data_for_serializer.pop('user_id', None)
-        goal_data_for_serializer.pop('pk', None)
-        serializer = GoalSerializer(goal, data=goal_data_for_serializer, partial=True, context={'request': request})
-        if serializer.is_valid():
-            serializer.save()
-            logger.info(f"Tool: Goal {pk_int} updated for user {user.phone_number}.")
-            return Response(
-                {"status": "success", "message": f"هدف {pk_int} کاربر {user.phone_number} با موفقیت به‌روز شد.",
-                 "data": serializer.data}, status=status.HTTP_200_OK)
-        else:
-            logger.error(f"Tool: Error updating goal {pk_int} for {user.phone_number}: {serializer.errors}")
-            return Response({"status": "error", "message": "خطا در به‌روزرسانی هدف.", "errors": serializer.errors},
-                            status=status.HTTP_400_BAD_REQUEST)
-
-
-class ToolDeleteGoalView(APIView):
-    permission_classes = [IsMetisToolCallback]
-    http_method_names = ['delete']
-
-    def delete(self, request, *args, **kwargs):
-        logger.info(f"Tool {self.__class__.__name__} - Request Query Params: {request.query_params}")
-        logger.info(f"Tool {self.__class__.__name__} - Request Data: {request.data}")
-        user_id = request.data.get('user_id')
-        pk = request.data.get('pk')
-        if not user_id:
-            logger.error(f"Tool {self.__class__.__name__}: 'user_id' NOT FOUND in request data: {request.data}")
-            return Response({"error": "User ID ('user_id') is required in the request data."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        if not pk:
-            logger.error(f"Tool {self.__class__.__name__}: 'pk' NOT FOUND in request data: {request.data}")
-            return Response({"error": "Goal PK ('pk') is required in the request data."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        try:
-            user_id_int = int(user_id)
-            pk_int = int(pk)
-            user = User.objects.get(id=user_id_int)
-        except ValueError:
-            logger.error(f"Tool {self.__class__.__name__}: Invalid 'user_id' or 'pk' format.")
-            return Response({"error": "Invalid User ID or PK format."}, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
-            logger.error(f"Tool {self.__class__.__name__}: User with ID {user_id} not found.")
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-        goal = get_object_or_404(Goal, pk=pk_int, user=user)
-        goal.delete()
-        logger.info(f"Tool: Goal {pk_int} deleted for user {user.phone_number}.")
-        return Response({"status": "success", "message": f"هدف {pk_int} کاربر {user.phone_number} با موفقیت حذف شد."},
-                        status=status.HTTP_204_NO_CONTENT)
-
-
-class ToolCreateHabitView(APIView):
-    permission_classes = [IsMetisToolCallback]
-    http_method_names = ['post']
-
-    def post(self, request, *args, **kwargs):
-        logger.info(f"Tool {self.__class__.__name__} - Request Query Params: {request.query_params}")
-        logger.info(f"Tool {self.__class__.__name__} - Request Data: {request.data}")
-        user_id = request.data.get('user_id')
-        if not user_id:
-            logger.error(f"Tool {self.__class__.__name__}: 'user_id' NOT FOUND in request data: {request.data}")
-            return Response({"error": "User ID ('user_id') is required in the request data."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        try:
-            user_id_int = int(user_id)
-            user = User.objects.get(id=user_id_int)
-        except ValueError:
-            logger.error(f"Tool {self.__class__.__name__}: Invalid 'user_id' format: {user_id}.")
-            return Response({"error": "Invalid User ID format."}, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
-            logger.error(f"Tool {self.__class__.__name__}: User with ID {user_id} not found.")
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-        habit_data_for_serializer = request.data.copy()
-        habit_data_for_serializer.pop('user_id', None)
-        serializer = HabitSerializer(data=habit_data_for_serializer, context={'request': request})
-        if serializer.is_valid():
-            habit = serializer.save(user=user)
-            logger.info(f"Tool: Habit created for user {user.phone_number}: {habit.id}")
-            return Response({"status": "success", "message": f"عادت با موفقیت برای کاربر {user.phone_number} ذخیره شد.",
-                             "data": serializer.data}, status=status.HTTP_201_CREATED)
-        else:
-            logger.error(f"Tool: Error creating habit for user {user.phone_number}: {serializer.errors}")
-            return Response({"status": "error", "message": "خطا در ذخیره عادت.", "errors": serializer.errors},
-                            status=status.HTTP_400_BAD_REQUEST)
-
-
-class ToolUpdateHabitView(APIView):
-    permission_classes = [IsMetisToolCallback]
-    http_method_names = ['patch']
+        except ToolError as e:
+            logger.warning("Tool %s failed for user %s: %s", spec.name, user_id, e.payload)
+            return Response(e.payload, status=e.status_code)
+        logger.info("Tool %s applied for user %s (%s).", spec.name, user_id, status_code)
+        return Response(payload, status=status_code)
 
-    def patch(self, request, pk, *args, **kwargs):
-        logger.info(f"Tool {self.__class__.__name__} - Request Query Params: {request.query_params}")
-        logger.info(f"Tool {self.__class__.__name__} - Request Data: {request.data}")
-        logger.info(f"Tool {self.__class__.__name__} - PK from URL: {pk}")
-        user_id = request.data.get('user_id')
-        if not user_id:
-            logger.error(f"Tool {self.__class__.__name__}: 'user_id' NOT FOUND in request data: {request.data}")
-            return Response({"error": "User ID ('user_id') is required in the request data."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        try:
-            user_id_int = int(user_id)
-            pk_int = int(pk)
-            user = User.objects.get(id=user_id_int)
-        except ValueError:
-            logger.error(f"Tool {self.__class__.__name__}: Invalid 'user_id' or 'pk' format.")
-            return Response({"error": "Invalid User ID or PK format."}, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
-            logger.error(f"Tool {self.__class__.__name__}: User with ID {user_id} not found.")
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-        habit = get_object_or_404(Habit, pk=pk_int, user=user)
-        habit_data_for_serializer = request.data.copy()
-        habit_data_for_serializer.pop('user_id', None)
-        serializer = HabitSerializer(habit, data=habit_data_for_serializer, partial=True, context={'request': request})
-        if serializer.is_valid():
-            serializer.save()
-            logger.info(f"Tool: Habit {pk_int} updated for user {user.phone_number}.")
-            return Response(
-                {"status": "success", "message": f"عادت {pk_int} کاربر {user.phone_number} با موفقیت به‌روز شد.",
-                 "data": serializer.data}, status=status.HTTP_200_OK)
-        else:
-            logger.error(f"Tool: Error updating habit {pk_int} for {user.phone_number}: {serializer.errors}")
-            return Response({"status": "error", "message": "خطا در به‌روزرسانی عادت.", "errors": serializer.errors},
-                            status=status.HTTP_400_BAD_REQUEST)
+    post = patch = delete = handle_tool
 
 
-class ToolDeleteHabitView(APIView):
-    permission_classes = [IsMetisToolCallback]
-    http_method_names = ['delete']
-
-    def delete(self, request, pk, *args, **kwargs):
-        logger.info(f"Tool {self.__class__.__name__} - Request Query Params: {request.query_params}")
-        logger.info(f"Tool {self.__class__.__name__} - Request Data: {request.data}")
-        logger.info(f"Tool {self.__class__.__name__} - PK from URL: {pk}")
-        user_id = request.data.get('user_id')
-        if not user_id:
-            logger.error(
-                f"Tool {self.__class__.__name__}: 'user_id' must be provided in request data for DELETE with PK in URL.")
-            return Response({"error": "User ID ('user_id') is required in the request data for this operation."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        try:
-            user_id_int = int(user_id)
-            pk_int = int(pk)
-            user = User.objects.get(id=user_id_int)
-        except ValueError:
-            logger.error(f"Tool {self.__class__.__name__}: Invalid 'user_id' or 'pk' format.")
-            return Response({"error": "Invalid User ID or PK format."}, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
-            logger.error(f"Tool {self.__class__.__name__}: User with ID {user_id} not found.")
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-        habit = get_object_or_404(Habit, pk=pk_int, user=user)
-        habit_owner_phone = habit.user.phone_number
-        habit.delete()
-        logger.info(f"Tool: Habit {pk_int} deleted for user {habit_owner_phone}.")
-        return Response({"status": "success", "message": f"عادت {pk_int} کاربر {habit_owner_phone} با موفقیت حذف شد."},
-                        status=status.HTTP_204_NO_CONTENT)
-
-
-class ToolCreatePsychTestRecordView(APIView):
+class ToolBatchView(APIView):
+    """
+    Several tool calls for one user in one request: {"user_id": ..., "operations": [{"tool": ..., ...}, ...]}.
+    They run in one transaction with a single user lookup; the response lists each operation's result.
+    """
     permission_classes = [IsMetisToolCallback]
     http_method_names = ['post']
+    tool = 'batch'
 
     def post(self, request, *args, **kwargs):
-        logger.info(f"Tool {self.__class__.__name__} - Request Query Params: {request.query_params}")
-        logger.info(f"Tool {self.__class__.__name__} - Request Data: {request.data}")
-        user_id = request.data.get('user_id')
-        if not user_id:
-            logger.error(f"Tool {self.__class__.__name__}: 'user_id' NOT FOUND in request data: {request.data}")
-            return Response({"error": "User ID ('user_id') is required in the request data."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        try:
-            user_id_int = int(user_id)
-            user = User.objects.get(id=user_id_int)
-        except ValueError:
-            logger.error(f"Tool {self.__class__.__name__}: Invalid 'user_id' format: {user_id}.")
-            return Response({"error": "Invalid User ID format."}, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
-            logger.error(f"Tool {self.__class__.__name__}: User with ID {user_id} not found.")
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-        test_data_for_serializer = request.data.copy()
-        test_data_for_serializer.pop('user_id', None)
-        serializer = PsychTestHistorySerializer(data=test_data_for_serializer, context={'request': request})
-        if serializer.is_valid():
-            psych_test_record = serializer.save(user=user)
-            logger.info(f"Tool: PsychTestHistory record created for user {user.phone_number}: {psych_test_record.id}")
-            return Response({"status": "success",
-                             "message": f"رکورد تست روانشناسی با موفقیت برای کاربر {user.phone_number} ذخیره شد.",
-                             "data": serializer.data}, status=status.HTTP_201_CREATED)
-        else:
-            logger.error(
-                f"Tool: Error creating PsychTestHistory record for user {user.phone_number}: {serializer.errors}")
-            return Response(
-                {"status": "error", "message": "خطا در ذخیره رکورد تست روانشناسی.", "errors": serializer.errors},
-                status=status.HTTP_400_BAD_REQUEST)
-
-
-class ToolUpdatePsychTestRecordView(APIView):
-    permission_classes = [IsMetisToolCallback]
-    http_method_names = ['patch']
-
-    def patch(self, request, *args, **kwargs):
-        logger.info(f"Tool {self.__class__.__name__} - Request Query Params: {request.query_params}")
-        logger.info(f"Tool {self.__class__.__name__} - Request Data: {request.data}")
-        user_id = request.data.get('user_id')
-        pk = request.data.get('pk')
-        if not user_id:
-            logger.error(f"Tool {self.__class__.__name__}: 'user_id' NOT FOUND in request data: {request.data}")
-            return Response({"error": "User ID ('user_id') is required in the request data."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        if not pk:
-            logger.error(f"Tool {self.__class__.__name__}: 'pk' NOT FOUND in request data: {request.data}")
-            return Response({"error": "PsychTestHistory PK ('pk') is required in the request data."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        try:
-            user_id_int = int(user_id)
-            pk_int = int(pk)
-            user = User.objects.get(id=user_id_int)
-        except ValueError:
-            logger.error(f"Tool {self.__class__.__name__}: Invalid 'user_id' or 'pk' format.")
-            return Response({"error": "Invalid User ID or PK format."}, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
-            logger.error(f"Tool {self.__class__.__name__}: User with ID {user_id} not found.")
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-        psych_test_record = get_object_or_404(PsychTestHistory, pk=pk_int, user=user)
-        test_data_for_serializer = request.data.copy()
-        test_data_for_serializer.pop('user_id', None)
-        test_data_for_serializer.pop('pk', None)
-        serializer = PsychTestHistorySerializer(psych_test_record, data=test_data_for_serializer, partial=True,
-                                                context={'request': request})
-        if serializer.is_valid():
-            serializer.save()
-            logger.info(f"Tool: PsychTestHistory record {pk_int} updated for user {user.phone_number}.")
-            return Response({"status": "success",
-                             "message": f"رکورد تست روانشناسی {pk_int} کاربر {user.phone_number} با موفقیت به‌روز شد.",
-                             "data": serializer.data}, status=status.HTTP_200_OK)
-        else:
-            logger.error(
-                f"Tool: Error updating PsychTestHistory record {pk_int} for {user.phone_number}: {serializer.errors}")
-            return Response(
-                {"status": "error", "message": "خطا در به‌روزرسانی رکورد تست روانشناسی.", "errors": serializer.errors},
-                status=status.HTTP_400_BAD_REQUEST)
-
-
-class ToolDeletePsychTestRecordView(APIView):
-    permission_classes = [IsMetisToolCallback]
-    http_method_names = ['delete']
+        return run_idempotent('tool:batch', request.data.get('user_id'), get_idempotency_key(request),
+                              lambda: self._run_batch(request), request_fingerprint(request))
 
-    def delete(self, request, *args, **kwargs):
-        logger.info(f"Tool {self.__class__.__name__} - Request Query Params: {request.query_params}")
-        logger.info(f"Tool {self.__class__.__name__} - Request Data: {request.data}")
+    def _run_batch(self, request):
         user_id = request.data.get('user_id')
-        pk = request.data.get('pk')
-        if not user_id:
-            logger.error(f"Tool {self.__class__.__name__}: 'user_id' NOT FOUND in request data: {request.data}")
-            return Response({"error": "User ID ('user_id') is required in the request data."},
-                            status=status.HTTP_400_BAD_REQUEST)
-        if not pk:
-            logger.error(f"Tool {self.__class__.__name__}: 'pk' NOT FOUND in request data: {request.data}")
-            return Response({"error": "PsychTestHistory PK ('pk') is required in the request data."},
-                            status=status.HTTP_400_BAD_REQUEST)
         try:
-            user_id_int = int(user_id)
-            pk_int = int(pk)
-            user = User.objects.get(id=user_id_int)
-        except ValueError:
-            logger.error(f"Tool {self.__class__.__name__}: Invalid 'user_id' or 'pk' format.")
-            return Response({"error": "Invalid User ID or PK format."}, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
-            logger.error(f"Tool {self.__class__.__name__}: User with ID {user_id} not found.")
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-        psych_test_record = get_object_or_404(PsychTestHistory, pk=pk_int, user=user)
-        psych_test_record.delete()
-        logger.info(f"Tool: PsychTestHistory record {pk_int} deleted for user {user.phone_number}.")
-        return Response({"status": "success",
-                         "message": f"رکورد تست روانشناسی {pk_int} کاربر {user.phone_number} با موفقیت حذف شد."},
-                        status=status.HTTP_204_NO_CONTENT)
+            operations = parse_batch_operations(request.data.get('operations'))
+            user = get_tool_user(user_id)
+        except ToolError as e:
+            logger.warning("Tool batch failed for user %s: %s", user_id, e.payload)
+            return Response(e.payload, status=e.status_code)
+        results = run_tool_batch(user, operations, context={'request': request})
+        failed = sum(1 for result in results if result['status_code'] >= 400)
+        logger.info("Tool batch applied for user %s: %s operations, %s failed.", user_id, len(results), failed)
+        return Response({"status": "success" if not failed else "partial" if failed < len(results) else "error",
+                         "message": f"{len(results) - failed} از {len(results)} عملیات با موفقیت انجام شد.",
+                         "results": results}, status=status.HTTP_200_OK)
 
 
 # ----------------------------------------------------
 # AIAgentChatView (با منطق تست پویا و خلاصه‌سازی)
 # ----------------------------------------------------
-class AIAgentChatView(APIView):
-    permission_classes = [permissions.IsAuthenticated]
-    http_method_names = ['post']
-
-    def dispatch(self, request, *args, **kwargs):
-        logger.debug(f"Dispatching request to AIAgentChatView: {request.method}, {request.path}")
-        return super().dispatch(request, *args, **kwargs)
-
-    def _get_active_sessions_for_user(self, user):
-        AiResponse.objects.filter(user=user, expires_at__lte=timezone.now(), is_active=True).update(is_active=False)
-        return AiResponse.objects.filter(user=user, is_active=True)
+class ChatTurn:
+    """
+    State of one chat message, carried from the DB planning phase to the Metis call and then to the
+    completion phase. `metis_method`/`metis_kwargs` describe the single Metis round-trip the turn needs
+    (None when the turn is answered locally, e.g. cancelling the profile setup).
+    """
+
+    def __init__(self, user, user_profile, message, session=None):
+        self.user = user
+        self.user_profile = user_profile
+        self.message = message
+        self.session = session
+        # session.updated_at as read in phase 1, to notice concurrent writes before phase 3 appends to it
+        self.session_version = session.updated_at if session else None
+        self.kind = None
+        self.metis_method = None
+        self.metis_kwargs = {}
+        self.context = {}
+        # Sequence number the client already has: the response then carries only newer messages (delta mode)
+        self.history_since = None
+        # True when the message came without session_id and was attached to the user's latest live session
+        self.session_reused = False
+        self.ai_response_content = "خطایی در پردازش رخ داد، لطفا مجددا تلاش کنید."
+
+
+SETUP_TURN_KINDS = ('setup_finish', 'setup_cancel', 'setup_continue')
+
+
+class ChatTurnMixin:
+    """
+    Chat flow shared by the sync (AIAgentChatView) and async (AsyncAIAgentChatView) endpoints.
+    `_plan_chat_turn` and `_complete_chat_turn` only touch the database and each runs in its own short
+    transaction; the Metis call in between is made by the caller with no transaction open, so no connection
+    or row lock is held while Metis answers. `_complete_chat_turn` re-locks the rows it writes and checks
+    they are still in the state phase 1 saw. Both phases return a DRF Response for early exits.
+    """
+
+    def _load_chat_state(self, user, session_id=None, reuse_latest=False):
+        """
+        Everything phase 1 reads, in two queries: the profile joined with its role and annotated with today's
+        message count (the user is the request's own object, so profile.user and user.profile need no query),
+        and the targeted live session if any.
+        Expired sessions count as gone even before the expire_ai_sessions sweeper has flagged them inactive.
+        Without session_id and with `reuse_latest`, the session is the user's most recently used live chat
+        session (outside the profile setup flow). Raises Http404 when the user has no profile.
+        """
+        messages_today = DailyMessageCounter.objects.filter(user=OuterRef('user'), day=timezone.localdate())
+        user_profile = UserProfile.objects.select_related('role').annotate(
+            messages_today=Coalesce(Subquery(messages_today.values('count')[:1]), 0),
+        ).filter(user=user).first()
+        if user_profile is None:
+            raise Http404("No UserProfile matches the given query.")
+        user_profile.user = user
+        session = None
+        if session_id:
+            session = AiResponse.objects.live().filter(user=user, ai_session_id=session_id).first()
+        elif reuse_latest and not user_profile.is_in_profile_setup:
+            session = AiResponse.objects.live().filter(user=user, session_type=AiResponse.TYPE_CHAT) \
+                .order_by('-updated_at', '-id').first()
+        if session is not None:
+            session.user = user
+        return user_profile, session
+
+    def _evict_surplus_sessions(self, user, user_profile: UserProfile):
+        """
+        Makes room for one more chat session within the role's max_active_sessions by deactivating the least
+        recently used live ones (a cap below 1 means unlimited). Runs in phase 3 with the profile row locked.
+        """
+        max_sessions = user_profile.role.max_active_sessions if user_profile.role else 1
+        if max_sessions < 1:
+            return
+        live_sessions = AiResponse.objects.live().filter(user=user, session_type=AiResponse.TYPE_CHAT)
+        surplus_ids = list(live_sessions.order_by('-updated_at', '-id').values_list('id', flat=True)[max_sessions - 1:])
+        if surplus_ids:
+            AiResponse.objects.filter(id__in=surplus_ids).update(is_active=False)
+            logger.info("Evicted %s chat session(s) of user %s to stay within %s active sessions.",
+                        len(surplus_ids), user.phone_number, max_sessions)
 
     def _check_message_limit(self, user_profile: UserProfile, is_profile_setup_flow: bool = False):
         if not user_profile.role:
-            logger.warning(f"User {user_profile.user.phone_number} has no role assigned. Skipping message limit check.")
+            logger.warning("User %s has no role assigned. Skipping message limit check.",
+                           user_profile.user.phone_number)
             return True
         if is_profile_setup_flow:
             return True
-        now = timezone.localdate()
-        if user_profile.last_message_date != now:
-            user_profile.messages_sent_today = 0
-        if user_profile.messages_sent_today >= user_profile.role.daily_message_limit:
-            logger.warning(
-                f"User {user_profile.user.phone_number} reached daily message limit ({user_profile.role.daily_message_limit}).")
+        messages_today = getattr(user_profile, 'messages_today', None)  # annotated by _load_chat_state
+        if messages_today is None:
+            messages_today = DailyMessageCounter.count_for(user_profile.user_id)
+        if messages_today >= user_profile.role.daily_message_limit:
+            logger.warning("User %s reached daily message limit (%s).",
+                           user_profile.user.phone_number, user_profile.role.daily_message_limit)
             return False
         return True
 
     def _increment_message_count(self, user_profile: UserProfile, is_profile_setup_flow: bool = False):
         if is_profile_setup_flow:
             return
-        now = timezone.localdate()
-        if user_profile.last_message_date != now:
-            user_profile.messages_sent_today = 0
-            user_profile.last_message_date = now
-        user_profile.messages_sent_today += 1
-        user_profile.save(update_fields=['messages_sent_today', 'last_message_date'])
+        DailyMessageCounter.increment(user_profile.user_id)
 
     def _get_user_info_for_metis_api(self, user_profile: UserProfile):
         user_obj = {"id": str(user_profile.user.id)}
@@ -1015,275 +399,712 @@ class AIAgentChatView(APIView):
             user_obj["name"] = " ".join(user_name_parts)
         elif user_profile.user.phone_number:
             user_obj["name"] = user_profile.user.phone_number
-        logger.debug(
-            f"Simplified user_info for Metis API (session creation): {json.dumps(user_obj, ensure_ascii=False)}")
+        logger.debug("Simplified user_info for Metis API (session creation): %s",
+                     json.dumps(user_obj, ensure_ascii=False))
         return user_obj
 
     def _get_user_context_for_ai(self, user_profile: UserProfile, for_setup_prompt: bool = False):
         if for_setup_prompt:
             return PROFILE_SETUP_SYSTEM_PROMPT
-        context_parts = []
-        if user_profile.user_information_summary:
-            context_parts.append(
-                f"خلاصه اطلاعات کاربر (برای استفاده در پاسخ‌ها):\n{user_profile.user_information_summary}")
+        return get_user_context(user_profile)
+
+    def _chat_response(self, turn: ChatTurn, http_status_code):
+        session = turn.session
+        data = {
+            'ai_response': turn.ai_response_content,
+            'session_id': str(session.ai_session_id) if session else None,
+        }
+        if turn.history_since is None:
+            data['chat_history'] = session.get_chat_history() if session else []
+            return Response(data, status=http_status_code)
+        # The client's cursor belongs to the session it sent; a session opened (or picked) by this turn starts from 0.
+        since = 0 if turn.kind in ('chat_new', 'setup_start') or turn.session_reused else turn.history_since
+        messages = session.get_chat_history(after=since, include_system=False) if session else []
+        data['messages'] = messages
+        data['cursor'] = messages[-1]['sequence'] if messages else since
+        return Response(data, status=http_status_code)
+
+    def _new_session_expiry(self, user_profile: UserProfile):
+        return timezone.now() + timedelta(hours=user_profile.role.session_duration_hours if user_profile.role else 24)
+
+    # ---- Phase 2: the Metis round-trip (no transaction open) ----
+    def _call_metis(self, metis_service, turn: ChatTurn):
+        if not turn.metis_method:
+            return None
+        _release_db_connection()
+        if turn.metis_method == 'create_chat_session':
+            return metis_service.create_chat_session(bot_id=metis_service.bot_id, **turn.metis_kwargs)
+        return metis_service.send_message(**turn.metis_kwargs)
+
+    def _run_chat_turn(self, metis_service, user, user_message_content, session_id_from_request,
+                       history_since=None, new_session=False):
+        """All three phases of a blocking chat turn; Http404 (no profile) propagates."""
+        try:
+            with transaction.atomic():
+                turn = self._plan_chat_turn(user, user_message_content, session_id_from_request, history_since,
+                                            new_session)
+            if isinstance(turn, Response):
+                return turn
+            metis_service.priority = get_role_priority(turn.user_profile.role)
+            metis_response = self._call_metis(metis_service, turn)
+            result = None
+            try:
+                with transaction.atomic():
+                    result = self._complete_chat_turn(turn, metis_response)
+            finally:
+                if turn.metis_method == 'create_chat_session' and (result is None or result.status_code >= 400):
+                    self._discard_metis_session(metis_service, turn, (metis_response or {}).get('id'))
+            return result
+        except Http404:
+            raise
+        except Exception as e:
+            return self._chat_error_response(user, e)
+
+    # ---- Phase 1: read/validate (DB only) ----
+    def _plan_chat_turn(self, user, user_message_content, session_id_from_request, history_since=None,
+                        new_session=False):
+        # Without session_id the message continues the latest live session unless the client asks for a new one
+        reuse_latest = (not session_id_from_request and not new_session
+                        and getattr(settings, 'CHAT_REUSE_LATEST_SESSION', True))
+        user_profile, session = self._load_chat_state(user, session_id_from_request, reuse_latest)
+        turn = ChatTurn(user, user_profile, user_message_content, session=session)
+        turn.history_since = history_since
+        turn.session_reused = session is not None and not session_id_from_request
+
+        if session_id_from_request and not turn.session:
+            logger.warning("Session ID %s provided but not found/active for user %s.",
+                           session_id_from_request, user.phone_number)
+            return Response({
+                    'detail': 'جلسه نامعتبر است یا منقضی شده. لطفا بدون session_id برای ایجاد جلسه جدید تلاش کنید یا یک session_id معتبر ارسال کنید.'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        message_lower = user_message_content.lower()
+
+        # ---- Profile Setup Flow ----
+        if message_lower == CMD_START_SETUP.lower() and not user_profile.is_in_profile_setup:
+            if user_profile.role and user_profile.last_form_submission_time:
+                interval = timedelta(hours=user_profile.role.form_submission_interval_hours)
+                if timezone.now() < user_profile.last_form_submission_time + interval:
+                    time_remaining = (user_profile.last_form_submission_time + interval) - timezone.now()
+                    hours_rem = int(time_remaining.total_seconds() / 3600)
+                    minutes_rem = int((time_remaining.total_seconds() % 3600) / 60)
+                    turn.ai_response_content = f"شما فقط هر {user_profile.role.form_submission_interval_hours} ساعت یکبار می‌توانید اطلاعات پروفایل را تکمیل یا اصلاح کنید. لطفاً پس از حدود {hours_rem} ساعت و {minutes_rem} دقیقه دیگر تلاش کنید."
+                    return self._chat_response(turn, status.HTTP_429_TOO_MANY_REQUESTS)
+
+            logger.info("User %s started profile setup.", user.phone_number)
+            turn.kind = 'setup_start'
+            turn.session = None
+            initial_messages_for_setup = [
+                {"type": "SYSTEM", "content": self._get_user_context_for_ai(user_profile, for_setup_prompt=True)},
+                {"type": "USER", "content": "سلام، لطفا برای تکمیل پروفایلم از من سوال بپرسید."}
+            ]
+            turn.metis_method = 'create_chat_session'
+            turn.metis_kwargs = {
+                'user_data': self._get_user_info_for_metis_api(user_profile),
+                'initial_messages': initial_messages_for_setup,
+            }
+            return turn
+
+        if user_profile.is_in_profile_setup:
+            if not turn.session:
+                logger.error("User %s in profile setup but no active session for command '%s'.",
+                             user.phone_number, user_message_content)
+                return Response({
+                    "detail": "جلسه تنظیم پروفایل شما یافت نشد یا منقضی شده. لطفاً با 'تکمیل پروفایل' دوباره شروع کنید."},
+                    status=status.HTTP_400_BAD_REQUEST)
+
+            if message_lower == CMD_FINISH_SETUP.lower():
+                logger.info("User %s requested to finish profile setup.", user.phone_number)
+                turn.kind = 'setup_finish'
+                setup_chat_history = turn.session.get_chat_history() + [
+                    {"role": "user", "content": user_message_content}]
+                history_text_for_prompt = "\n".join(
+                    [f"{msg['role']}: {msg['content']}" for msg in setup_chat_history if msg['role'] != 'system'])
+                full_prompt_for_summarization = PROFILE_SUMMARIZATION_PROMPT_PREFIX + history_text_for_prompt + PROFILE_SUMMARIZATION_PROMPT_SUFFIX
+                logger.info("Sending compiled setup chat to Metis for summarization for user %s.", user.phone_number)
+                turn.metis_method = 'send_message'
+                turn.metis_kwargs = {'session_id': turn.session.metis_session_id,
+                                     'content': full_prompt_for_summarization, 'message_type': "USER"}
+                return turn
+
+            if message_lower == CMD_CANCEL_SETUP.lower():
+                logger.info("User %s cancelled profile setup.", user.phone_number)
+                turn.kind = 'setup_cancel'
+                return turn
+
+            if not self._check_message_limit(user_profile, is_profile_setup_flow=True):
+                return Response({'detail': 'محدودیت پیام در طول تنظیم پروفایل به پایان رسیده است.'},
+                                status=status.HTTP_429_TOO_MANY_REQUESTS)
+            logger.debug("Continuing profile setup for user %s. Message: %s", user.phone_number, user_message_content)
+            turn.kind = 'setup_continue'
+            turn.metis_method = 'send_message'
+            turn.metis_kwargs = {'session_id': turn.session.metis_session_id,
+                                 'content': user_message_content, 'message_type': "USER"}
+            return turn
+
+        # Normal chat flow (not in profile setup)
+        if not self._check_message_limit(user_profile):
+            return Response({'detail': 'محدودیت پیام روزانه شما به پایان رسیده است.'},
+                            status=status.HTTP_429_TOO_MANY_REQUESTS)
+
+        if not turn.session:
+            logger.info("Starting new NORMAL chat session for user %s.", user.phone_number)
+            turn.kind = 'chat_new'
+            system_context = self._get_user_context_for_ai(user_profile, for_setup_prompt=False)
+            turn.context['system_context'] = system_context
+            turn.metis_method = 'create_chat_session'
+            turn.metis_kwargs = {
+                'user_data': self._get_user_info_for_metis_api(user_profile),
+                'initial_messages': [{"type": "SYSTEM", "content": system_context},
+                                     {"type": "USER", "content": user_message_content}],
+            }
+        else:
+            turn.kind = 'chat_continue'
+            turn.metis_method = 'send_message'
+            turn.metis_kwargs = {'session_id': turn.session.metis_session_id,
+                                 'content': user_message_content, 'message_type': "USER"}
+        return turn
+
+    # ---- Phase 3: persist the outcome (DB only) ----
+    def _lock_chat_turn(self, turn: ChatTurn):
+        """
+        Re-reads the profile and session rows with SELECT ... FOR UPDATE: another request may have changed them
+        while Metis was answering. Messages are then appended to the latest history instead of overwriting it;
+        a turn whose session was closed, or whose profile-setup state flipped, in the meantime gets a 409.
+        """
+        planned_profile = turn.user_profile
+        user_profile = UserProfile.objects.select_for_update().get(pk=planned_profile.pk)
+        user_profile.user = turn.user
+        if user_profile.role_id == planned_profile.role_id:
+            user_profile.role = planned_profile.role
+        if turn.kind == 'setup_start':
+            conflict = user_profile.is_in_profile_setup
+        elif turn.kind in SETUP_TURN_KINDS:
+            conflict = not user_profile.is_in_profile_setup
         else:
-            profile_info_items = [f"شماره موبایل کاربر فعلی: {user_profile.user.phone_number}"]
-            if user_profile.user.first_name: profile_info_items.append(f"نام: {user_profile.user.first_name}")
-            if user_profile.user.last_name: profile_info_items.append(f"نام خانوادگی: {user_profile.user.last_name}")
-            if user_profile.age is not None: profile_info_items.append(f"سن: {user_profile.age}")
-            if profile_info_items: context_parts.append(
-                "اطلاعات پایه و هویتی کاربر:\n" + "\n".join([f"- {item}" for item in profile_info_items]))
-            context_parts.append(
-                "اطلاعات پروفایل کاربر هنوز تکمیل نشده است. می‌توانید از کاربر بخواهید با ارسال 'تکمیل پروفایل' اطلاعات خود را وارد کند.")
-        full_context = "\n\n".join(filter(None, context_parts))
-        logger.debug(
-            f"Generated AI context (normal chat) for user {user_profile.user.phone_number}: Context length: {len(full_context)}")
-        if len(full_context) > 15000:
-            logger.warning(
-                f"Generated AI context for user {user_profile.user.phone_number} is very long: {len(full_context)} chars. Truncating or summarizing might be needed if API limits are hit.")
-        return full_context
+            conflict = False
+        if not conflict and turn.session is not None:
+            session = AiResponse.objects.select_for_update().filter(pk=turn.session.pk, is_active=True).first()
+            if session is None:
+                conflict = True
+            else:
+                if session.updated_at != turn.session_version:
+                    logger.info("Session %s was updated during the Metis call; appending to the latest history.",
+                                session.ai_session_id)
+                turn.session = session
+        if conflict:
+            logger.warning("Chat turn '%s' for user %s conflicts with a concurrent request.",
+                           turn.kind, turn.user.phone_number)
+            return Response({'detail': 'وضعیت گفتگو در حین دریافت پاسخ تغییر کرد. لطفاً دوباره تلاش کنید.'},
+                            status=status.HTTP_409_CONFLICT)
+        turn.user_profile = user_profile
+        return None
+
+    def _complete_chat_turn(self, turn: ChatTurn, metis_response):
+        """Must run inside transaction.atomic(); the row locks taken by _lock_chat_turn last until it commits."""
+        conflict_response = self._lock_chat_turn(turn)
+        if conflict_response is not None:
+            return conflict_response
+        user = turn.user
+        user_profile = turn.user_profile
+        user_message_content = turn.message
+
+        if turn.kind == 'setup_start':
+            metis_session_id = metis_response.get('id')
+            if not metis_session_id:
+                logger.error("Failed to create Metis session for profile setup for user %s. Response: %s",
+                             user.phone_number, metis_response)
+                return Response({"error": "خطا در ایجاد جلسه تنظیم پروفایل با سرویس دستیار."},
+                                status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            turn.ai_response_content = metis_response.get(
+                'content', 'سلام! برای شروع، لطفاً در مورد سوابق پزشکی خود توضیح دهید.')
+            user_profile.is_in_profile_setup = True
+            user_profile.save(update_fields=['is_in_profile_setup'])
+            turn.session = AiResponse.objects.create(
+                user=user, ai_session_id=str(uuid.uuid4()), metis_session_id=metis_session_id,
+                ai_response_name=f"Profile Setup - {user.phone_number}",
+                session_type=AiResponse.TYPE_PROFILE_SETUP,
+                expires_at=self._new_session_expiry(user_profile)
+            )
+            turn.session.add_to_chat_history("system", self._get_user_context_for_ai(user_profile, for_setup_prompt=True))
+            turn.session.add_to_chat_history("user", CMD_START_SETUP)
+            turn.session.add_to_chat_history("assistant", turn.ai_response_content)
+
+        elif turn.kind == 'setup_finish':
+            turn.session.add_to_chat_history("user", user_message_content)
+            summary_text = metis_response.get('content')
+            if summary_text:
+                user_profile.user_information_summary = summary_text
+                turn.ai_response_content = f"اطلاعات پروفایل شما با موفقیت دریافت و خلاصه‌سازی شد."
+                turn.session.add_to_chat_history("assistant", turn.ai_response_content + f"\nخلاصه: {summary_text}")
+                logger.info("Profile summary generated for user %s.", user.phone_number)
+            else:
+                turn.ai_response_content = "متاسفانه در حال حاضر امکان خلاصه‌سازی اطلاعات شما وجود ندارد. اما اطلاعات شما در طول چت ذخیره شده است."
+                turn.session.add_to_chat_history("assistant", turn.ai_response_content)
+                logger.error("Metis failed to generate summary for user %s. Response: %s",
+                             user.phone_number, metis_response)
+            user_profile.is_in_profile_setup = False
+            user_profile.last_form_submission_time = timezone.now()
+            user_profile.save(update_fields=['is_in_profile_setup', 'last_form_submission_time',
+                                             'user_information_summary'])
+            turn.session.is_active = False
+
+        elif turn.kind == 'setup_cancel':
+            user_profile.is_in_profile_setup = False
+            user_profile.save(update_fields=['is_in_profile_setup'])
+            turn.ai_response_content = "تکمیل پروفایل لغو شد. شما می‌توانید هر زمان خواستید با ارسال 'تکمیل پروفایل' این فرآیند را مجددا شروع کنید."
+            turn.session.add_to_chat_history("user", user_message_content)
+            turn.session.add_to_chat_history("assistant", turn.ai_response_content)
+            turn.session.is_active = False
+
+        elif turn.kind == 'setup_continue':
+            turn.ai_response_content = metis_response.get('content', 'پاسخی از طرف دستیار دریافت نشد.')
+            turn.session.add_to_chat_history("user", user_message_content)
+            turn.session.add_to_chat_history("assistant", turn.ai_response_content)
+
+        elif turn.kind == 'chat_new':
+            metis_session_id = metis_response.get('id')
+            turn.ai_response_content = metis_response.get(
+                'content', 'پاسخی از طرف دستیار دریافت نشد (هنگام ایجاد جلسه عادی).')
+            if not metis_session_id:
+                logger.error("Failed to create Metis normal session for user %s. Response: %s",
+                             user.phone_number, metis_response)
+                return Response({"error": "خطا در ایجاد جلسه عادی با سرویس دستیار."},
+                                status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            self._evict_surplus_sessions(user, user_profile)
+            turn.session = AiResponse.objects.create(
+                user=user, ai_session_id=str(uuid.uuid4()), metis_session_id=metis_session_id,
+                ai_response_name=f"Chat - {user.phone_number} - {datetime.datetime.now().strftime('%H:%M')}",
+                expires_at=self._new_session_expiry(user_profile)
+            )
+            turn.session.add_to_chat_history("system", turn.context['system_context'])
+            turn.session.add_to_chat_history("user", user_message_content)
+            turn.session.add_to_chat_history("assistant", turn.ai_response_content)
+
+        elif turn.kind == 'chat_continue':
+            turn.ai_response_content = metis_response.get('content', 'پاسخی از طرف دستیار دریافت نشد.')
+            turn.session.add_to_chat_history("user", user_message_content)
+            turn.session.add_to_chat_history("assistant", turn.ai_response_content)
+
+        # Common save and response
+        if not turn.session:
+            turn.ai_response_content = "خطایی در مدیریت جلسه رخ داد یا جلسه معتبری یافت نشد."
+            return self._chat_response(turn, status.HTTP_400_BAD_REQUEST)
+
+        turn.session.save()
+        # Increment message count only if it's not a special command that ends/starts setup and has its own response handling
+        if user_message_content.lower() not in [CMD_START_SETUP.lower(), CMD_FINISH_SETUP.lower(),
+                                                CMD_CANCEL_SETUP.lower()]:
+            self._increment_message_count(user_profile, is_profile_setup_flow=user_profile.is_in_profile_setup)
+        return self._chat_response(turn, status.HTTP_200_OK)
+
+    def _discard_metis_session(self, metis_service, turn: ChatTurn, metis_session_id):
+        """Deletes a Metis session opened by a turn that then failed, so no AiResponse row will ever point to it."""
+        if not metis_session_id:
+            return
+        try:
+            metis_service.delete_chat_session(metis_session_id)
+            logger.info("Deleted Metis session %s of a failed '%s' turn for user %s.",
+                        metis_session_id, turn.kind, turn.user.phone_number)
+        except Exception as e:
+            logger.error("Failed to delete Metis session %s of a failed '%s' turn for user %s: %s",
+                         metis_session_id, turn.kind, turn.user.phone_number, e)
+
+    def _chat_error_response(self, user, exc):
+        if isinstance(exc, MetisUnavailableError):
+            # Circuit open or outbound gate saturated: fail fast without a traceback per request
+            logger.warning("Metis AI unavailable in %s for user %s: %s",
+                           self.__class__.__name__, user.phone_number, exc)
+            http_status = status.HTTP_429_TOO_MANY_REQUESTS if isinstance(exc, MetisGateRejected) \
+                else status.HTTP_503_SERVICE_UNAVAILABLE
+            return Response({"error": "سرویس دستیار هوشمند موقتاً در دسترس نیست. لطفاً کمی بعد دوباره تلاش کنید.",
+                             "details": str(exc) if settings.DEBUG else "Service unavailable"},
+                            status=http_status, headers={'Retry-After': str(int(exc.retry_after or 1))})
+        if isinstance(exc, ConnectionError):
+            logger.error("Metis AI Connection Error in %s for user %s: %s",
+                         self.__class__.__name__, user.phone_number, exc, exc_info=True)
+            return Response({"error": "خطا در ارتباط با سرویس دستیار هوشمند. لطفاً کمی بعد دوباره تلاش کنید.",
+                             "details": str(exc) if settings.DEBUG else "Service connection error"},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        logger.error("Error in %s for user %s: %s", self.__class__.__name__, user.phone_number, exc, exc_info=True)
+        return Response({"error": "یک خطای داخلی رخ داده است. لطفاً بعداً تلاش کنید.",
+                         "details": str(exc) if settings.DEBUG else "Internal server error"},
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AIAgentChatView(ChatTurnMixin, APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    http_method_names = ['post']
+
+    def dispatch(self, request, *args, **kwargs):
+        logger.debug("Dispatching request to AIAgentChatView: %s, %s", request.method, request.path)
+        return super().dispatch(request, *args, **kwargs)
 
     def post(self, request, *args, **kwargs):
         user = request.user
-        user_profile = get_object_or_404(UserProfile, user=user)
         user_message_content = request.data.get('message', "").strip()
         session_id_from_request = request.data.get('session_id')
 
-        ai_final_response_content = "خطایی در پردازش رخ داد، لطفا مجددا تلاش کنید."
-        final_session_id_to_return = None
-        final_chat_history = []
-        http_status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-
         if not user_message_content:
             return Response({'detail': 'محتوای پیام الزامی است.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            history_since = _parse_history_since(request.query_params.get('since', request.data.get('since')))
+        except ValueError:
+            return Response({'detail': 'مقدار since باید یک عدد صحیح نامنفی باشد.'},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-        metis_service = MetisAIService()
-        active_sessions = self._get_active_sessions_for_user(user)
-        current_session_instance = None
+        new_session = _request_flag(request, 'new_session')
 
+        if _request_flag(request, 'job'):
+            return self._enqueue_chat_job(request, user, user_message_content, session_id_from_request,
+                                          history_since, new_session)
+        metis_service = MetisAIService()
+        if _request_flag(request, 'stream'):
+            return self._stream_chat(metis_service, user, user_message_content, session_id_from_request,
+                                     history_since, new_session)
+        # a retry with the same Idempotency-Key gets the stored reply instead of a second (paid) Metis call
+        return run_idempotent('chat', user.pk, get_idempotency_key(request),
+                              lambda: self._run_chat_turn(metis_service, user, user_message_content,
+                                                          session_id_from_request, history_since, new_session),
+                              request_fingerprint(request))
+
+    # ---- Job mode (?job=1 or {"job": true}) ----
+    def _enqueue_chat_job(self, request, user, user_message_content, session_id_from_request, history_since=None,
+                          new_session=False):
+        """
+        Stores the message as a ChatJob and returns 202 with its id right away; the Metis round-trip runs on
+        the chat_jobs pool. A repeated client_request_id (body field, X-Client-Request-Id or Idempotency-Key
+        header) returns the job created the first time instead of sending the message again.
+        """
+        client_request_id = (request.data.get('client_request_id') or request.headers.get('X-Client-Request-Id')
+                             or request.headers.get(IDEMPOTENCY_HEADER))
+        if client_request_id:
+            client_request_id = str(client_request_id)[:64]
+            job, created = ChatJob.objects.get_or_create(
+                user=user, client_request_id=client_request_id,
+                defaults={'message': user_message_content, 'session_id': session_id_from_request,
+                          'history_since': history_since, 'new_session': new_session})
+        else:
+            job, created = ChatJob.objects.create(user=user, message=user_message_content,
+                                                  session_id=session_id_from_request,
+                                                  history_since=history_since, new_session=new_session), True
+        if created:
+            transaction.on_commit(lambda: chat_jobs.submit(run_chat_job, job.pk))
+        else:
+            logger.info("Duplicate chat job request %s for user %s; returning job %s.",
+                        client_request_id, user.phone_number, job.pk)
+        response = _chat_job_response(request, job)
+        if job.is_finished:
+            return response
+        response.status_code = status.HTTP_202_ACCEPTED
+        response['Location'] = response.data['poll_url']
+        return response
+
+    # ---- Streaming mode (?stream=1 or {"stream": true}) ----
+    STREAMABLE_TURN_KINDS = ('chat_new', 'chat_continue', 'setup_continue')
+
+    def _stream_chat(self, metis_service, user, user_message_content, session_id_from_request, history_since=None,
+                     new_session=False):
         try:
             with transaction.atomic():
-                if session_id_from_request:
-                    current_session_instance = active_sessions.filter(ai_session_id=session_id_from_request).first()
-                    if current_session_instance:
-                        if current_session_instance.expires_at and current_session_instance.expires_at < timezone.now():
-                            current_session_instance.is_active = False;
-                            current_session_instance.save(update_fields=['is_active'])
-                            logger.warning(
-                                f"Session {session_id_from_request} for user {user.phone_number} has expired.")
-                            current_session_instance = None
-                    else:
-                        logger.warning(
-                            f"Session ID {session_id_from_request} provided but not found/active for user {user.phone_number}.")
-                        return Response({
-                                            'detail': 'جلسه نامعتبر است یا منقضی شده. لطفا بدون session_id برای ایجاد جلسه جدید تلاش کنید یا یک session_id معتبر ارسال کنید.'},
-                                        status=status.HTTP_400_BAD_REQUEST)
-
-                # ---- Profile Setup Flow ----
-                if user_message_content.lower() == CMD_START_SETUP.lower() and not user_profile.is_in_profile_setup:
-                    can_start_setup = True
-                    if user_profile.role and user_profile.last_form_submission_time:
-                        interval = timedelta(hours=user_profile.role.form_submission_interval_hours)
-                        if timezone.now() < user_profile.last_form_submission_time + interval:
-                            can_start_setup = False
-                            time_remaining = (user_profile.last_form_submission_time + interval) - timezone.now()
-                            hours_rem = int(time_remaining.total_seconds() / 3600)
-                            minutes_rem = int((time_remaining.total_seconds() % 3600) / 60)
-                            ai_final_response_content = f"شما فقط هر {user_profile.role.form_submission_interval_hours} ساعت یکبار می‌توانید اطلاعات پروفایل را تکمیل یا اصلاح کنید. لطفاً پس از حدود {hours_rem} ساعت و {minutes_rem} دقیقه دیگر تلاش کنید."
-                            http_status_code = status.HTTP_429_TOO_MANY_REQUESTS
-                            final_session_id_to_return = str(
-                                current_session_instance.ai_session_id) if current_session_instance else None
-                            final_chat_history = current_session_instance.get_chat_history() if current_session_instance else []
-                            return Response(
-                                {'ai_response': ai_final_response_content, 'session_id': final_session_id_to_return,
-                                 'chat_history': final_chat_history}, status=http_status_code)
-
-                    if can_start_setup:
-                        user_profile.is_in_profile_setup = True;
-                        user_profile.save(update_fields=['is_in_profile_setup'])
-                        logger.info(f"User {user.phone_number} started profile setup.")
-                        current_session_instance = None
-
-                        initial_messages_for_setup = [
-                            {"type": "SYSTEM",
-                             "content": self._get_user_context_for_ai(user_profile, for_setup_prompt=True)},
-                            {"type": "USER", "content": "سلام، لطفا برای تکمیل پروفایلم از من سوال بپرسید."}
-                        ]
-                        metis_response = metis_service.create_chat_session(
-                            bot_id=metis_service.bot_id,
-                            user_data=self._get_user_info_for_metis_api(user_profile),
-                            initial_messages=initial_messages_for_setup
-                        )
-                        metis_session_id = metis_response.get('id')
-                        ai_final_response_content = metis_response.get('content',
-                                                                       'سلام! برای شروع، لطفاً در مورد سوابق پزشکی خود توضیح دهید.')
-
-                        if not metis_session_id:
-                            logger.error(
-                                f"Failed to create Metis session for profile setup for user {user.phone_number}. Response: {metis_response}")
-                            user_profile.is_in_profile_setup = False;
-                            user_profile.save(update_fields=['is_in_profile_setup'])
-                            return Response({"error": "خطا در ایجاد جلسه تنظیم پروفایل با سرویس دستیار."},
-                                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-                        current_session_instance = AiResponse.objects.create(
-                            user=user, ai_session_id=str(uuid.uuid4()), metis_session_id=metis_session_id,
-                            ai_response_name=f"Profile Setup - {user.phone_number}",
-                            expires_at=timezone.now() + timedelta(
-                                hours=user_profile.role.session_duration_hours if user_profile.role else 24)
-                        )
-                        current_session_instance.add_to_chat_history("system",
-                                                                     self._get_user_context_for_ai(user_profile,
-                                                                                                   for_setup_prompt=True))
-                        current_session_instance.add_to_chat_history("user", CMD_START_SETUP)
-                        current_session_instance.add_to_chat_history("assistant", ai_final_response_content)
-                        http_status_code = status.HTTP_200_OK
-
-                elif user_profile.is_in_profile_setup:
-                    if not current_session_instance:
-                        logger.error(
-                            f"User {user.phone_number} in profile setup but no active session for command '{user_message_content}'.")
-                        return Response({
-                                            "detail": "جلسه تنظیم پروفایل شما یافت نشد یا منقضی شده. لطفاً با 'تکمیل پروفایل' دوباره شروع کنید."},
-                                        status=status.HTTP_400_BAD_REQUEST)
-
-                    final_session_id_to_return = str(current_session_instance.ai_session_id)
-
-                    if user_message_content.lower() == CMD_FINISH_SETUP.lower():
-                        logger.info(f"User {user.phone_number} requested to finish profile setup.")
-                        current_session_instance.add_to_chat_history("user", user_message_content)
-
-                        setup_chat_history = current_session_instance.get_chat_history()
-                        history_text_for_prompt = "\n".join(
-                            [f"{msg['role']}: {msg['content']}" for msg in setup_chat_history if
-                             msg['role'] != 'system'])
-                        full_prompt_for_summarization = PROFILE_SUMMARIZATION_PROMPT_PREFIX + history_text_for_prompt + PROFILE_SUMMARIZATION_PROMPT_SUFFIX
-
-                        logger.info(
-                            f"Sending compiled setup chat to Metis for summarization for user {user.phone_number}.")
-                        summary_response = metis_service.send_message(
-                            session_id=current_session_instance.metis_session_id,
-                            content=full_prompt_for_summarization, message_type="USER"
-                        )
-                        summary_text = summary_response.get('content')
-                        if summary_text:
-                            user_profile.user_information_summary = summary_text
-                            ai_final_response_content = f"اطلاعات پروفایل شما با موفقیت دریافت و خلاصه‌سازی شد."
-                            current_session_instance.add_to_chat_history("assistant",
-                                                                         ai_final_response_content + f"\nخلاصه: {summary_text}")
-                            logger.info(f"Profile summary generated for user {user.phone_number}.")
-                        else:
-                            ai_final_response_content = "متاسفانه در حال حاضر امکان خلاصه‌سازی اطلاعات شما وجود ندارد. اما اطلاعات شما در طول چت ذخیره شده است."
-                            current_session_instance.add_to_chat_history("assistant", ai_final_response_content)
-                            logger.error(
-                                f"Metis failed to generate summary for user {user.phone_number}. Response: {summary_response}")
-                        user_profile.is_in_profile_setup = False
-                        user_profile.last_form_submission_time = timezone.now()
-                        user_profile.save(update_fields=['is_in_profile_setup', 'last_form_submission_time',
-                                                         'user_information_summary'])
-                        current_session_instance.is_active = False
-                        http_status_code = status.HTTP_200_OK
-
-                    elif user_message_content.lower() == CMD_CANCEL_SETUP.lower():
-                        logger.info(f"User {user.phone_number} cancelled profile setup.")
-                        user_profile.is_in_profile_setup = False;
-                        user_profile.save(update_fields=['is_in_profile_setup'])
-                        ai_final_response_content = "تکمیل پروفایل لغو شد. شما می‌توانید هر زمان خواستید با ارسال 'تکمیل پروفایل' این فرآیند را مجددا شروع کنید."
-                        current_session_instance.add_to_chat_history("user", user_message_content)
-                        current_session_instance.add_to_chat_history("assistant", ai_final_response_content)
-                        current_session_instance.is_active = False
-                        http_status_code = status.HTTP_200_OK
-
-                    else:
-                        if not self._check_message_limit(user_profile, is_profile_setup_flow=True):
-                            return Response({'detail': 'محدودیت پیام در طول تنظیم پروفایل به پایان رسیده است.'},
-                                            status=status.HTTP_429_TOO_MANY_REQUESTS)
-                        logger.info(
-                            f"Continuing profile setup for user {user.phone_number}. Message: {user_message_content}")
-                        metis_response_data = metis_service.send_message(
-                            session_id=current_session_instance.metis_session_id,
-                            content=user_message_content, message_type="USER")
-                        ai_final_response_content = metis_response_data.get('content',
-                                                                            'پاسخی از طرف دستیار دریافت نشد.')
-                        current_session_instance.add_to_chat_history("user", user_message_content)
-                        current_session_instance.add_to_chat_history("assistant", ai_final_response_content)
-                        http_status_code = status.HTTP_200_OK
-
-                else:  # Normal chat flow (not in profile setup)
-                    if not self._check_message_limit(user_profile):
-                        return Response({'detail': 'محدودیت پیام روزانه شما به پایان رسیده است.'},
-                                        status=status.HTTP_429_TOO_MANY_REQUESTS)
-
-                    if not current_session_instance:
-                        logger.info(f"Starting new NORMAL chat session for user {user.phone_number}.")
-                        initial_metis_messages = [{"type": "SYSTEM",
-                                                   "content": self._get_user_context_for_ai(user_profile,
-                                                                                            for_setup_prompt=False)}]
-                        initial_metis_messages.append({"type": "USER", "content": user_message_content})
-
-                        metis_response = metis_service.create_chat_session(
-                            bot_id=metis_service.bot_id,
-                            user_data=self._get_user_info_for_metis_api(user_profile),
-                            initial_messages=initial_metis_messages
-                        )
-                        metis_session_id = metis_response.get('id')
-                        ai_final_response_content = metis_response.get('content',
-                                                                       'پاسخی از طرف دستیار دریافت نشد (هنگام ایجاد جلسه عادی).')
-                        if not metis_session_id:
-                            logger.error(
-                                f"Failed to create Metis normal session for user {user.phone_number}. Response: {metis_response}")
-                            return Response({"error": "خطا در ایجاد جلسه عادی با سرویس دستیار."},
-                                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-                        current_session_instance = AiResponse.objects.create(
-                            user=user, ai_session_id=str(uuid.uuid4()), metis_session_id=metis_session_id,
-                            ai_response_name=f"Chat - {user.phone_number} - {datetime.datetime.now().strftime('%H:%M')}",
-                            expires_at=timezone.now() + timedelta(
-                                hours=user_profile.role.session_duration_hours if user_profile.role else 24)
-                        )
-                        if initial_metis_messages[0]["type"] == "SYSTEM":  # Log system context if sent
-                            current_session_instance.add_to_chat_history("system", initial_metis_messages[0]["content"])
-                        current_session_instance.add_to_chat_history("user", user_message_content)
-                        current_session_instance.add_to_chat_history("assistant", ai_final_response_content)
-                    # If current_session_instance already existed (from session_id_from_request and was valid),
-                    # metis_ai_response_content was already populated at the top.
-                    http_status_code = status.HTTP_200_OK
-
-                # Common save and response
-                if current_session_instance:
-                    current_session_instance.save()
-                    # Increment message count only if it's not a special command that ends/starts setup and has its own response handling
-                    if not (user_message_content.lower() in [CMD_START_SETUP.lower(), CMD_FINISH_SETUP.lower(),
-                                                             CMD_CANCEL_SETUP.lower()]):
-                        self._increment_message_count(user_profile,
-                                                      is_profile_setup_flow=user_profile.is_in_profile_setup)
-
-                    final_session_id_to_return = str(current_session_instance.ai_session_id)
-                    final_chat_history = current_session_instance.get_chat_history()
+                turn = self._plan_chat_turn(user, user_message_content, session_id_from_request, history_since,
+                                            new_session)
+        except Http404:
+            raise
+        except Exception as e:
+            return self._chat_error_response(user, e)
+        if isinstance(turn, Response):
+            return turn
+        metis_service.priority = get_role_priority(turn.user_profile.role)
+        response = StreamingHttpResponse(self._chat_event_stream(metis_service, turn),
+                                         content_type='text/event-stream; charset=utf-8')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # nginx/LiteSpeed must not buffer the stream
+        return response
+
+    def _chat_event_stream(self, metis_service, turn: ChatTurn):
+        """
+        Yields `delta` events with the assistant text as Metis streams it, then persists the turn and yields a
+        final `done` event carrying the usual chat payload (or `error` with the error payload).
+        """
+        created_session_id = None  # deleted again unless the turn is stored (error or client disconnect)
+        result = None
+        try:
+            _release_db_connection()
+            if turn.kind in self.STREAMABLE_TURN_KINDS:
+                metis_response = {}
+                if turn.kind == 'chat_new':
+                    # The session is opened with the system context only; the user message is then streamed.
+                    metis_response = metis_service.create_chat_session(
+                        bot_id=metis_service.bot_id, user_data=turn.metis_kwargs['user_data'],
+                        initial_messages=turn.metis_kwargs['initial_messages'][:-1])
+                    metis_session_id = created_session_id = metis_response.get('id')
                 else:
-                    # This case should ideally be handled earlier if no session could be established or retrieved
-                    ai_final_response_content = "خطایی در مدیریت جلسه رخ داد یا جلسه معتبری یافت نشد."
-                    http_status_code = status.HTTP_400_BAD_REQUEST
-                    # No session_id to return if none was created/found
-                    final_session_id_to_return = None
+                    metis_session_id = turn.metis_kwargs['session_id']
+                if metis_session_id:
+                    chunks = []
+                    for chunk in metis_service.stream_message(metis_session_id, turn.message):
+                        chunks.append(chunk)
+                        yield _sse_event('delta', {'content': chunk})
+                    metis_response = {'id': metis_session_id, 'content': "".join(chunks)}
+                with transaction.atomic():
+                    result = self._complete_chat_turn(turn, metis_response)
+            else:
+                metis_response = self._call_metis(metis_service, turn)
+                with transaction.atomic():
+                    result = self._complete_chat_turn(turn, metis_response)
+                if result.status_code < 400:
+                    yield _sse_event('delta', {'content': result.data.get('ai_response', '')})
+        except Exception as e:
+            result = self._chat_error_response(turn.user, e)
+        finally:
+            if created_session_id and (result is None or result.status_code >= 400):
+                self._discard_metis_session(metis_service, turn, created_session_id)
+        yield _sse_event('done' if result.status_code < 400 else 'error',
+                         dict(result.data, status=result.status_code))
+
+
+def _parse_history_since(value):
+    """`since` of delta mode: None when absent, else a non-negative int (ValueError otherwise)."""
+    if value is None or value == '':
+        return None
+    since = int(value)
+    if since < 0:
+        raise ValueError(value)
+    return since
+
+
+def _request_flag(request, name):
+    flag = request.query_params.get(name) or request.data.get(name)
+    return str(flag).lower() in ('1', 'true', 'yes')
+
+
+def _release_db_connection():
+    """
+    Closes this thread's DB connection before a long Metis call so it goes back to the server instead of
+    sitting idle for the whole reply; Django reopens it on the next query. Skipped inside a transaction
+    (e.g. tests) and when METIS_RELEASE_DB_CONNECTION is off (persistent connections via CONN_MAX_AGE).
+    """
+    if getattr(settings, 'METIS_RELEASE_DB_CONNECTION', True) and not connection.in_atomic_block:
+        connection.close()
+
+
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def _chat_job_response(request, job):
+    data = {
+        'job_id': str(job.pk),
+        'status': job.status,
+        'poll_url': request.build_absolute_uri(reverse('ai-agent-chat-job', kwargs={'pk': job.pk})),
+    }
+    if job.is_finished:
+        data['http_status'] = job.http_status
+        data['result'] = job.get_result()
+    return Response(data, status=status.HTTP_200_OK)
+
+
+class ChatJobRunner(ChatTurnMixin):
+    """The chat flow without a request, as run by the job workers."""
+
+
+def run_chat_job(job_id):
+    """Executes a queued ChatJob on a chat_jobs worker thread and stores the reply on the row."""
+    claimed = ChatJob.objects.filter(pk=job_id, status=ChatJob.STATUS_QUEUED).update(
+        status=ChatJob.STATUS_RUNNING, started_at=timezone.now())
+    if not claimed:
+        return  # already picked up (e.g. re-submitted after a restart) or finished
+    job = ChatJob.objects.select_related('user').get(pk=job_id)
+    runner = ChatJobRunner()
+    try:
+        result = runner._run_chat_turn(MetisAIService(), job.user, job.message, job.session_id,
+                                       job.history_since, job.new_session)
+    except Http404:
+        result = Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        result = runner._chat_error_response(job.user, e)
+    job.set_result(result.status_code, result.data)
+    job.save(update_fields=['status', 'http_status', 'result', 'finished_at'])
+    logger.debug("Chat job %s finished with status %s.", job_id, result.status_code)
+
+
+class ChatJobDetailView(APIView):
+    """
+    GET /ai-agent/chat/jobs/<id>/?wait=<seconds>: the job's status, and its result once finished.
+    With `wait` the request is held (at most CHAT_JOB_MAX_WAIT seconds) until the job finishes; a still
+    pending job is answered with 202. A job still queued after CHAT_JOB_REQUEUE_AFTER seconds is submitted again
+    once; a job still running, or still queued after that, CHAT_JOB_RUNNING_TIMEOUT seconds later is reported as
+    failed (504).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    http_method_names = ['get']
 
-                return Response({
-                    'ai_response': ai_final_response_content,
-                    'session_id': final_session_id_to_return,
-                    'chat_history': final_chat_history,
-                }, status=http_status_code)
-
-        except ConnectionError as e_conn:
-            logger.error(f"Metis AI Connection Error in AIAgentChatView for user {user.phone_number}: {e_conn}",
-                         exc_info=True)
-            return Response({"error": "خطا در ارتباط با سرویس دستیار هوشمند. لطفاً کمی بعد دوباره تلاش کنید.",
-                             "details": str(e_conn) if settings.DEBUG else "Service connection error"},
-                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    def get(self, request, pk, *args, **kwargs):
+        job = get_object_or_404(ChatJob, pk=pk, user=request.user)
+        try:
+            wait = min(float(request.query_params.get('wait', 0)), getattr(settings, 'CHAT_JOB_MAX_WAIT', 30.0))
+        except ValueError:
+            wait = 0
+        if not job.is_finished and wait > 0:
+            job = self._wait_for_job(job, wait)
+        now = timezone.now()
+        running_timeout = timedelta(seconds=getattr(settings, 'CHAT_JOB_RUNNING_TIMEOUT', 600))
+        if job.status == ChatJob.STATUS_QUEUED and job.requeued_at is None and \
+                job.created_at < now - timedelta(seconds=getattr(settings, 'CHAT_JOB_REQUEUE_AFTER', 60)):
+            self._requeue_job(job, now)
+        elif job.status == ChatJob.STATUS_QUEUED and job.requeued_at and job.requeued_at < now - running_timeout:
+            job = self._fail_stale_job(job)  # not picked up after the requeue either
+        elif job.status == ChatJob.STATUS_RUNNING and job.started_at and job.started_at < now - running_timeout:
+            job = self._fail_stale_job(job)
+        response = _chat_job_response(request, job)
+        if not job.is_finished:
+            response.status_code = status.HTTP_202_ACCEPTED
+        return response
+
+    @staticmethod
+    def _requeue_job(job, now):
+        # The process that accepted it may have died before running it. Only the poll that sets requeued_at
+        # submits it again: under overload every poll re-submitting would keep growing the backlog.
+        claimed = ChatJob.objects.filter(pk=job.pk, status=ChatJob.STATUS_QUEUED,
+                                         requeued_at__isnull=True).update(requeued_at=now)
+        if claimed:
+            logger.info("Chat job %s queued since %s submitted again.", job.pk, job.created_at)
+            chat_jobs.submit(run_chat_job, job.pk)
+
+    @staticmethod
+    def _fail_stale_job(job):
+        # the worker that had it died (crash, restart) and nothing else will finish it; the status check keeps
+        # a result stored in the meantime
+        stale_status = job.status
+        job.set_result(status.HTTP_504_GATEWAY_TIMEOUT,
+                       {'detail': 'پردازش پیام شما متوقف شد. لطفاً دوباره ارسال کنید.'})
+        updated = ChatJob.objects.filter(pk=job.pk, status=stale_status).update(
+            status=job.status, http_status=job.http_status, result=job.result, finished_at=job.finished_at)
+        if updated:
+            logger.warning("Chat job %s (%s since %s) marked as failed.", job.pk, stale_status,
+                           job.started_at or job.requeued_at)
+        job.refresh_from_db()
+        return job
+
+    @staticmethod
+    def _wait_for_job(job, wait):
+        finished = chat_jobs.finished_event(job.pk)
+        deadline = time.monotonic() + wait
+        poll_interval = getattr(settings, 'CHAT_JOB_POLL_INTERVAL', 1.0)
+        _release_db_connection()
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            finished.wait(min(poll_interval, remaining))
+            job.refresh_from_db()
+            if job.is_finished:
+                break
+        return job
+
+
+class AsyncAIAgentChatView(ChatTurnMixin, View):
+    """
+    Async variant of AIAgentChatView for the ASGI stack: the ORM phases run through sync_to_async and the
+    Metis round-trip is awaited on the pooled httpx client, so a slow reply does not hold a worker thread.
+    Accepts the same JSON body ({"message", "session_id"}) and Idempotency-Key, and returns the same payload.
+    """
+    http_method_names = ['post']
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            auth_result = await sync_to_async(JWTAuthentication().authenticate)(request)
+        except AuthenticationFailed as e:
+            return JsonResponse({'detail': str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+        if auth_result is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'},
+                                status=status.HTTP_401_UNAUTHORIZED)
+        user = auth_result[0]
+
+        try:
+            body = json.loads(request.body or b'{}')
+        except json.JSONDecodeError:
+            return JsonResponse({'detail': 'JSON نامعتبر است.'}, status=status.HTTP_400_BAD_REQUEST)
+        user_message_content = str(body.get('message', "")).strip()
+        session_id_from_request = body.get('session_id')
+        if not user_message_content:
+            return JsonResponse({'detail': 'محتوای پیام الزامی است.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            history_since = _parse_history_since(request.GET.get('since', body.get('since')))
+        except ValueError:
+            return JsonResponse({'detail': 'مقدار since باید یک عدد صحیح نامنفی باشد.'},
+                                status=status.HTTP_400_BAD_REQUEST)
+        new_session = str(request.GET.get('new_session', body.get('new_session'))).lower() in ('1', 'true', 'yes')
+
+        # same scope as AIAgentChatView: a retry with the same Idempotency-Key gets the stored reply
+        result = await arun_idempotent('chat', user.pk, get_idempotency_key(request, body),
+                                       lambda: self._run_chat_turn_async(user, user_message_content,
+                                                                         session_id_from_request, history_since,
+                                                                         new_session),
+                                       request_fingerprint(request, body))
+        return self._to_json_response(result)
+
+    async def _run_chat_turn_async(self, user, user_message_content, session_id_from_request, history_since=None,
+                                   new_session=False):
+        """The three phases of the turn; returns a DRF Response like ChatTurnMixin._run_chat_turn."""
+        try:
+            turn = await sync_to_async(self._plan_chat_turn_atomic)(user, user_message_content,
+                                                                    session_id_from_request, history_since,
+                                                                    new_session)
+            if isinstance(turn, Response):
+                return turn
+            metis_service = AsyncMetisAIService(priority=get_role_priority(turn.user_profile.role))
+            metis_response = None
+            if turn.metis_method:
+                await sync_to_async(_release_db_connection)()
+            if turn.metis_method == 'create_chat_session':
+                metis_response = await metis_service.create_chat_session(bot_id=metis_service.bot_id,
+                                                                         **turn.metis_kwargs)
+            elif turn.metis_method == 'send_message':
+                metis_response = await metis_service.send_message(**turn.metis_kwargs)
+            result = None
+            try:
+                result = await sync_to_async(self._complete_chat_turn_atomic)(turn, metis_response)
+            finally:
+                if turn.metis_method == 'create_chat_session' and (result is None or result.status_code >= 400):
+                    await self._adiscard_metis_session(metis_service, turn, (metis_response or {}).get('id'))
+        except Http404:
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            return self._chat_error_response(user, e)
+        return result
+
+    def _plan_chat_turn_atomic(self, user, user_message_content, session_id_from_request, history_since=None,
+                               new_session=False):
+        with transaction.atomic():
+            return self._plan_chat_turn(user, user_message_content, session_id_from_request, history_since,
+                                        new_session)
+
+    def _complete_chat_turn_atomic(self, turn, metis_response):
+        with transaction.atomic():
+            return self._complete_chat_turn(turn, metis_response)
+
+    async def _adiscard_metis_session(self, metis_service, turn: ChatTurn, metis_session_id):
+        """_discard_metis_session with AsyncMetisAIService."""
+        if not metis_session_id:
+            return
+        try:
+            await metis_service.delete_chat_session(metis_session_id)
+            logger.info("Deleted Metis session %s of a failed '%s' turn for user %s.",
+                        metis_session_id, turn.kind, turn.user.phone_number)
         except Exception as e:
-            logger.error(f"Error in AIAgentChatView for user {user.phone_number}: {e}", exc_info=True)
-            return Response({"error": "یک خطای داخلی رخ داده است. لطفاً بعداً تلاش کنید.",
-                             "details": str(e) if settings.DEBUG else "Internal server error"},
-                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            logger.error("Failed to delete Metis session %s of a failed '%s' turn for user %s: %s",
+                         metis_session_id, turn.kind, turn.user.phone_number, e)
+
+    @staticmethod
+    def _to_json_response(drf_response):
+        response = JsonResponse(drf_response.data, status=drf_response.status_code,
+                                json_dumps_params={'ensure_ascii': False})
+        for header in ('Retry-After', REPLAYED_HEADER):
+            if drf_response.has_header(header):
+                response[header] = drf_response[header]
+        return response
 
 
 # ----------------------------------------------------
@@ -1292,12 +1113,22 @@ class AIAgentChatView(APIView):
 from rest_framework.exceptions import PermissionDenied
 
 
+CHAT_HISTORY_PAGE_SIZE = 50
+CHAT_HISTORY_MAX_PAGE_SIZE = 200
+
+
 class AiChatSessionListCreate(generics.ListCreateAPIView):
-    queryset = AiResponse.objects.all()
-    serializer_class = AiResponseSerializer
+    """
+    Active sessions of the user, newest first, without their chat history (that is what the detail and
+    messages endpoints are for). Keyset-paginated: follow `next` (`?cursor=`), `?limit=` sets the page size.
+    """
+    queryset = AiResponse.objects.defer('chat_history')
+    serializer_class = AiResponseListSerializer
+    pagination_class = CreatedAtKeysetPagination
     permission_classes = [permissions.IsAuthenticated]
 
-    def get_queryset(self): return self.queryset.filter(user=self.request.user, is_active=True).order_by('-created_at')
+    def get_queryset(self):
+        return self.queryset.live().filter(user=self.request.user).order_by('-created_at', '-id')
 
     def perform_create(self, serializer):
         logger.warning(
@@ -1306,11 +1137,34 @@ class AiChatSessionListCreate(generics.ListCreateAPIView):
 
 
 class AiChatSessionDetail(generics.RetrieveUpdateDestroyAPIView):
-    queryset = AiResponse.objects.all()
+    """
+    One session with its chat history. `?limit=` returns only the latest `limit` messages, `?before=<sequence>`
+    the ones before that cursor (both optional, without them the whole history is returned).
+    """
+    queryset = AiResponse.objects.defer('chat_history')
     serializer_class = AiResponseSerializer
     permission_classes = [permissions.IsAuthenticated]
     lookup_field = 'pk'
 
+    def get_queryset(self):
+        return self.queryset.filter(user=self.request.user)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['history_window'] = self._history_window()
+        return context
+
+    def _history_window(self):
+        params = self.request.query_params
+        if 'before' not in params and 'limit' not in params:
+            return {}
+        try:
+            before = _parse_history_since(params.get('before'))
+            limit = int(params.get('limit', CHAT_HISTORY_PAGE_SIZE))
+        except ValueError:
+            raise ParseError('پارامترهای before و limit باید عدد صحیح نامنفی باشند.')
+        return {'before': before, 'limit': max(1, min(limit, CHAT_HISTORY_MAX_PAGE_SIZE))}
+
     def get_object(self):
         queryset = self.filter_queryset(self.get_queryset())
         pk = self.kwargs.get(self.lookup_field)
@@ -1331,28 +1185,60 @@ class AiChatSessionDetail(generics.RetrieveUpdateDestroyAPIView):
         metis_service = MetisAIService()
         try:
             if instance.metis_session_id:
-                logger.info(
-                    f"Attempting to delete Metis session {instance.metis_session_id} for user {self.request.user.phone_number}.")
+                logger.info("Attempting to delete Metis session %s for user %s.",
+                            instance.metis_session_id, self.request.user.phone_number)
                 metis_service.delete_chat_session(instance.metis_session_id)
-                logger.info(
-                    f"Metis session {instance.metis_session_id} deleted successfully for user {self.request.user.phone_number}.")
+                logger.info("Metis session %s deleted successfully for user %s.",
+                            instance.metis_session_id, self.request.user.phone_number)
         except Exception as e:
-            logger.error(
-                f"Failed to delete Metis session {instance.metis_session_id} for user {self.request.user.phone_number}: {e}",
-                exc_info=True)
+            logger.error("Failed to delete Metis session %s for user %s: %s",
+                         instance.metis_session_id, self.request.user.phone_number, e, exc_info=True)
         instance.delete()
-        logger.info(
-            f"Local AiResponse session {instance.ai_session_id} deleted for user {self.request.user.phone_number}.")
+        logger.info("Local AiResponse session %s deleted for user %s.",
+                    instance.ai_session_id, self.request.user.phone_number)
+
+
+class AiChatSessionMessagesView(APIView):
+    """
+    GET ai-sessions/<id>/messages/: one page of a session's messages, oldest first.
+    `?after=<sequence>` pages forward from a cursor, `?before=<sequence>` pages backwards (no cursor: the latest
+    page); `?limit=` defaults to 50 (max 200). System messages are left out unless `?include_system=1`.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    http_method_names = ['get']
+
+    def get(self, request, pk, *args, **kwargs):
+        session = get_object_or_404(AiResponse, ai_session_id=str(pk), user=request.user)
+        try:
+            after = _parse_history_since(request.query_params.get('after'))
+            before = _parse_history_since(request.query_params.get('before'))
+            limit = int(request.query_params.get('limit', CHAT_HISTORY_PAGE_SIZE))
+        except ValueError:
+            return Response({'detail': 'پارامترهای after، before و limit باید عدد صحیح نامنفی باشند.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, CHAT_HISTORY_MAX_PAGE_SIZE))
+        # one extra row tells whether there is another page in the paging direction
+        messages = session.get_chat_history(after=after, before=before, limit=limit + 1,
+                                            include_system=_request_flag(request, 'include_system'))
+        has_more = len(messages) > limit
+        if has_more:
+            messages = messages[:limit] if after is not None else messages[1:]
+        return Response({
+            'session_id': str(session.ai_session_id),
+            'messages': messages,
+            'has_more': has_more,
+            'first_sequence': messages[0]['sequence'] if messages else None,
+            'last_sequence': messages[-1]['sequence'] if messages else None,
+        })
 
 
 class TestTimeView(APIView):
     permission_classes = [IsMetisToolCallback]
 
     def get(self, request, *args, **kwargs):
-        logger.info(f"Tool {self.__class__.__name__} - Request Query Params: {request.query_params}")
-        logger.info(f"Tool {self.__class__.__name__} - Request Data: {request.data}")
+        logger.debug("Tool %s - Request Data: %s", self.__class__.__name__, request.data)
         now = datetime.datetime.now().isoformat()
-        logger.info(f"TestTimeView (test-tool-status-minimal) called. Returning current time: {now}")
+        logger.info("TestTimeView (test-tool-status-minimal) called. Returning current time: %s", now)
         return Response({"currentTime": now, "status": "ok", "message": "Test endpoint for Metis tool is working!"})
 
 